@@ -1,77 +1,64 @@
-import json
+import logging
+import threading
+from datetime import datetime, timedelta
 import google.generativeai as genai
 from decouple import config
+from django.conf import settings
 
+from .backend import AgenteLLM
+from .prompt import PREFIXO_PROMPT
 
-class AgenteGemini:
+logger = logging.getLogger(__name__)
+
+
+class AgenteGemini(AgenteLLM):
     def __init__(self):
         # Usa apenas GEMINI_API_KEY do .env
         api_key = config("GEMINI_API_KEY", default=None)
         if not api_key:
             raise ValueError("Defina GEMINI_API_KEY no .env")
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel("gemini-2.0-flash")
-
-    def extrair_dados(self, texto_pdf: str):
-        # Prompt direto e restritivo para garantir saída somente em JSON
-        categorias = (
-            "PRINCIPAIS CATEGORIAS DE DESPESAS:\n"
-            "INSUMOS AGRÍCOLAS: Sementes; Fertilizantes; Defensivos Agrícolas; Corretivos.\n"
-            "MANUTENÇÃO E OPERAÇÃO: Combustíveis e Lubrificantes; Peças/Parafusos/Componentes Mecânicos; "
-            "Manutenção de Máquinas e Equipamentos; Pneus; Filtros; Correias; Ferramentas e Utensílios.\n"
-            "RECURSOS HUMANOS: Mão de Obra Temporária; Salários e Encargos.\n"
-            "SERVIÇOS OPERACIONAIS: Frete e Transporte; Colheita Terceirizada; Secagem e Armazenagem; "
-            "Pulverização e Aplicação.\n"
-            "INFRAESTRUTURA E UTILIDADES: Energia Elétrica; Arrendamento de Terras; Construções e Reformas; "
-            "Materiais de Construção.\n"
-            "ADMINISTRATIVAS: Honorários (Contábeis, Advocatícios, Agronômicos); Despesas Bancárias e Financeiras.\n"
-            "SEGUROS E PROTEÇÃO: Seguro Agrícola; Seguro de Ativos (Máquinas/Veículos); Seguro Prestamista.\n"
-            "IMPOSTOS E TAXAS: ITR; IPTU; IPVA; INCRA-CCIR.\n"
-            "INVESTIMENTOS: Aquisição de Máquinas e Implementos; Aquisição de Veículos; Aquisição de Imóveis; "
-            "Infraestrutura Rural.\n"
-        )
+        self.nome_modelo = getattr(settings, 'GEMINI_MODEL', 'gemini-2.0-flash')
+        self.usar_cache_contexto = getattr(settings, 'GEMINI_CONTEXT_CACHE', False)
+        self.ttl_cache_contexto = timedelta(seconds=getattr(settings, 'GEMINI_CONTEXT_CACHE_TTL', 3600))
+        self._lock = threading.Lock()
+        self._cache_expira_em = None
+        self.model = self._criar_modelo()
+        super().__init__()
 
-        esquema = (
-            "Retorne APENAS um JSON válido (sem markdown, sem explicações, sem texto extra) no formato EXATO:\n"
-            "{\n"
-            "  \"fornecedor\": {\"razao_social\": \"\", \"nome_fantasia\": \"\", \"cnpj\": \"\"},\n"
-            "  \"faturado\": {\"nome_completo\": \"\", \"cpf\": \"\"},\n"
-            "  \"numero_nota_fiscal\": \"\",\n"
-            "  \"data_emissao\": \"\",\n"
-            "  \"descricao_produtos\": [],\n"
-            "  \"quantidade_parcelas\": 1,\n"
-            "  \"data_vencimento\": \"\",\n"
-            "  \"valor_total\": \"\",\n"
-            "  \"classificacao_despesa\": []\n"
-            "}\n"
-            "Regras:\n"
-            "- Preencha com string vazia (\"\"), lista vazia ([]) ou número conforme o tipo quando faltar informação.\n"
-            "- \"classificacao_despesa\" deve conter UMA OU MAIS categorias principais listadas acima, escolhidas de acordo com as descrições dos produtos.\n"
-            "- Não inclua subcategorias na saída; use-as apenas como referência para escolher as categorias principais.\n"
-        )
-
-        prompt = (
-            "Você é um extrator de dados de DANFE.\n\n" +
-            categorias + "\n" + esquema + "\n" +
-            "Texto da nota a analisar:\n" + texto_pdf
-        )
-
-        try:
-            response = self.model.generate_content(prompt)
-            raw = response.text.strip()
-            
-            # Verificação de segurança e conteúdo
-            if not raw or getattr(response.prompt_feedback, 'block_reason', None):
-                return {"erro": "Resposta inválida ou bloqueada"}
-            
-            # Parse do JSON
+    def _criar_modelo(self):
+        """
+        Cria o modelo com o prefixo fixo como instrução de sistema
+        Com GEMINI_CONTEXT_CACHE, o prefixo é registrado no cache de contexto do Gemini;
+        se o backend recusar (ex.: prefixo abaixo do mínimo de tokens), segue sem cache
+        """
+        if self.usar_cache_contexto:
             try:
-                return json.loads(raw)
-            except json.JSONDecodeError:
-                start, end = raw.find("{"), raw.rfind("}")
-                if start >= 0 and end > start:
-                    return json.loads(raw[start:end+1])
-                return {"erro": "JSON inválido", "resposta_bruta": raw[:400]}
+                from google.generativeai import caching
+                cache = caching.CachedContent.create(
+                    model=self.nome_modelo,
+                    system_instruction=PREFIXO_PROMPT,
+                    ttl=self.ttl_cache_contexto,
+                )
+                # Renova um pouco antes de expirar no servidor
+                self._cache_expira_em = datetime.now() + self.ttl_cache_contexto - timedelta(minutes=1)
+                return genai.GenerativeModel.from_cached_content(cache)
+            except Exception as e:
+                logger.warning("Cache de contexto indisponível, usando prompt completo: %s", e)
+                self.usar_cache_contexto = False
+        return genai.GenerativeModel(self.nome_modelo, system_instruction=PREFIXO_PROMPT)
+
+    def _modelo_atual(self):
+        if self._cache_expira_em and datetime.now() >= self._cache_expira_em:
+            with self._lock:
+                if self._cache_expira_em and datetime.now() >= self._cache_expira_em:
+                    self._cache_expira_em = None
+                    self.model = self._criar_modelo()
+        return self.model
 
-        except Exception as e:
-            return {"erro": "Falha na consulta", "detalhes": str(e)}
\ No newline at end of file
+    async def _chamar_modelo(self, prompt: str, timeout: float) -> str:
+        response = await self._modelo_atual().generate_content_async(prompt, request_options={"timeout": timeout})
+        # Verificação de segurança: resposta bloqueada vira texto vazio
+        if getattr(response.prompt_feedback, 'block_reason', None):
+            return ""
+        return response.text
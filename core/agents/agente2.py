@@ -1,6 +1,9 @@
 import json
 from django.http import JsonResponse
+from core.cache_cadastros import buscar_classificacao, buscar_pessoa
+from core.indice_classificacoes import sugerir_classificacoes
 from core.models import Pessoas, Classificacao, MovimentoContas, MovimentoClassificacao
+from core.normalizacao import normalizar_documento
 from datetime import datetime
 
 def processar_request(request, funcao):
@@ -21,10 +24,10 @@ def formatar_documento(numero, tipo):
     return numero
 
 def validar_pessoa(dados, tipo_pessoa, tipo_documento):
-    documento = dados.get('cnpj' if tipo_documento == 'CNPJ' else 'cpf', '').replace('.', '').replace('/', '').replace('-', '')
+    documento = normalizar_documento(dados.get('cnpj' if tipo_documento == 'CNPJ' else 'cpf', ''))
     nome = dados.get('razao_social' if tipo_documento == 'CNPJ' else 'nome', '')
     
-    pessoa = Pessoas.objects.filter(tipo=tipo_pessoa, cnpj_cpf=documento).first()
+    pessoa = buscar_pessoa(tipo_pessoa, documento)
     
     if pessoa:
         doc_formatado = formatar_documento(pessoa.cnpj_cpf, tipo_documento)
@@ -42,7 +45,7 @@ def validar_pessoa(dados, tipo_pessoa, tipo_documento):
 
 def validar_classificacao(dados, tipo):
     descricao = dados.get('descricao', '')
-    classificacao = Classificacao.objects.filter(tipo=tipo, descricao__iexact=descricao).first()
+    classificacao = buscar_classificacao(tipo, descricao)
     
     if classificacao:
         mensagem = f"{tipo}\n{classificacao.descricao}\nEXISTE - ID: {classificacao.id}"
@@ -54,13 +57,13 @@ def validar_classificacao(dados, tipo):
         }
     else:
         mensagem = f"{tipo}\n{descricao}\nNÃO EXISTE"
-        return {'existe': False, 'mensagem': mensagem}
+        return {'existe': False, 'mensagem': mensagem, 'sugestoes': sugerir_classificacoes(tipo, descricao)}
 
 def criar_registro(dados, modelo, campos, tipo=None):
     try:
         if modelo == Pessoas:
             documento = dados.get('cnpj' if tipo == 'FORNECEDOR' else 'cpf', '')
-            documento_limpo = documento.replace('.', '').replace('/', '').replace('-', '')
+            documento_limpo = normalizar_documento(documento)
             dados['cnpj_cpf'] = documento_limpo
             if tipo: dados['tipo'] = tipo
         
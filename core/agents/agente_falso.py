@@ -0,0 +1,47 @@
+import asyncio
+import json
+import random
+
+from django.conf import settings
+
+from .backend import AgenteLLM
+
+# Resposta padrão no formato do esquema de extração
+RESPOSTA_PADRAO = {
+    "fornecedor": {"razao_social": "FORNECEDOR TESTE LTDA", "nome_fantasia": "FORNECEDOR TESTE", "cnpj": "11.222.333/0001-81"},
+    "faturado": {"nome_completo": "FATURADO TESTE", "cpf": "529.982.247-25"},
+    "numero_nota_fiscal": "1234",
+    "data_emissao": "15/03/2024",
+    "descricao_produtos": ["PRODUTO TESTE"],
+    "quantidade_parcelas": 1,
+    "data_vencimento": "15/04/2024",
+    "valor_total": "1.500,00",
+    "classificacao_despesa": ["INSUMOS AGRÍCOLAS"],
+}
+
+
+class AgenteFalso(AgenteLLM):
+    """
+    Backend offline para testes de carga e benchmarks (LLM_BACKEND=core.agents.agente_falso.AgenteFalso)
+    Não consulta nenhuma API: devolve um JSON fixo depois de uma latência simulada e falha
+    com a taxa configurada, passando pelo mesmo ClienteLLM do backend real
+    """
+
+    def __init__(self):
+        self.latencia = getattr(settings, 'LLM_FAKE_LATENCY_MS', 800) / 1000
+        self.variacao = getattr(settings, 'LLM_FAKE_JITTER_MS', 200) / 1000
+        self.taxa_erro = getattr(settings, 'LLM_FAKE_ERROR_RATE', 0.0)
+        arquivo_resposta = getattr(settings, 'LLM_FAKE_RESPONSE_FILE', '')
+        if arquivo_resposta:
+            with open(arquivo_resposta, encoding="utf-8") as arquivo:
+                self.resposta = arquivo.read()
+        else:
+            self.resposta = json.dumps(RESPOSTA_PADRAO, ensure_ascii=False)
+        super().__init__()
+
+    async def _chamar_modelo(self, prompt: str, timeout: float) -> str:
+        await asyncio.sleep(max(0.0, random.gauss(self.latencia, self.variacao)))
+        if random.random() < self.taxa_erro:
+            # Erro temporário: exercita as novas tentativas e o disjuntor
+            raise ConnectionError("Falha simulada do LLM")
+        return self.resposta
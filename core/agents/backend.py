@@ -0,0 +1,140 @@
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from core.metricas import LLM_LATENCIA
+from core.timing import medir
+
+from .cliente_llm import CircuitoAberto, ClienteLLM
+from .compactador import compactar_texto
+from .prompt import CAMPOS_ESQUEMA, montar_esquema
+
+logger = logging.getLogger(__name__)
+
+ERRO_BLOQUEADA = "Resposta inválida ou bloqueada"
+ERRO_JSON_INVALIDO = "JSON inválido"
+
+
+class AgenteLLM:
+    """
+    Interface dos backends de extração (selecionados por LLM_BACKEND)
+    Monta o prompt, passa a chamada pelo ClienteLLM (prazo, novas tentativas, disjuntor)
+    e interpreta o JSON; cada backend só implementa `_chamar_modelo`
+    """
+
+    def __init__(self):
+        # Orçamento de caracteres para o texto da nota dentro do prompt
+        self.limite_texto = getattr(settings, 'GEMINI_PROMPT_MAX_CHARS', 12000)
+        self.cliente = ClienteLLM(
+            self._chamar_modelo,
+            max_concorrencia=getattr(settings, 'GEMINI_MAX_CONCURRENCY', 4),
+            timeout=getattr(settings, 'GEMINI_TIMEOUT', 30.0),
+            tentativas=getattr(settings, 'GEMINI_RETRIES', 3),
+            backoff_base=getattr(settings, 'GEMINI_BACKOFF_BASE', 0.5),
+            backoff_max=getattr(settings, 'GEMINI_BACKOFF_MAX', 8.0),
+            limite_falhas=getattr(settings, 'GEMINI_CIRCUIT_FAILURES', 5),
+            tempo_aberto=getattr(settings, 'GEMINI_CIRCUIT_RESET', 30.0),
+        )
+
+    async def _chamar_modelo(self, prompt: str, timeout: float) -> str:
+        """Envia o prompt e retorna o texto bruto da resposta ("" se vazia ou bloqueada)"""
+        raise NotImplementedError
+
+    def _montar_prompt(self, texto_pdf: str, campos=None) -> str:
+        esquema = montar_esquema(tuple(campos or CAMPOS_ESQUEMA))
+
+        texto_compactado, estatisticas = compactar_texto(texto_pdf, self.limite_texto)
+        logger.info(
+            "Prompt compactado: %(caracteres_antes)d -> %(caracteres_depois)d caracteres "
+            "(~%(tokens_estimados_antes)d -> ~%(tokens_estimados_depois)d tokens, truncado=%(truncado)s)",
+            estatisticas,
+        )
+
+        return esquema + "\n" + "Texto da nota a analisar:\n" + texto_compactado
+
+    def _interpretar_resposta(self, raw: str):
+        raw = (raw or "").strip()
+
+        # Verificação de segurança e conteúdo
+        if not raw:
+            return {"erro": ERRO_BLOQUEADA}
+
+        # Parse do JSON
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError:
+            start, end = raw.find("{"), raw.rfind("}")
+            if start >= 0 and end > start:
+                try:
+                    return json.loads(raw[start:end+1])
+                except json.JSONDecodeError:
+                    pass
+            return {"erro": ERRO_JSON_INVALIDO, "resposta_bruta": raw[:400]}
+
+    def extrair_dados(self, texto_pdf: str, campos=None):
+        """
+        Consulta o LLM pelos campos do esquema
+        Com `campos`, pede apenas os campos informados (os demais já foram resolvidos localmente)
+        """
+        try:
+            with medir('llm_prompt'):
+                prompt = self._montar_prompt(texto_pdf, campos)
+            with medir('llm_chamada'), LLM_LATENCIA.time():
+                raw = self.cliente.gerar_sync(prompt)
+            with medir('llm_json'):
+                return self._interpretar_resposta(raw)
+        except CircuitoAberto as e:
+            return {"erro": "Serviço de IA indisponível", "detalhes": str(e)}
+        except Exception as e:
+            return {"erro": "Falha na consulta", "detalhes": str(e)}
+
+    async def extrair_dados_async(self, texto_pdf: str, campos=None):
+        """Versão asyncio de extrair_dados"""
+        try:
+            with medir('llm_prompt'):
+                prompt = self._montar_prompt(texto_pdf, campos)
+            with medir('llm_chamada'), LLM_LATENCIA.time():
+                raw = await self.cliente.gerar(prompt)
+            with medir('llm_json'):
+                return self._interpretar_resposta(raw)
+        except CircuitoAberto as e:
+            return {"erro": "Serviço de IA indisponível", "detalhes": str(e)}
+        except Exception as e:
+            return {"erro": "Falha na consulta", "detalhes": str(e)}
+
+
+def resultado_extracao(dados) -> str:
+    """Classifica o retorno de extrair_dados: ok, bloqueada, json_invalido ou erro_llm"""
+    erro = dados.get("erro")
+    if not erro:
+        return "ok"
+    if erro == ERRO_BLOQUEADA:
+        return "bloqueada"
+    if erro == ERRO_JSON_INVALIDO:
+        return "json_invalido"
+    return "erro_llm"
+
+
+_agente = None
+_agente_lock = threading.Lock()
+
+
+def obter_agente() -> AgenteLLM:
+    """Instância única do backend configurado em LLM_BACKEND, por processo"""
+    global _agente
+    if _agente is None:
+        with _agente_lock:
+            if _agente is None:
+                classe = import_string(getattr(settings, 'LLM_BACKEND', 'core.agents.agent_1.AgenteGemini'))
+                _agente = classe()
+    return _agente
+
+
+def redefinir_agente():
+    """Descarta a instância atual; a próxima chamada a obter_agente relê LLM_BACKEND"""
+    global _agente
+    with _agente_lock:
+        _agente = None
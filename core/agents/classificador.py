@@ -0,0 +1,226 @@
+import logging
+import os
+import re
+import tempfile
+import threading
+import zlib
+from itertools import groupby
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from core.agents.compactador import linhas_da_secao
+from core.models import MovimentoClassificacao
+from core.normalizacao import sem_acentos
+
+logger = logging.getLogger(__name__)
+
+# Espaço dos n-gramas de caracteres (hashing): o vocabulário não cresce com o retreino incremental
+DIMENSAO = 2 ** 15
+NGRAMAS = (3, 4, 5)
+# Texto considerado por documento (o início da DANFE traz emitente e primeiros itens)
+MAX_CARACTERES = 20000
+# Categorias com pontuação próxima da melhor também são devolvidas (notas com várias classificações)
+MARGEM_RELATIVA = 0.85
+# Colunas numéricas das linhas de item da DANFE (código, quantidade, valores)
+RE_TOKEN_NUMERICO = re.compile(r"^[\d.,/%-]+$")
+
+
+def vetorizar(texto: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Vetor esparso (índices, pesos) dos n-gramas de caracteres do texto, com norma 1"""
+    texto = re.sub(r"\d", "0", sem_acentos(texto[:MAX_CARACTERES]))
+    texto = " " + " ".join(texto.split()) + " "
+    contagens: Dict[int, int] = {}
+    for n in NGRAMAS:
+        for i in range(len(texto) - n + 1):
+            indice = zlib.crc32(texto[i:i + n].encode()) % DIMENSAO
+            contagens[indice] = contagens.get(indice, 0) + 1
+    indices = np.fromiter(contagens.keys(), dtype=np.int64, count=len(contagens))
+    pesos = 1 + np.log(np.fromiter(contagens.values(), dtype=np.float32, count=len(contagens)))
+    norma = np.linalg.norm(pesos)
+    return indices, (pesos / norma if norma else pesos)
+
+
+def texto_classificacao(fornecedor: str, produtos: Iterable[str]) -> str:
+    """
+    Texto que o classificador vê, no treino e na classificação: razão social do emitente
+    e um produto por linha (o mesmo que fica no lançamento)
+    """
+    return "\n".join([fornecedor or "", *produtos])
+
+
+def texto_classificacao_danfe(texto: str, dados_regras: Dict) -> str:
+    """
+    texto_classificacao a partir da DANFE: emitente das regras e descrições do quadro de itens,
+    sem as colunas numéricas e sem repetir produtos (como na descricao_produtos do lançamento)
+    """
+    produtos = (
+        " ".join(token for token in linha.split() if not RE_TOKEN_NUMERICO.match(token))
+        for linha in linhas_da_secao(texto, 'itens')
+    )
+    fornecedor = (dados_regras.get('fornecedor') or {}).get('razao_social', '')
+    return texto_classificacao(fornecedor, dict.fromkeys(produto for produto in produtos if produto))
+
+
+class ClassificadorDespesa:
+    """
+    Classificador local de classificacao_despesa por centróides TF-IDF de n-gramas de caracteres
+    Cada categoria guarda a soma dos vetores dos documentos lançados com ela, o que permite
+    treinar de forma incremental; a pontuação de todas as categorias é uma única multiplicação
+    """
+
+    def __init__(self, categorias=None, somas=None, frequencias=None, documentos=0, ultimo_movimento=0):
+        self.categorias: List[str] = list(categorias or [])
+        self.somas = somas if somas is not None else np.zeros((0, DIMENSAO), dtype=np.float32)
+        self.frequencias = frequencias if frequencias is not None else np.zeros(DIMENSAO, dtype=np.float32)
+        self.documentos = int(documentos)
+        self.ultimo_movimento = int(ultimo_movimento)
+        self._centroides = None
+        self._idf = None
+
+    @classmethod
+    def carregar(cls, caminho: str) -> 'ClassificadorDespesa':
+        with np.load(caminho) as arquivo:
+            return cls(
+                categorias=arquivo['categorias'].tolist(),
+                somas=arquivo['somas'],
+                frequencias=arquivo['frequencias'],
+                documentos=arquivo['documentos'],
+                ultimo_movimento=arquivo['ultimo_movimento'],
+            )
+
+    def salvar(self, caminho: str):
+        # Grava em um temporário e troca de uma vez: workers nunca leem um arquivo pela metade
+        diretorio = os.path.dirname(caminho) or '.'
+        os.makedirs(diretorio, exist_ok=True)
+        descritor, temporario = tempfile.mkstemp(dir=diretorio, suffix='.npz')
+        with os.fdopen(descritor, 'wb') as arquivo:
+            np.savez_compressed(
+                arquivo,
+                categorias=np.array(self.categorias, dtype=str),
+                somas=self.somas,
+                frequencias=self.frequencias,
+                documentos=self.documentos,
+                ultimo_movimento=self.ultimo_movimento,
+            )
+        os.replace(temporario, caminho)
+
+    def treinar(self, exemplos: Iterable[Tuple[int, str, List[str]]]) -> int:
+        """Acrescenta exemplos (id do movimento, texto, categorias) ao modelo; retorna quantos foram usados"""
+        linhas = {categoria: i for i, categoria in enumerate(self.categorias)}
+        novas: List[np.ndarray] = []
+        usados = 0
+        for movimento_id, texto, categorias in exemplos:
+            indices, pesos = vetorizar(texto)
+            if not len(indices):
+                continue
+            self.frequencias[indices] += 1
+            self.documentos += 1
+            self.ultimo_movimento = max(self.ultimo_movimento, movimento_id)
+            usados += 1
+            for categoria in categorias:
+                if categoria not in linhas:
+                    linhas[categoria] = len(self.categorias)
+                    self.categorias.append(categoria)
+                    novas.append(np.zeros(DIMENSAO, dtype=np.float32))
+                linha = linhas[categoria]
+                if linha < len(self.somas):
+                    self.somas[linha, indices] += pesos
+                else:
+                    novas[linha - len(self.somas)][indices] += pesos
+        if novas:
+            self.somas = np.vstack([self.somas, np.stack(novas)])
+        self._centroides = None
+        return usados
+
+    def _preparar(self):
+        if self._centroides is None:
+            self._idf = (np.log((1 + self.documentos) / (1 + self.frequencias)) + 1).astype(np.float32)
+            centroides = self.somas * self._idf
+            normas = np.linalg.norm(centroides, axis=1, keepdims=True)
+            normas[normas == 0] = 1
+            self._centroides = centroides / normas
+        return self._centroides, self._idf
+
+    def pontuar(self, texto: str) -> Dict[str, float]:
+        """Similaridade (cosseno) do documento com cada categoria"""
+        if not self.categorias:
+            return {}
+        centroides, idf = self._preparar()
+        indices, pesos = vetorizar(texto)
+        if not len(indices):
+            return {}
+        vetor = pesos * idf[indices]
+        vetor /= np.linalg.norm(vetor)
+        pontuacoes = centroides[:, indices] @ vetor
+        return dict(zip(self.categorias, pontuacoes.tolist()))
+
+    def classificar(self, texto: str, limiar: float) -> List[str]:
+        """Categorias do documento, ou lista vazia se a melhor pontuação ficar abaixo do limiar"""
+        pontuacoes = self.pontuar(texto)
+        if not pontuacoes:
+            return []
+        melhor = max(pontuacoes.values())
+        if melhor < limiar:
+            return []
+        corte = max(limiar, melhor * MARGEM_RELATIVA)
+        return [c for c, p in sorted(pontuacoes.items(), key=lambda item: -item[1]) if p >= corte]
+
+
+def exemplos_lancados(desde_movimento: int = 0) -> Iterator[Tuple[int, str, List[str]]]:
+    """
+    Exemplos de treino a partir dos lançamentos: fornecedor e produtos do movimento
+    com as classificações de despesa que receberam (uma única consulta, lida em streaming)
+    """
+    linhas = (
+        MovimentoClassificacao.objects
+        .filter(movimento_id__gt=desde_movimento, classificacao__tipo='DESPESA')
+        .exclude(movimento__descricao_produtos='')
+        .order_by('movimento_id')
+        .values_list('movimento_id', 'movimento__pessoa__razao_social', 'movimento__descricao_produtos', 'classificacao__descricao')
+        .iterator()
+    )
+    for movimento_id, grupo in groupby(linhas, key=lambda linha: linha[0]):
+        grupo = list(grupo)
+        _, fornecedor, produtos, _ = grupo[0]
+        yield movimento_id, texto_classificacao(fornecedor, produtos.splitlines()), sorted({linha[3] for linha in grupo})
+
+
+_classificador: Optional[ClassificadorDespesa] = None
+_versao_carregada = None
+_classificador_lock = threading.Lock()
+
+
+def obter_classificador() -> Optional[ClassificadorDespesa]:
+    """
+    Modelo salvo em CLASSIFICADOR_MODELO_PATH, carregado uma vez por processo
+    (e de novo só quando o comando de treino grava uma versão nova)
+    """
+    global _classificador, _versao_carregada
+    caminho = str(getattr(settings, 'CLASSIFICADOR_MODELO_PATH', ''))
+    try:
+        versao = os.stat(caminho).st_mtime_ns
+    except OSError:
+        return None
+    if versao != _versao_carregada:
+        with _classificador_lock:
+            if versao != _versao_carregada:
+                try:
+                    _classificador = ClassificadorDespesa.carregar(caminho)
+                except Exception as e:
+                    logger.warning("Classificador local indisponível: %s", e)
+                    _classificador = None
+                _versao_carregada = versao
+    return _classificador
+
+
+def classificar_despesa(texto: str) -> List[str]:
+    """
+    Classificação local da despesa a partir de texto_classificacao; lista vazia quando não há modelo treinado com exemplos
+    suficientes ou a confiança é baixa (nesse caso o campo fica para o LLM)
+    """
+    classificador = obter_classificador()
+    if classificador is None or classificador.documentos < getattr(settings, 'CLASSIFICADOR_MIN_DOCUMENTOS', 20):
+        return []
+    return classificador.classificar(texto, getattr(settings, 'CLASSIFICADOR_CONFIANCA_MIN', 0.35))
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from core.metricas import LLM_EM_ANDAMENTO, registrar_llm
+
+logger = logging.getLogger(__name__)
+
+try:
+    from google.api_core import exceptions as google_exceptions
+    ERROS_TEMPORARIOS = (
+        google_exceptions.TooManyRequests,
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.InternalServerError,
+        google_exceptions.DeadlineExceeded,
+    )
+except ImportError:
+    ERROS_TEMPORARIOS = ()
+
+ERROS_TEMPORARIOS = ERROS_TEMPORARIOS + (asyncio.TimeoutError, ConnectionError)
+
+
+class ErroLLM(Exception):
+    """Falha na consulta ao LLM depois de esgotadas as tentativas"""
+
+
+class CircuitoAberto(ErroLLM):
+    """O backend está instável: a chamada foi recusada sem consultar o LLM"""
+
+
+class Circuito:
+    """
+    Disjuntor simples: abre após `limite_falhas` falhas seguidas e recusa chamadas
+    por `tempo_aberto` segundos; depois libera uma chamada de teste (meio aberto)
+    """
+
+    def __init__(self, limite_falhas: int, tempo_aberto: float):
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+        self.falhas_seguidas = 0
+        self.aberto_ate = 0.0
+        self.teste_em_andamento = False
+
+    @property
+    def estado(self) -> str:
+        if self.falhas_seguidas < self.limite_falhas:
+            return 'fechado'
+        return 'aberto' if time.monotonic() < self.aberto_ate else 'meio_aberto'
+
+    def permitir(self) -> bool:
+        estado = self.estado
+        if estado == 'fechado':
+            return True
+        if estado == 'meio_aberto' and not self.teste_em_andamento:
+            self.teste_em_andamento = True
+            return True
+        return False
+
+    def registrar_sucesso(self):
+        self.falhas_seguidas = 0
+        self.teste_em_andamento = False
+
+    def registrar_falha(self):
+        self.falhas_seguidas += 1
+        self.teste_em_andamento = False
+        if self.falhas_seguidas >= self.limite_falhas:
+            self.aberto_ate = time.monotonic() + self.tempo_aberto
+
+
+class ClienteLLM:
+    """
+    Camada de chamadas ao LLM com prazo por tentativa, limite global de concorrência,
+    novas tentativas com backoff exponencial e jitter, e disjuntor
+
+    Todas as chamadas rodam em um único event loop por processo (thread em segundo plano),
+    assim o semáforo vale para todas as threads do worker. `gerar` é a API asyncio e
+    `gerar_sync` a versão bloqueante usada pelas views
+    """
+
+    def __init__(
+        self,
+        chamada: Callable[[str, float], Awaitable[Any]],
+        max_concorrencia: int = 4,
+        timeout: float = 30.0,
+        tentativas: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        limite_falhas: int = 5,
+        tempo_aberto: float = 30.0,
+    ):
+        self.chamada = chamada
+        self.max_concorrencia = max_concorrencia
+        self.timeout = timeout
+        self.tentativas = tentativas
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.circuito = Circuito(limite_falhas, tempo_aberto)
+        self._contadores = {
+            'em_andamento': 0,
+            'sucessos': 0,
+            'falhas': 0,
+            'novas_tentativas': 0,
+            'tempo_esgotado': 0,
+            'recusadas_circuito': 0,
+        }
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pid: Optional[int] = None
+        self._semaforo: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+
+    def _obter_loop(self) -> asyncio.AbstractEventLoop:
+        # Após o fork do gunicorn a thread do loop não existe no filho: recria por PID
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='cliente-llm', daemon=True).start()
+                self._loop, self._pid = loop, os.getpid()
+                self._semaforo = None
+            return self._loop
+
+    def _contar(self, resultado: str):
+        # Contadores do processo (contadores()) e série do Prometheus com o mesmo nome
+        self._contadores[resultado] += 1
+        registrar_llm(resultado)
+
+    def contadores(self) -> Dict[str, Any]:
+        return {**self._contadores, 'circuito': self.circuito.estado}
+
+    async def gerar(self, prompt: str) -> Any:
+        loop = self._obter_loop()
+        try:
+            atual = asyncio.get_running_loop()
+        except RuntimeError:
+            atual = None
+        if atual is loop:
+            return await self._gerar(prompt)
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._gerar(prompt), loop))
+
+    def gerar_sync(self, prompt: str) -> Any:
+        loop = self._obter_loop()
+        return asyncio.run_coroutine_threadsafe(self._gerar(prompt), loop).result()
+
+    def _espera(self, tentativa: int) -> float:
+        # Backoff exponencial com "full jitter"
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** tentativa)))
+
+    async def _gerar(self, prompt: str) -> Any:
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.max_concorrencia)
+
+        ultimo_erro: Optional[BaseException] = None
+        for tentativa in range(self.tentativas):
+            if not self.circuito.permitir():
+                self._contar('recusadas_circuito')
+                raise CircuitoAberto("Serviço de LLM instável; consulta recusada temporariamente")
+
+            async with self._semaforo:
+                self._contadores['em_andamento'] += 1
+                LLM_EM_ANDAMENTO.inc()
+                try:
+                    resposta = await asyncio.wait_for(self.chamada(prompt, self.timeout), self.timeout)
+                except ERROS_TEMPORARIOS as e:
+                    ultimo_erro = e
+                    if isinstance(e, asyncio.TimeoutError):
+                        self._contar('tempo_esgotado')
+                    self.circuito.registrar_falha()
+                except Exception:
+                    # Erros definitivos (ex.: requisição inválida) não são repetidos
+                    self._contar('falhas')
+                    self.circuito.registrar_falha()
+                    raise
+                else:
+                    self._contar('sucessos')
+                    self.circuito.registrar_sucesso()
+                    return resposta
+                finally:
+                    self._contadores['em_andamento'] -= 1
+                    LLM_EM_ANDAMENTO.dec()
+
+            if tentativa + 1 < self.tentativas:
+                self._contar('novas_tentativas')
+                espera = self._espera(tentativa)
+                logger.warning("Consulta ao LLM falhou (%s); nova tentativa em %.2fs", ultimo_erro, espera)
+                await asyncio.sleep(espera)
+
+        self._contar('falhas')
+        raise ErroLLM(f"Consulta ao LLM falhou após {self.tentativas} tentativa(s): {ultimo_erro!r}")
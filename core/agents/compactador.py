@@ -0,0 +1,123 @@
+import re
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Tuple
+
+from core.normalizacao import sem_acentos
+from core.paginas_pdf import SEPARADOR_PAGINA
+
+# Rótulos que abrem cada quadro da DANFE e a seção a que pertencem
+SECOES = (
+    ('DADOS ADICIONAIS', 'descartar'),
+    ('RESERVADO AO FISCO', 'descartar'),
+    ('INFORMACOES COMPLEMENTARES', 'descartar'),
+    ('DADOS DO PRODUTO', 'itens'),
+    ('DADOS DOS PRODUTOS', 'itens'),
+    ('CALCULO DO IMPOSTO', 'totais'),
+    ('FATURA', 'totais'),
+    ('DUPLICATA', 'totais'),
+    ('TRANSPORTADOR', 'outros'),
+    ('CALCULO DO ISSQN', 'outros'),
+    ('DESTINATARIO', 'cabecalho'),
+)
+
+# Ordem em que as seções entram no orçamento de caracteres
+PRIORIDADE = ('cabecalho', 'totais', 'itens', 'outros')
+
+# Linhas de rodapé legal que não ajudam a extração
+BOILERPLATE = (
+    'CONSULTA DE AUTENTICIDADE',
+    'WWW.NFE.FAZENDA.GOV.BR',
+    'DOCUMENTO AUXILIAR DA NOTA FISCAL',
+    'DECLARO QUE RECEBI',
+)
+
+RE_ESPACOS = re.compile(r'[ \t ]+')
+
+
+def _secao_da_linha(chave: str, atual: str) -> str:
+    for rotulo, secao in SECOES:
+        if chave.startswith(rotulo):
+            return secao
+    return atual
+
+
+def _linhas_por_pagina(texto: str) -> List[List[str]]:
+    paginas = []
+    for pagina in texto.split(SEPARADOR_PAGINA):
+        linhas = (RE_ESPACOS.sub(' ', linha).strip() for linha in pagina.splitlines())
+        paginas.append([linha for linha in linhas if linha])
+    return paginas
+
+
+def _percorrer_secoes(paginas: List[List[Tuple[str, str]]]) -> Iterator[Tuple[str, str, str]]:
+    """(linha, chave sem acentos, seção) de cada linha fora dos quadros descartados"""
+    secao = retomar = 'cabecalho'
+    for pagina in paginas:
+        for linha, chave in pagina:
+            if secao != 'descartar':
+                retomar = secao
+            secao = _secao_da_linha(chave, secao)
+            if secao != 'descartar':
+                yield linha, chave, secao
+        # Quadros descartados (dados adicionais, reservado ao fisco) ficam no pé da página:
+        # a página seguinte volta à seção anterior a eles
+        if secao == 'descartar':
+            secao = retomar
+
+
+def linhas_da_secao(texto: str, nome: str) -> List[str]:
+    """Linhas de uma seção da DANFE (ex.: 'itens'), sem as linhas de rótulo que abrem o quadro"""
+    paginas = [[(linha, sem_acentos(linha)) for linha in linhas] for linhas in _linhas_por_pagina(texto)]
+    return [
+        linha for linha, chave, secao in _percorrer_secoes(paginas)
+        if secao == nome and not any(chave.startswith(rotulo) for rotulo, _ in SECOES)
+    ]
+
+
+def compactar_texto(texto: str, limite: int) -> Tuple[str, Dict[str, Any]]:
+    """
+    Reduz o texto da DANFE antes de enviá-lo ao Gemini
+    Colapsa espaços, remove o cabeçalho/rodapé repetido em cada página e os quadros de
+    boilerplate, e respeita o limite de caracteres cortando primeiro as seções menos importantes
+    Retorna o texto compactado e as estatísticas antes/depois
+    """
+    paginas = [[(linha, sem_acentos(linha)) for linha in linhas] for linhas in _linhas_por_pagina(texto)]
+    # Em quantas páginas cada linha aparece: só o que se repete entre páginas é cabeçalho/rodapé;
+    # linhas iguais na mesma página (itens, linhas de valores zerados dos totais) são mantidas
+    paginas_da_linha = Counter(chave for pagina in paginas for chave in {chave for _, chave in pagina})
+
+    vistas = set()
+    por_secao: Dict[str, List[Tuple[int, str]]] = {nome: [] for nome in PRIORIDADE}
+    for posicao, (linha, chave, secao) in enumerate(_percorrer_secoes(paginas)):
+        if any(marca in chave for marca in BOILERPLATE):
+            continue
+        # Cabeçalho/rodapé repetido em várias páginas fica só na primeira ocorrência
+        if paginas_da_linha[chave] > 1 and chave in vistas:
+            continue
+        vistas.add(chave)
+        por_secao[secao].append((posicao, linha))
+
+    restante = limite
+    selecionadas: List[Tuple[int, str]] = []
+    truncado = False
+    for nome in PRIORIDADE:
+        for posicao, linha in por_secao[nome]:
+            custo = len(linha) + 1
+            if custo > restante:
+                truncado = True
+                break
+            selecionadas.append((posicao, linha))
+            restante -= custo
+
+    compactado = '\n'.join(linha for _, linha in sorted(selecionadas))
+    estatisticas = {
+        'caracteres_antes': len(texto),
+        'caracteres_depois': len(compactado),
+        'linhas_antes': len(texto.splitlines()),
+        'linhas_depois': len(selecionadas),
+        # Estimativa grosseira de ~4 caracteres por token
+        'tokens_estimados_antes': len(texto) // 4,
+        'tokens_estimados_depois': len(compactado) // 4,
+        'truncado': truncado,
+    }
+    return compactado, estatisticas
@@ -0,0 +1,190 @@
+import re
+from typing import Any, Dict, List, Optional
+
+RE_CHAVE = re.compile(r"(?<!\d)((?:\d{4}[ .]?){10}\d{4})(?!\d)")
+RE_CNPJ = re.compile(r"(?<!\d)(\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})(?!\d)")
+RE_CPF = re.compile(r"(?<!\d)(\d{3}\.\d{3}\.\d{3}-\d{2})(?!\d)")
+RE_DATA = re.compile(r"(?<!\d)(\d{2}/\d{2}/\d{4})(?!\d)")
+RE_VALOR = re.compile(r"(?<![\d,.])(\d{1,3}(?:\.\d{3})*,\d{2})(?![\d,])")
+RE_NUMERO_NF = re.compile(r"\bN[º°o]\.?\s*:?\s*(\d{1,3}(?:\.?\d{3})*)(?!\d)", re.IGNORECASE)
+RE_SERIE = re.compile(r"\bS[ÉE]RIE\s*:?\s*(\d{1,3})(?!\d)", re.IGNORECASE)
+# O "Nº" só vale como número da nota perto de NF-e / NOTA FISCAL / DANFE ou seguido da série
+RE_CONTEXTO_NF = re.compile(r"\bNF-?E?\b|NOTA\s+FISCAL|\bDANFE\b", re.IGNORECASE)
+RE_RECEBEMOS = re.compile(r"RECEBEMOS\s+DE\s+(.+?)\s+OS\s+PRODUTOS", re.IGNORECASE | re.DOTALL)
+RE_DATA_EMISSAO = re.compile(r"DATA\s+D[AE]\s+EMISS[ÃA]O", re.IGNORECASE)
+RE_VALOR_TOTAL = re.compile(r"VALOR\s+TOTAL\s+DA\s+NOTA", re.IGNORECASE)
+# Início de cada coluna do quadro de cálculo do imposto ("VALOR DO FRETE", "V. TOT. TRIB.", "DESCONTO"...):
+# os rótulos dividem a mesma linha e os valores vêm na linha de baixo, na mesma ordem
+RE_ROTULO_COLUNA = re.compile(r"(?<![\w.])(?:VALOR|VLR\.?|V\.|BASE|DESCONTO|OUTRAS)(?![\w])", re.IGNORECASE)
+
+
+def somente_digitos(valor: str) -> str:
+    return re.sub(r"\D", "", valor or "")
+
+
+def _digito_mod11(numeros: str, pesos: List[int]) -> int:
+    resto = sum(int(n) * p for n, p in zip(numeros, pesos)) % 11
+    return 0 if resto < 2 else 11 - resto
+
+
+def validar_cnpj(cnpj: str) -> bool:
+    cnpj = somente_digitos(cnpj)
+    if len(cnpj) != 14 or cnpj == cnpj[0] * 14:
+        return False
+    pesos = [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+    d1 = _digito_mod11(cnpj[:12], pesos)
+    d2 = _digito_mod11(cnpj[:13], [6] + pesos)
+    return cnpj[12:] == f"{d1}{d2}"
+
+
+def validar_cpf(cpf: str) -> bool:
+    cpf = somente_digitos(cpf)
+    if len(cpf) != 11 or cpf == cpf[0] * 11:
+        return False
+    d1 = _digito_mod11(cpf[:9], list(range(10, 1, -1)))
+    d2 = _digito_mod11(cpf[:10], list(range(11, 1, -1)))
+    return cpf[9:] == f"{d1}{d2}"
+
+
+def validar_chave_acesso(chave: str) -> bool:
+    chave = somente_digitos(chave)
+    if len(chave) != 44:
+        return False
+    # Pesos 2..9 aplicados da direita para a esquerda sobre os 43 primeiros dígitos
+    pesos = [2 + (i % 8) for i in range(43)][::-1]
+    resto = sum(int(n) * p for n, p in zip(chave[:43], pesos)) % 11
+    dv = 0 if resto < 2 else 11 - resto
+    return int(chave[43]) == dv
+
+
+def formatar_cnpj(cnpj: str) -> str:
+    return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}"
+
+
+def formatar_cpf(cpf: str) -> str:
+    return f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}"
+
+
+class ExtratorRegras:
+    """
+    Extrator determinístico dos campos de formato fixo da DANFE
+    (chave de acesso, CNPJ, CPF, número/série, data de emissão e valor total)
+    Só devolve valores conferidos: documentos passam pelos dígitos verificadores
+    """
+
+    def extrair(self, texto: str) -> Dict[str, Any]:
+        dados: Dict[str, Any] = {}
+        chave = self._chave_acesso(texto)
+        if chave:
+            dados["chave_acesso"] = chave
+
+        fornecedor = self._fornecedor(texto, chave)
+        if fornecedor:
+            dados["fornecedor"] = fornecedor
+
+        faturado = self._faturado(texto)
+        if faturado:
+            dados["faturado"] = faturado
+
+        numero, serie = self._numero_serie(texto, chave)
+        if numero:
+            dados["numero_nota_fiscal"] = numero
+        if serie:
+            dados["serie"] = serie
+
+        data_emissao = self._valor_apos_rotulo(texto, RE_DATA_EMISSAO, RE_DATA)
+        if data_emissao:
+            dados["data_emissao"] = data_emissao
+
+        valor_total = self._valor_na_coluna(texto, RE_VALOR_TOTAL)
+        if valor_total:
+            dados["valor_total"] = valor_total
+        return dados
+
+    def _chave_acesso(self, texto: str) -> Optional[str]:
+        for match in RE_CHAVE.finditer(texto):
+            chave = somente_digitos(match.group(1))
+            if validar_chave_acesso(chave):
+                return chave
+        return None
+
+    def _fornecedor(self, texto: str, chave: Optional[str]) -> Optional[Dict[str, str]]:
+        # Na chave de acesso, as posições 7 a 20 são o CNPJ do emitente
+        cnpj = chave[6:20] if chave and validar_cnpj(chave[6:20]) else None
+        if not cnpj:
+            cnpj = next((somente_digitos(m) for m in RE_CNPJ.findall(texto) if validar_cnpj(m)), None)
+
+        recebemos = RE_RECEBEMOS.search(texto)
+        razao_social = " ".join(recebemos.group(1).split()) if recebemos else ""
+        if not cnpj or not razao_social:
+            return None
+        return {"razao_social": razao_social, "nome_fantasia": "", "cnpj": formatar_cnpj(cnpj)}
+
+    def _faturado(self, texto: str) -> Optional[Dict[str, str]]:
+        for linha in texto.splitlines():
+            match = RE_CPF.search(linha)
+            if match and validar_cpf(match.group(1)):
+                # No quadro do destinatário o nome vem na mesma linha, antes do CPF
+                nome = linha[:match.start()].strip(" -:")
+                if nome and not any(c.isdigit() for c in nome):
+                    return {"nome_completo": nome, "cpf": match.group(1)}
+        return None
+
+    def _numero_serie(self, texto: str, chave: Optional[str]):
+        if chave:
+            # Série nas posições 23-25 e número da NF nas posições 26-34
+            return str(int(chave[25:34])), str(int(chave[22:25]))
+        numero = next((m for m in RE_NUMERO_NF.finditer(texto) if self._contexto_nf(texto, m)), None)
+        serie = RE_SERIE.search(texto)
+        return (
+            str(int(somente_digitos(numero.group(1)))) if numero else None,
+            str(int(serie.group(1))) if serie else None,
+        )
+
+    def _contexto_nf(self, texto: str, match: re.Match) -> bool:
+        antes = texto[max(0, match.start() - 100):match.start()]
+        depois = texto[match.end():match.end() + 30]
+        return bool(RE_CONTEXTO_NF.search(antes) or RE_SERIE.match(depois.lstrip(" -/")))
+
+    def _valor_apos_rotulo(self, texto: str, rotulo: re.Pattern, padrao: re.Pattern, alcance: int = 200) -> Optional[str]:
+        """Procura o primeiro valor no formato esperado logo depois do rótulo do campo"""
+        match = rotulo.search(texto)
+        if not match:
+            return None
+        valor = padrao.search(texto, match.end(), match.end() + alcance)
+        return valor.group(1) if valor else None
+
+    def _valor_na_coluna(self, texto: str, rotulo: re.Pattern) -> Optional[str]:
+        """
+        Valor de um rótulo do quadro de totais, casado pela coluna: na DANFE vários rótulos
+        dividem a linha e os valores vêm na linha seguinte, na mesma ordem. Se a quantidade
+        de valores não bate com a de rótulos, devolve None e o campo fica para o LLM
+        """
+        linhas = texto.splitlines()
+        for i, linha in enumerate(linhas):
+            match = rotulo.search(linha)
+            if not match:
+                continue
+            inicios = [m.start() for m in RE_ROTULO_COLUNA.finditer(linha)]
+            coluna = sum(1 for inicio in inicios if inicio < match.start())
+            # Valor na própria linha, antes do próximo rótulo ("VALOR TOTAL DA NOTA: 1.535,00")
+            proximo = next((inicio for inicio in inicios if inicio >= match.end()), len(linha))
+            valor = RE_VALOR.search(linha, match.end(), proximo)
+            if valor:
+                return valor.group(1)
+            if RE_VALOR.search(linha):
+                return None  # rótulos e valores misturados na linha: coluna ambígua
+            for seguinte in linhas[i + 1:i + 3]:
+                valores = RE_VALOR.findall(seguinte)
+                if not valores:
+                    continue
+                if len(valores) == len(inicios) and not re.search(r"[^\W\d_]", seguinte):
+                    return valores[coluna]
+                return None
+            return None
+        return None
+
+
+def campos_pendentes(dados_regras: Dict[str, Any], campos: List[str]) -> List[str]:
+    """Campos que ainda precisam do Gemini; classificação e produtos sempre dependem dele"""
+    return [campo for campo in campos if campo not in dados_regras]
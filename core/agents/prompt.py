@@ -0,0 +1,52 @@
+from functools import lru_cache
+
+# Campos do JSON de saída e o formato esperado de cada um
+CAMPOS_ESQUEMA = {
+    "fornecedor": "{\"razao_social\": \"\", \"nome_fantasia\": \"\", \"cnpj\": \"\"}",
+    "faturado": "{\"nome_completo\": \"\", \"cpf\": \"\"}",
+    "numero_nota_fiscal": "\"\"",
+    "data_emissao": "\"\"",
+    "descricao_produtos": "[]",
+    "quantidade_parcelas": "1",
+    "data_vencimento": "\"\"",
+    "valor_total": "\"\"",
+    "classificacao_despesa": "[]",
+}
+
+CATEGORIAS = (
+    "PRINCIPAIS CATEGORIAS DE DESPESAS:\n"
+    "INSUMOS AGRÍCOLAS: Sementes; Fertilizantes; Defensivos Agrícolas; Corretivos.\n"
+    "MANUTENÇÃO E OPERAÇÃO: Combustíveis e Lubrificantes; Peças/Parafusos/Componentes Mecânicos; "
+    "Manutenção de Máquinas e Equipamentos; Pneus; Filtros; Correias; Ferramentas e Utensílios.\n"
+    "RECURSOS HUMANOS: Mão de Obra Temporária; Salários e Encargos.\n"
+    "SERVIÇOS OPERACIONAIS: Frete e Transporte; Colheita Terceirizada; Secagem e Armazenagem; "
+    "Pulverização e Aplicação.\n"
+    "INFRAESTRUTURA E UTILIDADES: Energia Elétrica; Arrendamento de Terras; Construções e Reformas; "
+    "Materiais de Construção.\n"
+    "ADMINISTRATIVAS: Honorários (Contábeis, Advocatícios, Agronômicos); Despesas Bancárias e Financeiras.\n"
+    "SEGUROS E PROTEÇÃO: Seguro Agrícola; Seguro de Ativos (Máquinas/Veículos); Seguro Prestamista.\n"
+    "IMPOSTOS E TAXAS: ITR; IPTU; IPVA; INCRA-CCIR.\n"
+    "INVESTIMENTOS: Aquisição de Máquinas e Implementos; Aquisição de Veículos; Aquisição de Imóveis; "
+    "Infraestrutura Rural.\n"
+)
+
+# Parte fixa do prompt, igual para todos os documentos: enviada como instrução de sistema
+PREFIXO_PROMPT = "Você é um extrator de dados de DANFE.\n\n" + CATEGORIAS
+
+
+@lru_cache(maxsize=64)
+def montar_esquema(campos: tuple) -> str:
+    # Prompt direto e restritivo para garantir saída somente em JSON
+    linhas_campos = ",\n".join(f"  \"{campo}\": {CAMPOS_ESQUEMA[campo]}" for campo in campos)
+    esquema = (
+        "Retorne APENAS um JSON válido (sem markdown, sem explicações, sem texto extra) no formato EXATO:\n"
+        "{\n" + linhas_campos + "\n}\n"
+        "Regras:\n"
+        "- Preencha com string vazia (\"\"), lista vazia ([]) ou número conforme o tipo quando faltar informação.\n"
+    )
+    if "classificacao_despesa" in campos:
+        esquema += (
+            "- \"classificacao_despesa\" deve conter UMA OU MAIS categorias principais listadas acima, escolhidas de acordo com as descrições dos produtos.\n"
+            "- Não inclua subcategorias na saída; use-as apenas como referência para escolher as categorias principais.\n"
+        )
+    return esquema
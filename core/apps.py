@@ -1,5 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'core'
\ No newline at end of file
+    name = 'core'
+
+    def ready(self):
+        from . import indice_classificacoes
+        from .cache_cadastros import classificacao_alterada, pessoa_alterada
+        from .models import Classificacao, Pessoas
+
+        for sinal in (post_save, post_delete):
+            sinal.connect(pessoa_alterada, sender=Pessoas, dispatch_uid='cache_pessoas')
+            sinal.connect(classificacao_alterada, sender=Classificacao, dispatch_uid='cache_classificacoes')
+        # Depois da invalidação do cache: o índice guarda o carimbo já atualizado
+        post_save.connect(indice_classificacoes.classificacao_alterada, sender=Classificacao, dispatch_uid='indice_classificacoes')
+        post_delete.connect(indice_classificacoes.classificacao_excluida, sender=Classificacao, dispatch_uid='indice_classificacoes')
\ No newline at end of file
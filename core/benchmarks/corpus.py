@@ -0,0 +1,204 @@
+import os
+import random
+from dataclasses import dataclass, field
+from typing import List
+
+from core.agents.extrator_regras import validar_chave_acesso, validar_cnpj, validar_cpf
+
+LINHAS_POR_PAGINA = 48
+PRODUTOS = (
+    "SEMENTE SOJA TMG 7062 IPRO", "FERTILIZANTE NPK 04-14-08", "HERBICIDA GLIFOSATO 480", "OLEO DIESEL S10",
+    "OLEO LUBRIFICANTE 15W40", "FILTRO DE AR PRIMARIO", "PNEU 18.4-34 R1", "CORREIA EM V B-62",
+    "CALCARIO DOLOMITICO", "FUNGICIDA AZOXISTROBINA", "PARAFUSO SEXTAVADO 5/8", "ROLAMENTO 6205 2RS",
+)
+
+
+@dataclass
+class DocumentoSintetico:
+    caminho: str
+    paginas: int
+    itens: int
+    dificil: bool
+    cnpj: str
+    cpf: str
+    numero: int
+    valor_total: str
+    data_emissao: str
+    classificacoes: List[str] = field(default_factory=list)
+
+
+def _completar_digitos(base: str, tamanho: int, validador) -> str:
+    # Procura os dígitos verificadores por tentativa: no máximo 100 combinações
+    faltam = tamanho - len(base)
+    for sufixo in range(10 ** faltam):
+        candidato = base + str(sufixo).zfill(faltam)
+        if validador(candidato):
+            return candidato
+    raise ValueError(f"Sem dígito verificador para {base}")
+
+
+def _escapar(texto: str) -> str:
+    return texto.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+class EscritorPDF:
+    """
+    Gerador mínimo de PDF (só texto em Helvetica), suficiente para o pdfplumber
+    Evita depender de bibliotecas de geração de PDF só para o benchmark
+    """
+
+    def __init__(self):
+        self.paginas: List[bytes] = []
+
+    def adicionar_pagina(self, linhas: List[str], dificil: bool, rnd: random.Random):
+        comandos = []
+        y = 800
+        for linha in linhas:
+            texto = _escapar(linha)
+            if not dificil:
+                comandos.append(f"BT /F1 9 Tf 30 {y} Td ({texto}) Tj ET")
+            elif rnd.random() < 0.3:
+                # Texto rotacionado 90 graus
+                comandos.append(f"BT /F1 8 Tf 0 1 -1 0 {560 - (800 - y) // 20} {y} Tm ({texto}) Tj ET")
+            else:
+                # Cada caractere posicionado isoladamente, com pequeno desalinhamento vertical
+                x = 30.0
+                for caractere in linha:
+                    deslocamento = rnd.uniform(-1.2, 1.2)
+                    comandos.append(f"BT /F1 9 Tf 1 0 0 1 {x:.2f} {y + deslocamento:.2f} Tm ({_escapar(caractere)}) Tj ET")
+                    x += 5.2 + rnd.uniform(-0.6, 0.9)
+            y -= 16
+        self.paginas.append("\n".join(comandos).encode("latin-1", "replace"))
+
+    def salvar(self, caminho: str):
+        objetos = [
+            b"<< /Type /Catalog /Pages 2 0 R >>",
+            None,  # Pages, preenchido depois de conhecer as páginas
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        ]
+        ids_paginas = []
+        for conteudo in self.paginas:
+            objetos.append(b"<< /Length %d >>\nstream\n" % len(conteudo) + conteudo + b"\nendstream")
+            id_conteudo = len(objetos)
+            objetos.append(
+                b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % id_conteudo
+            )
+            ids_paginas.append(len(objetos))
+        kids = b" ".join(b"%d 0 R" % i for i in ids_paginas)
+        objetos[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(ids_paginas)
+
+        saida = bytearray(b"%PDF-1.4\n")
+        posicoes = []
+        for numero, objeto in enumerate(objetos, start=1):
+            posicoes.append(len(saida))
+            saida += b"%d 0 obj\n" % numero + objeto + b"\nendobj\n"
+        inicio_xref = len(saida)
+        saida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+        for posicao in posicoes:
+            saida += b"%010d 00000 n \n" % posicao
+        saida += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, inicio_xref)
+        with open(caminho, "wb") as arquivo:
+            arquivo.write(saida)
+
+
+def _formatar_valor(valor: float) -> str:
+    return f"{valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def gerar_documento(caminho: str, paginas: int, dificil: bool, rnd: random.Random) -> DocumentoSintetico:
+    cnpj = _completar_digitos("".join(str(rnd.randint(0, 9)) for _ in range(8)) + "0001", 14, validar_cnpj)
+    cpf = _completar_digitos("".join(str(rnd.randint(0, 9)) for _ in range(9)), 11, validar_cpf)
+    numero = rnd.randint(1, 999999)
+    serie = rnd.randint(1, 9)
+    chave = _completar_digitos(
+        f"52{rnd.randint(20, 25)}{rnd.randint(1, 12):02d}{cnpj}55{serie:03d}{numero:09d}1{rnd.randint(0, 99999999):08d}",
+        44,
+        validar_chave_acesso,
+    )
+    data_emissao = f"{rnd.randint(1, 28):02d}/{rnd.randint(1, 12):02d}/2024"
+
+    # Primeira página tem ~20 linhas de cabeçalho/totais; as demais só itens
+    itens_por_pagina = LINHAS_POR_PAGINA - 4
+    capacidade = (LINHAS_POR_PAGINA - 22) + itens_por_pagina * (paginas - 1)
+    itens = rnd.randint(max(1, capacidade - itens_por_pagina + 1), capacidade) if paginas > 1 else rnd.randint(1, capacidade)
+    linhas_itens = []
+    total = 0.0
+    for i in range(itens):
+        valor = round(rnd.uniform(10, 5000), 2)
+        total += valor
+        linhas_itens.append(f"{i + 1:04d} {rnd.choice(PRODUTOS)} UN {rnd.randint(1, 100)} {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."))
+    frete = round(rnd.uniform(0, 200), 2)
+    valor_produtos = _formatar_valor(total)
+    valor_total = _formatar_valor(total + frete)
+    cnpj_fmt = f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}"
+    cpf_fmt = f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}"
+    cabecalho_continuacao = [f"DANFE Nº {numero:09d} SÉRIE {serie}", f"AGRO FORNECEDORA {cnpj[:4]} LTDA CNPJ {cnpj_fmt}"]
+
+    primeira = [
+        f"RECEBEMOS DE AGRO FORNECEDORA {cnpj[:4]} LTDA OS PRODUTOS CONSTANTES DA NOTA FISCAL INDICADA AO LADO",
+        "DANFE DOCUMENTO AUXILIAR DA NOTA FISCAL ELETRÔNICA",
+        f"Nº {numero:09d} SÉRIE {serie} FOLHA 1/{paginas}",
+        "CHAVE DE ACESSO",
+        " ".join(chave[i:i + 4] for i in range(0, 44, 4)),
+        "Consulta de autenticidade no portal nacional da NF-e www.nfe.fazenda.gov.br/portal",
+        "NATUREZA DA OPERAÇÃO VENDA DE MERCADORIA",
+        f"CNPJ {cnpj_fmt} INSCRIÇÃO ESTADUAL 10.123.456-7",
+        "DESTINATÁRIO/REMETENTE",
+        "NOME/RAZÃO SOCIAL CNPJ/CPF DATA DA EMISSÃO",
+        f"PRODUTOR RURAL TESTE {cpf_fmt} {data_emissao}",
+        "FATURA/DUPLICATA",
+        f"001 {data_emissao} {valor_total}",
+        "CÁLCULO DO IMPOSTO",
+        # Layout real: os rótulos dividem a linha e os valores vêm embaixo, coluna a coluna
+        "BASE DE CÁLCULO DO ICMS VALOR DO ICMS VALOR TOTAL DOS PRODUTOS",
+        f"0,00 0,00 {valor_produtos}",
+        "VALOR DO FRETE VALOR DO SEGURO DESCONTO OUTRAS DESPESAS ACESSÓRIAS VALOR DO IPI VALOR TOTAL DA NOTA",
+        f"{_formatar_valor(frete)} 0,00 0,00 0,00 0,00 {valor_total}",
+        "TRANSPORTADOR/VOLUMES TRANSPORTADOS",
+        "FRETE POR CONTA DO DESTINATÁRIO",
+        "DADOS DO PRODUTO/SERVIÇO",
+        "CÓDIGO DESCRIÇÃO UN QTD VALOR",
+    ]
+    escritor = EscritorPDF()
+    espaco = LINHAS_POR_PAGINA - len(primeira)
+    escritor.adicionar_pagina(primeira + linhas_itens[:espaco], dificil, rnd)
+    restantes = linhas_itens[espaco:]
+    for folha in range(2, paginas + 1):
+        bloco, restantes = restantes[:itens_por_pagina], restantes[itens_por_pagina:]
+        linhas = cabecalho_continuacao + [f"FOLHA {folha}/{paginas}", "DADOS DO PRODUTO/SERVIÇO"] + bloco
+        escritor.adicionar_pagina(linhas, dificil, rnd)
+    escritor.salvar(caminho)
+
+    return DocumentoSintetico(
+        caminho=caminho,
+        paginas=paginas,
+        itens=itens,
+        dificil=dificil,
+        cnpj=cnpj,
+        cpf=cpf,
+        numero=numero,
+        valor_total=valor_total,
+        data_emissao=data_emissao,
+        classificacoes=rnd.sample(["Sementes", "Fertilizantes", "Defensivos Agrícolas", "Combustíveis e Lubrificantes",
+                                   "Pneus", "Filtros", "Correias", "Frete e Transporte"], rnd.randint(1, 8)),
+    )
+
+
+def gerar_corpus(diretorio: str, quantidade: int, max_paginas: int = 50, fracao_dificil: float = 0.2,
+                 semente: int = 42) -> List[DocumentoSintetico]:
+    """
+    Gera `quantidade` DANFEs sintéticas entre 1 e `max_paginas` páginas
+    A maioria tem poucas páginas (como na produção); uma fração usa texto difícil de extrair
+    """
+    rnd = random.Random(semente)
+    os.makedirs(diretorio, exist_ok=True)
+    documentos = []
+    for i in range(quantidade):
+        paginas = min(max_paginas, max(1, int(rnd.paretovariate(1.2))))
+        if i == quantidade - 1:
+            paginas = max_paginas  # garante ao menos um documento no tamanho máximo
+        dificil = rnd.random() < fracao_dificil
+        caminho = os.path.join(diretorio, f"danfe_{i:04d}_{paginas}p{'_dificil' if dificil else ''}.pdf")
+        documentos.append(gerar_documento(caminho, paginas, dificil, rnd))
+    return documentos
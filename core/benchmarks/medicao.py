@@ -0,0 +1,79 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+from core.memoria import rss_atual_kb
+
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil pelo método nearest-rank"""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    posicao = max(0, min(len(ordenados) - 1, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[posicao]
+
+
+class Etapa:
+    """
+    Mede uma etapa do benchmark: latência de cada execução, vazão e pico de RSS
+    O RSS é amostrado por uma thread enquanto a etapa roda (não inclui processos filhos)
+    """
+
+    def __init__(self, nome: str, intervalo_amostra: float = 0.01):
+        self.nome = nome
+        self.intervalo_amostra = intervalo_amostra
+        self.latencias: List[float] = []
+        self.erros = 0
+        self.rss_inicial_kb = 0
+        self.rss_pico_kb = 0
+        self.duracao = 0.0
+
+    def _amostrar(self, parar: threading.Event):
+        while not parar.is_set():
+            self.rss_pico_kb = max(self.rss_pico_kb, rss_atual_kb())
+            parar.wait(self.intervalo_amostra)
+
+    @contextmanager
+    def rodando(self):
+        self.rss_inicial_kb = self.rss_pico_kb = rss_atual_kb()
+        parar = threading.Event()
+        amostrador = threading.Thread(target=self._amostrar, args=(parar,), daemon=True)
+        amostrador.start()
+        inicio = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.duracao = time.perf_counter() - inicio
+            parar.set()
+            amostrador.join()
+
+    @contextmanager
+    def execucao(self):
+        inicio = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.erros += 1
+            raise
+        finally:
+            self.latencias.append(time.perf_counter() - inicio)
+
+    def resumo(self) -> Dict[str, Any]:
+        ms = [latencia * 1000 for latencia in self.latencias]
+        return {
+            'execucoes': len(ms),
+            'erros': self.erros,
+            'latencia_ms': {
+                'p50': round(percentil(ms, 50), 2),
+                'p95': round(percentil(ms, 95), 2),
+                'p99': round(percentil(ms, 99), 2),
+                'max': round(max(ms), 2) if ms else 0.0,
+                'media': round(sum(ms) / len(ms), 2) if ms else 0.0,
+            },
+            'vazao_por_segundo': round(len(ms) / self.duracao, 3) if self.duracao else 0.0,
+            'duracao_s': round(self.duracao, 3),
+            'rss_inicial_kb': self.rss_inicial_kb,
+            'rss_pico_kb': self.rss_pico_kb,
+        }
@@ -0,0 +1,60 @@
+import logging
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CacheExtracao
+
+logger = logging.getLogger(__name__)
+
+
+def _validade():
+    return timezone.now() - timedelta(seconds=getattr(settings, 'PDF_CACHE_TTL', 7 * 24 * 3600))
+
+
+def buscar_resultado(sha256: str) -> Optional[Dict[str, Any]]:
+    """
+    Retorna o resultado salvo para o hash, se existir e não estiver expirado
+    O cache é só uma otimização: erros de banco (ex.: SQLite ocupado) contam como ausência
+    """
+    try:
+        entrada = CacheExtracao.objects.filter(sha256=sha256, created_at__gte=_validade()).first()
+        if entrada is None:
+            return None
+        CacheExtracao.objects.filter(pk=entrada.pk).update(acessos=F('acessos') + 1, ultimo_acesso=timezone.now())
+    except DatabaseError as e:
+        logger.warning("Cache de extração indisponível na leitura: %s", e)
+        return None
+    return entrada.dados
+
+
+def salvar_resultado(sha256: str, dados: Dict[str, Any]) -> None:
+    """Grava o resultado e aplica a remoção por validade e por tamanho máximo"""
+    try:
+        CacheExtracao.objects.update_or_create(
+            sha256=sha256,
+            defaults={'dados': dados, 'created_at': timezone.now(), 'ultimo_acesso': timezone.now()},
+        )
+        remover_expirados()
+
+        maximo = getattr(settings, 'PDF_CACHE_MAX_ENTRIES', 1000)
+        excedentes = list(CacheExtracao.objects.order_by('-ultimo_acesso').values_list('pk', flat=True)[maximo:])
+        if excedentes:
+            CacheExtracao.objects.filter(pk__in=excedentes).delete()
+    except DatabaseError as e:
+        # Inclui a corrida de dois envios simultâneos do mesmo PDF (chave única)
+        logger.warning("Não foi possível gravar no cache de extração: %s", e)
+
+
+def remover_expirados() -> int:
+    removidos, _ = CacheExtracao.objects.filter(created_at__lt=_validade()).delete()
+    return removidos
+
+
+def limpar_cache() -> int:
+    removidos, _ = CacheExtracao.objects.all().delete()
+    return removidos
@@ -0,0 +1,227 @@
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, Optional
+
+from django.conf import settings
+from django.db import transaction
+
+from core.metricas import registrar_cache_cadastros
+from core.models import Classificacao, Pessoas
+from core.normalizacao import normalizar_descricao, normalizar_documento
+
+# Marca de "não existe no banco": consultas negativas também ficam em cache
+# (a criação do cadastro invalida a entrada pelo post_save)
+_AUSENTE = object()
+
+
+class CacheConsultas:
+    """
+    Cache LRU com TTL para consultas de cadastro, por processo
+    A coerência entre workers vem de um carimbo de versão em arquivo: quem grava
+    atualiza o carimbo e os demais processos descartam o cache ao perceber a mudança
+    """
+
+    def __init__(self, nome: str, max_itens: int, ttl: float, caminho_versao: str):
+        self.nome = nome
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.caminho_versao = caminho_versao
+        self.acertos = 0
+        self.faltas = 0
+        self._itens: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._versao = self._ler_versao()
+        # (carimbo anterior, carimbo gravado) da última invalidação feita por este processo
+        self.ultima_invalidacao = (None, None)
+        self._lock = threading.Lock()
+
+    def _ler_versao(self):
+        # O conteúdo (e não o mtime, de resolução grosseira) identifica a versão
+        try:
+            with open(self.caminho_versao) as arquivo:
+                return arquivo.read()
+        except OSError:
+            return None
+
+    def _sincronizar(self):
+        versao = self._ler_versao()
+        if versao != self._versao:
+            self._itens.clear()
+            self._versao = versao
+
+    def _buscar(self, chave, agora):
+        item = self._itens.get(chave)
+        if item is None:
+            return None
+        if item[1] <= agora:
+            del self._itens[chave]
+            return None
+        self._itens.move_to_end(chave)
+        return item
+
+    def _guardar(self, chave, valor, agora):
+        self._itens[chave] = (valor, agora + self.ttl)
+        self._itens.move_to_end(chave)
+        while len(self._itens) > self.max_itens:
+            self._itens.popitem(last=False)
+
+    def obter(self, chave: Hashable, carregar: Callable[[], Optional[object]]):
+        """Valor em cache para a chave, ou o resultado de carregar() (None quando não existe)"""
+        return self.obter_varios([chave], lambda chaves: {chave: carregar()})[chave]
+
+    def obter_varios(self, chaves: Iterable[Hashable], carregar: Callable[[list], Dict[Hashable, object]]):
+        """
+        Valores de várias chaves; as que faltam são carregadas de uma vez por
+        carregar(chaves_faltantes), que devolve só as encontradas
+        """
+        chaves = list(dict.fromkeys(chaves))
+        valores, faltantes = {}, []
+        with self._lock:
+            self._sincronizar()
+            versao, agora = self._versao, time.monotonic()
+            for chave in chaves:
+                item = self._buscar(chave, agora)
+                if item is None:
+                    faltantes.append(chave)
+                else:
+                    valores[chave] = item[0]
+            self.acertos += len(valores)
+            self.faltas += len(faltantes)
+        registrar_cache_cadastros(self.nome, len(valores), len(faltantes))
+
+        if faltantes:
+            carregados = carregar(faltantes)
+            with self._lock:
+                # Uma gravação durante a consulta invalida o que acabou de ser lido
+                self._sincronizar()
+                guardar = self._versao == versao
+                agora = time.monotonic()
+                for chave in faltantes:
+                    valor = carregados.get(chave)
+                    valores[chave] = _AUSENTE if valor is None else valor
+                    if guardar:
+                        self._guardar(chave, valores[chave], agora)
+        return {chave: (None if valor is _AUSENTE else valor) for chave, valor in valores.items()}
+
+    def invalidar(self):
+        """Descarta o cache neste processo e atualiza o carimbo de versão para os demais"""
+        diretorio = os.path.dirname(self.caminho_versao) or '.'
+        os.makedirs(diretorio, exist_ok=True)
+        descritor, temporario = tempfile.mkstemp(dir=diretorio, suffix='.versao')
+        carimbo = f"{time.time_ns()}-{os.getpid()}"
+        with os.fdopen(descritor, 'w') as arquivo:
+            arquivo.write(carimbo)
+        anterior = self._ler_versao()
+        os.replace(temporario, self.caminho_versao)
+        with self._lock:
+            self._itens.clear()
+            self._versao = self._ler_versao()
+            self.ultima_invalidacao = (anterior, carimbo)
+
+    def versao_compartilhada(self):
+        """Carimbo de versão atual, o mesmo para todos os processos"""
+        return self._ler_versao()
+
+    def estatisticas(self) -> Dict[str, int]:
+        return {'itens': len(self._itens), 'acertos': self.acertos, 'faltas': self.faltas}
+
+
+def _criar_cache(nome: str) -> CacheConsultas:
+    diretorio = getattr(settings, 'CADASTROS_CACHE_DIR', '') or os.path.join(tempfile.gettempdir(), 'sistema_pdf_cadastros')
+    return CacheConsultas(
+        nome,
+        max_itens=getattr(settings, 'CADASTROS_CACHE_MAX_ITENS', 5000),
+        ttl=getattr(settings, 'CADASTROS_CACHE_TTL', 300),
+        caminho_versao=os.path.join(diretorio, f'{nome}.versao'),
+    )
+
+
+_caches: Dict[str, CacheConsultas] = {}
+_caches_lock = threading.Lock()
+
+
+def obter_cache(nome: str) -> CacheConsultas:
+    if nome not in _caches:
+        with _caches_lock:
+            if nome not in _caches:
+                _caches[nome] = _criar_cache(nome)
+    return _caches[nome]
+
+
+def cache_ativo() -> bool:
+    return getattr(settings, 'CADASTROS_CACHE_ENABLED', True)
+
+
+def _carregar_pessoas(chaves):
+    encontradas = {}
+    filtro = Pessoas.objects.filter(
+        tipo__in={tipo for tipo, _ in chaves}, cnpj_cpf__in={documento for _, documento in chaves}
+    )
+    for pessoa in filtro.order_by('id'):
+        encontradas.setdefault((pessoa.tipo, pessoa.cnpj_cpf), pessoa)
+    return encontradas
+
+
+def buscar_pessoas(chaves: Iterable[tuple]) -> Dict[tuple, Optional[Pessoas]]:
+    """Pessoas por (tipo, documento) com o documento já sem máscara; None para as inexistentes"""
+    chaves = [(tipo, normalizar_documento(documento)) for tipo, documento in chaves]
+    if not cache_ativo():
+        encontradas = _carregar_pessoas(chaves) if chaves else {}
+        return {chave: encontradas.get(chave) for chave in chaves}
+    return obter_cache('pessoas').obter_varios(chaves, _carregar_pessoas)
+
+
+def buscar_pessoa(tipo: str, documento: str) -> Optional[Pessoas]:
+    return buscar_pessoas([(tipo, documento)])[(tipo, normalizar_documento(documento))]
+
+
+def _carregar_classificacoes(chaves):
+    encontradas = {}
+    filtro = Classificacao.objects.filter(
+        tipo__in={tipo for tipo, _ in chaves}, descricao_normalizada__in={descricao for _, descricao in chaves}
+    )
+    for classificacao in filtro.order_by('id'):
+        encontradas.setdefault((classificacao.tipo, classificacao.descricao_normalizada), classificacao)
+    return encontradas
+
+
+def buscar_classificacoes(chaves: Iterable[tuple]) -> Dict[tuple, Optional[Classificacao]]:
+    """Classificações por (tipo, descrição), sem diferenciar maiúsculas e acentos; None para as inexistentes"""
+    chaves = [(tipo, normalizar_descricao(descricao)) for tipo, descricao in chaves]
+    chaves = [chave for chave in chaves if chave[1]]
+    if not cache_ativo():
+        encontradas = _carregar_classificacoes(chaves) if chaves else {}
+        return {chave: encontradas.get(chave) for chave in chaves}
+    return obter_cache('classificacoes').obter_varios(chaves, _carregar_classificacoes)
+
+
+def buscar_classificacao(tipo: str, descricao: str) -> Optional[Classificacao]:
+    chave = (tipo, normalizar_descricao(descricao))
+    return buscar_classificacoes([chave]).get(chave)
+
+
+def invalidar_pessoas():
+    obter_cache('pessoas').invalidar()
+
+
+def invalidar_classificacoes():
+    obter_cache('classificacoes').invalidar()
+
+
+def estatisticas() -> Dict[str, Dict[str, int]]:
+    """Itens, acertos e faltas de cada cache neste processo"""
+    return {nome: cache.estatisticas() for nome, cache in _caches.items()}
+
+
+# Sinais: invalidação só depois do commit, para nenhum worker guardar o valor antigo
+# lido antes da gravação terminar. bulk_create/update não disparam sinais: quem grava em
+# lote chama invalidar_pessoas/invalidar_classificacoes diretamente
+
+def pessoa_alterada(sender, **kwargs):
+    transaction.on_commit(invalidar_pessoas)
+
+
+def classificacao_alterada(sender, **kwargs):
+    transaction.on_commit(invalidar_classificacoes)
@@ -0,0 +1,40 @@
+from typing import Any, Dict, Optional
+
+from .agents.extrator_regras import somente_digitos, validar_chave_acesso
+from .models import MovimentoContas
+
+
+def identificar_nota(chave_acesso: str = '', cnpj: str = '', serie: str = '', numero: str = '') -> Optional[str]:
+    """
+    Identificação única da nota fiscal: CNPJ do emitente, série e número
+    Com a chave de acesso, os três saem dela (posições 7-20, 23-25 e 26-34);
+    sem a chave, dos campos informados. Assim a mesma nota tem a mesma identificação
+    venha ela do PDF, do XML ou da tela de validação
+    Sem série nem chave não há identificação: assumir série 0 confundiria a nota com a
+    de série 0 do mesmo emitente e não casaria com a identificação tirada da chave
+    """
+    chave = somente_digitos(chave_acesso)
+    if validar_chave_acesso(chave):
+        cnpj, serie, numero = chave[6:20], chave[22:25], chave[25:34]
+    cnpj, serie, numero = somente_digitos(cnpj), somente_digitos(serie), somente_digitos(numero)
+    if not cnpj or not serie or not numero:
+        return None
+    return f"{cnpj}-{int(serie)}-{int(numero)}"
+
+
+def identificar_dados(dados: Dict[str, Any]) -> Optional[str]:
+    """identificar_nota a partir do resultado da extração"""
+    fornecedor = dados.get('fornecedor') or {}
+    return identificar_nota(
+        dados.get('chave_acesso') or '',
+        fornecedor.get('cnpj') or '',
+        str(dados.get('serie') or ''),
+        str(dados.get('numero_nota_fiscal') or ''),
+    )
+
+
+def movimento_existente(identificacao: Optional[str]) -> Optional[int]:
+    """Id do movimento já lançado para a nota, se houver"""
+    if not identificacao:
+        return None
+    return MovimentoContas.objects.filter(identificacao_nf=identificacao).values_list('id', flat=True).first()
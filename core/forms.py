@@ -3,7 +3,7 @@ from django import forms
 class PDFUploadForm(forms.Form):
     pdf_file = forms.FileField(
         widget=forms.FileInput(attrs={
-            'accept': '.pdf',
+            'accept': '.pdf,.xml',
             'style': 'display: none;',
             'id': 'pdf-input'
         })
@@ -0,0 +1,244 @@
+import csv
+import io
+import itertools
+import json
+import re
+import time
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import DatabaseError, transaction
+
+from .agents.extrator_regras import validar_cnpj, validar_cpf
+from .cache_cadastros import invalidar_classificacoes, invalidar_pessoas
+from .models import Classificacao, Pessoas
+from .normalizacao import normalizar_descricao, normalizar_documento
+
+MODELOS = ('pessoas', 'classificacoes')
+FORMATOS = ('csv', 'json')
+
+# Campos atualizados quando o documento já existe (o tipo da pessoa é mantido)
+CAMPOS_ATUALIZADOS_PESSOA = ['razao_social', 'nome_fantasia', 'telefone', 'email', 'endereco', 'ativo', 'updated_at']
+VALORES_FALSOS = {'0', 'false', 'falso', 'n', 'nao', 'não', 'inativo'}
+
+_SEPARADORES_JSON = re.compile(r'[\s,\[\]]*')
+# Um registro JSON maior que isso indica arquivo corrompido (evita ler o arquivo inteiro para a memória)
+MAX_REGISTRO_JSON = 1024 * 1024
+
+
+def detectar_formato(nome: str) -> str:
+    return 'json' if nome.lower().endswith(('.json', '.jsonl', '.ndjson')) else 'csv'
+
+
+def _linhas_csv(texto: IO[str]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    # Sem seek: a entrada padrão e o upload em streaming não voltam ao início.
+    # A amostra é completada até o fim da linha e devolvida na frente do restante
+    amostra = texto.read(8192)
+    if amostra and not amostra.endswith('\n'):
+        amostra += texto.readline()
+    try:
+        dialeto = csv.Sniffer().sniff(amostra, delimiters=',;\t')
+    except csv.Error:
+        dialeto = csv.excel
+    leitor = csv.DictReader(itertools.chain(io.StringIO(amostra, newline=''), texto), dialect=dialeto)
+    leitor.fieldnames = [(nome or '').strip().lower() for nome in leitor.fieldnames or []]
+    for registro in leitor:
+        yield leitor.line_num, registro
+
+
+def _objetos_json(texto: IO[str], tamanho_bloco: int = 64 * 1024) -> Iterator[Tuple[int, Any]]:
+    """
+    Objetos de um array JSON ou de JSON Lines, lidos em blocos: só o objeto
+    corrente e o resto do bloco ficam em memória
+    """
+    decodificador = json.JSONDecoder()
+    buffer, posicao, numero = '', 0, 0
+    while True:
+        posicao = _SEPARADORES_JSON.match(buffer, posicao).end()
+        try:
+            if posicao >= len(buffer):
+                raise json.JSONDecodeError("fim do bloco", buffer, posicao)
+            objeto, posicao = decodificador.raw_decode(buffer, posicao)
+        except json.JSONDecodeError:
+            bloco = texto.read(tamanho_bloco)
+            if not bloco:
+                if posicao < len(buffer):
+                    raise ValueError(f"JSON inválido após o registro {numero}")
+                return
+            if len(buffer) - posicao > MAX_REGISTRO_JSON:
+                raise ValueError(f"JSON inválido após o registro {numero}")
+            buffer, posicao = buffer[posicao:] + bloco, 0
+            continue
+        numero += 1
+        yield numero, objeto
+
+
+def ler_registros(arquivo: IO[bytes], formato: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """(linha ou posição, registro) de um CSV com cabeçalho ou de JSON, lidos em streaming"""
+    texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    if formato == 'json':
+        return _objetos_json(texto)
+    return _linhas_csv(texto)
+
+
+def _texto(registro: Dict[str, Any], *campos: str) -> str:
+    for campo in campos:
+        valor = registro.get(campo)
+        if valor not in (None, ''):
+            return str(valor).strip()
+    return ''
+
+
+def _limitar(modelo, campo: str, valor: str) -> str:
+    maximo = modelo._meta.get_field(campo).max_length
+    if maximo and len(valor) > maximo:
+        raise ValueError(f"{campo} com mais de {maximo} caracteres")
+    return valor
+
+
+def _ativo(registro: Dict[str, Any]) -> bool:
+    valor = registro.get('ativo')
+    return valor in (None, '') or str(valor).strip().lower() not in VALORES_FALSOS
+
+
+def montar_pessoa(registro: Dict[str, Any], tipo_padrao: str = '') -> Pessoas:
+    """Pessoa validada a partir do registro; ValueError com o motivo da rejeição"""
+    tipo = (_texto(registro, 'tipo') or tipo_padrao).upper()
+    if tipo not in dict(Pessoas.TIPO_CHOICES):
+        raise ValueError(f"tipo inválido: {tipo or 'não informado'}")
+
+    documento = normalizar_documento(_texto(registro, 'cnpj_cpf', 'cnpj', 'cpf', 'documento'))
+    if not ((len(documento) == 14 and validar_cnpj(documento)) or (len(documento) == 11 and validar_cpf(documento))):
+        raise ValueError(f"CNPJ/CPF inválido: {documento or 'não informado'}")
+
+    razao_social = _texto(registro, 'razao_social', 'nome', 'nome_completo')
+    if not razao_social:
+        raise ValueError("razão social não informada")
+
+    email = _texto(registro, 'email')
+    if email:
+        try:
+            validate_email(email)
+        except ValidationError:
+            raise ValueError(f"e-mail inválido: {email}")
+
+    return Pessoas(
+        tipo=tipo,
+        cnpj_cpf=documento,
+        razao_social=_limitar(Pessoas, 'razao_social', razao_social),
+        nome_fantasia=_limitar(Pessoas, 'nome_fantasia', _texto(registro, 'nome_fantasia')) or None,
+        telefone=_limitar(Pessoas, 'telefone', _texto(registro, 'telefone')) or None,
+        email=_limitar(Pessoas, 'email', email) or None,
+        endereco=_texto(registro, 'endereco') or None,
+        ativo=_ativo(registro),
+    )
+
+
+def montar_classificacao(registro: Dict[str, Any], tipo_padrao: str = '') -> Classificacao:
+    """Classificação validada a partir do registro; ValueError com o motivo da rejeição"""
+    tipo = (_texto(registro, 'tipo') or tipo_padrao or 'DESPESA').upper()
+    if tipo not in dict(Classificacao.TIPO_CHOICES):
+        raise ValueError(f"tipo inválido: {tipo}")
+    descricao = _texto(registro, 'descricao', 'classificacao')
+    if not descricao:
+        raise ValueError("descrição não informada")
+    return Classificacao(
+        tipo=tipo,
+        descricao=_limitar(Classificacao, 'descricao', descricao),
+        descricao_normalizada=normalizar_descricao(descricao),
+        ativo=_ativo(registro),
+    )
+
+
+def _gravar_pessoas(lote: List[Tuple[int, Pessoas]]) -> Tuple[int, int]:
+    # Um documento repetido no mesmo lote fica com a última linha (o upsert não pode tocar a mesma linha duas vezes)
+    unicas = {pessoa.cnpj_cpf: pessoa for _, pessoa in lote}
+    Pessoas.objects.bulk_create(
+        list(unicas.values()),
+        update_conflicts=True,
+        unique_fields=['cnpj_cpf'],
+        update_fields=CAMPOS_ATUALIZADOS_PESSOA,
+    )
+    return len(unicas), len(lote) - len(unicas)
+
+
+def _gravar_classificacoes(lote: List[Tuple[int, Classificacao]]) -> Tuple[int, int]:
+    # Classificacao não tem restrição única para ON CONFLICT: as existentes são lidas em uma
+    # consulta pelo índice (tipo, descricao_normalizada) e só as novas são inseridas
+    unicas = {(c.tipo, c.descricao_normalizada): c for _, c in lote}
+    existentes = set(
+        Classificacao.objects
+        .filter(tipo__in={tipo for tipo, _ in unicas}, descricao_normalizada__in={desc for _, desc in unicas})
+        .values_list('tipo', 'descricao_normalizada')
+    )
+    novas = [c for chave, c in unicas.items() if chave not in existentes]
+    Classificacao.objects.bulk_create(novas)
+    return len(novas), len(lote) - len(novas)
+
+
+def importar_cadastros(
+    arquivo: IO[bytes],
+    modelo: str,
+    formato: str = 'csv',
+    tipo_padrao: str = '',
+    tamanho_lote: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Importa pessoas ou classificações em lotes, cada um em sua transação
+    Gera um evento por linha rejeitada ({'linha', 'erro'}), um por lote gravado ({'progresso'})
+    e, no fim, {'resumo'} com lidas, gravadas, ignoradas, rejeitadas e linhas por segundo
+    """
+    if modelo not in MODELOS:
+        raise ValueError(f"modelo inválido: {modelo} (use {', '.join(MODELOS)})")
+    montar, gravar, invalidar = {
+        'pessoas': (montar_pessoa, _gravar_pessoas, invalidar_pessoas),
+        'classificacoes': (montar_classificacao, _gravar_classificacoes, invalidar_classificacoes),
+    }[modelo]
+    tamanho_lote = tamanho_lote or getattr(settings, 'IMPORTACAO_LOTE', 1000)
+
+    contagem = {'lidas': 0, 'gravadas': 0, 'ignoradas': 0, 'rejeitadas': 0}
+    inicio = time.perf_counter()
+
+    def progresso():
+        segundos = time.perf_counter() - inicio
+        return {
+            **contagem,
+            'segundos': round(segundos, 3),
+            'linhas_por_segundo': round(contagem['lidas'] / segundos, 1) if segundos else 0.0,
+        }
+
+    def gravar_lote(lote):
+        try:
+            with transaction.atomic():
+                gravadas, ignoradas = gravar(lote)
+        except DatabaseError as e:
+            contagem['rejeitadas'] += len(lote)
+            return [{'linha': linha, 'erro': f"lote não gravado: {e}"} for linha, _ in lote]
+        contagem['gravadas'] += gravadas
+        contagem['ignoradas'] += ignoradas
+        # bulk_create não dispara sinais: o cache de cadastros é invalidado aqui
+        invalidar()
+        return [{'progresso': progresso()}]
+
+    lote: List[Tuple[int, Any]] = []
+    try:
+        for linha, registro in ler_registros(arquivo, formato):
+            contagem['lidas'] += 1
+            try:
+                if not isinstance(registro, dict):
+                    raise ValueError("registro não é um objeto")
+                lote.append((linha, montar({str(k).strip().lower(): v for k, v in registro.items()}, tipo_padrao)))
+            except ValueError as e:
+                contagem['rejeitadas'] += 1
+                yield {'linha': linha, 'erro': str(e)}
+                continue
+            if len(lote) >= tamanho_lote:
+                yield from gravar_lote(lote)
+                lote = []
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        yield {'linha': None, 'erro': f"arquivo interrompido: {e}"}
+    if lote:
+        yield from gravar_lote(lote)
+    yield {'resumo': {'modelo': modelo, **progresso()}}
@@ -0,0 +1,154 @@
+import heapq
+import threading
+from collections import Counter, defaultdict
+from itertools import chain
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+from core.cache_cadastros import obter_cache
+from core.models import Classificacao
+from core.normalizacao import normalizar_descricao
+
+
+def trigramas(descricao: str) -> FrozenSet[str]:
+    """Trigramas da descrição normalizada, com bordas marcadas (prefixos e sufixos pesam)"""
+    texto = normalizar_descricao(descricao)
+    if not texto:
+        return frozenset()
+    texto = f"  {texto} "
+    return frozenset(texto[i:i + 3] for i in range(len(texto) - 2))
+
+
+class IndiceTrigramas:
+    """
+    Índice invertido de trigramas das classificações ativas, por processo
+    A similaridade é o coeficiente de Dice entre os conjuntos de trigramas, calculado só
+    para as classificações que compartilham algum trigrama com a consulta
+    """
+
+    def __init__(self):
+        self._itens: Dict[int, Tuple[str, str, FrozenSet[str]]] = {}
+        self._postagens: Dict[Tuple[str, str], Set[int]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self.carregado = False
+        self.versao = None
+
+    def _remover(self, id_):
+        item = self._itens.pop(id_, None)
+        if item:
+            tipo, _, grams = item
+            for gram in grams:
+                postagem = self._postagens[(tipo, gram)]
+                postagem.discard(id_)
+                if not postagem:
+                    del self._postagens[(tipo, gram)]
+
+    def _adicionar(self, id_, tipo, descricao):
+        grams = trigramas(descricao)
+        self._itens[id_] = (tipo, descricao, grams)
+        for gram in grams:
+            self._postagens[(tipo, gram)].add(id_)
+
+    def reconstruir(self, classificacoes, versao=None):
+        novo = IndiceTrigramas()
+        for id_, tipo, descricao in classificacoes:
+            novo._adicionar(id_, tipo, descricao)
+        with self._lock:
+            self._itens, self._postagens = novo._itens, novo._postagens
+            self.carregado = True
+            self.versao = versao
+
+    def atualizar(self, id_, tipo, descricao, ativo=True):
+        """Inclui, altera ou (inativa/excluída) retira uma classificação"""
+        with self._lock:
+            self._remover(id_)
+            if ativo:
+                self._adicionar(id_, tipo, descricao)
+
+    def remover(self, id_):
+        with self._lock:
+            self._remover(id_)
+
+    def buscar(self, tipo: str, descricao: str, k: int = 3, minimo: float = 0.0) -> List[Dict]:
+        """As k classificações mais parecidas com a descrição, com similaridade >= minimo"""
+        grams = trigramas(descricao)
+        if not grams:
+            return []
+        # Com n trigramas em comum, a similaridade não passa de 2n / (|consulta| + n):
+        # candidatos com menos de minimo * |consulta| / (2 - minimo) em comum são descartados sem cálculo
+        corte = minimo * len(grams) / (2 - minimo)
+        with self._lock:
+            comuns = Counter(chain.from_iterable(self._postagens.get((tipo, gram), ()) for gram in grams))
+            candidatos = [
+                (2 * n / (len(grams) + len(self._itens[id_][2])), id_, self._itens[id_][1])
+                for id_, n in comuns.items() if n >= corte
+            ]
+        melhores = heapq.nlargest(k, (c for c in candidatos if c[0] >= minimo), key=lambda c: (c[0], -c[1]))
+        return [{'id': id_, 'descricao': desc, 'similaridade': round(sim, 3)} for sim, id_, desc in melhores]
+
+    def __len__(self):
+        return len(self._itens)
+
+
+_indice = IndiceTrigramas()
+_construcao_lock = threading.Lock()
+
+
+def _versao_classificacoes():
+    # Mesmo carimbo do cache de cadastros: gravações em outro worker também mudam o índice
+    return obter_cache('classificacoes').versao_compartilhada()
+
+
+def obter_indice() -> IndiceTrigramas:
+    """Índice carregado do banco no primeiro uso e reconstruído quando outro processo grava"""
+    versao = _versao_classificacoes()
+    if not _indice.carregado or _indice.versao != versao:
+        with _construcao_lock:
+            if not _indice.carregado or _indice.versao != versao:
+                _indice.reconstruir(
+                    Classificacao.objects.filter(ativo=True).values_list('id', 'tipo', 'descricao'),
+                    versao,
+                )
+    return _indice
+
+
+def sugerir_classificacoes(tipo: str, descricao: str, k: Optional[int] = None) -> List[Dict]:
+    """Classificações parecidas com a descrição (id, descricao, similaridade), da mais parecida"""
+    return obter_indice().buscar(
+        tipo, descricao,
+        k=k or getattr(settings, 'CLASSIFICACAO_SUGESTOES_MAX', 3),
+        minimo=getattr(settings, 'CLASSIFICACAO_SIMILARIDADE_MIN', 0.5),
+    )
+
+
+def _aplicar(alteracao):
+    """
+    Aplica uma alteração deste processo e acompanha o carimbo só se o índice estava na versão
+    imediatamente anterior à invalidação feita por ela; se outro worker gravou no meio,
+    o carimbo fica para trás e obter_indice reconstrói
+    """
+    anterior, gravado = obter_cache('classificacoes').ultima_invalidacao
+    with _construcao_lock:
+        alteracao()
+        if _indice.versao == anterior:
+            _indice.versao = gravado
+
+
+def classificacao_alterada(sender, instance, **kwargs):
+    """
+    Atualização incremental depois do commit; conectado depois da invalidação do cache
+    de cadastros, então a última invalidação registrada é a desta gravação
+    """
+    valores = (instance.id, instance.tipo, instance.descricao, instance.ativo)
+
+    if _indice.carregado:
+        transaction.on_commit(lambda: _aplicar(lambda: _indice.atualizar(*valores)))
+
+
+def classificacao_excluida(sender, instance, **kwargs):
+    id_ = instance.id
+
+    if _indice.carregado:
+        transaction.on_commit(lambda: _aplicar(lambda: _indice.remover(id_)))
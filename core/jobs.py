@@ -0,0 +1,91 @@
+import logging
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import JobExtracao
+from .services import processar_pdf
+
+logger = logging.getLogger(__name__)
+
+
+def criar_job(pdf_file, sha256: str = '') -> JobExtracao:
+    """Grava o upload e coloca o job na fila"""
+    return JobExtracao.objects.create(arquivo=pdf_file, nome_arquivo=pdf_file.name, sha256=sha256 or '', etapa='na_fila')
+
+
+def _encerrar_abandonados(expirado):
+    """Jobs cujo worker morreu em todas as tentativas viram ERRO em vez de voltar à fila"""
+    max_tentativas = getattr(settings, 'JOB_MAX_ATTEMPTS', 3)
+    abandonados = JobExtracao.objects.filter(
+        status='PROCESSANDO', iniciado_em__lt=expirado, tentativas__gte=max_tentativas
+    )
+    for job in abandonados:
+        encerrado = JobExtracao.objects.filter(pk=job.pk, status='PROCESSANDO', iniciado_em=job.iniciado_em).update(
+            status='ERRO',
+            etapa='finalizado',
+            concluido_em=timezone.now(),
+            resultado={
+                "erro": "Falha ao processar o PDF",
+                "detalhes": f"O processamento foi interrompido {job.tentativas} vez(es) sem concluir",
+            },
+        )
+        if encerrado and job.arquivo:
+            job.arquivo.delete(save=False)
+            JobExtracao.objects.filter(pk=job.pk).update(arquivo='')
+        if encerrado:
+            logger.error("Job %s abandonado após %s tentativa(s)", job.pk, job.tentativas)
+
+
+def reservar_proximo_job() -> Optional[JobExtracao]:
+    """
+    Pega o job pendente mais antigo, ou um em PROCESSANDO cujo prazo (JOB_LEASE_SECONDS)
+    venceu sem conclusão: o worker que o reservou morreu e o job volta a ser reservável
+    A troca de status é condicional (UPDATE ... WHERE status e iniciado_em ainda são os
+    lidos), então dois workers nunca reservam o mesmo job, mesmo usando só o SQLite
+    """
+    expirado = timezone.now() - timedelta(seconds=getattr(settings, 'JOB_LEASE_SECONDS', 600))
+    _encerrar_abandonados(expirado)
+    while True:
+        job = (
+            JobExtracao.objects
+            .filter(Q(status='PENDENTE') | Q(status='PROCESSANDO', iniciado_em__lt=expirado))
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        reservado = JobExtracao.objects.filter(pk=job.pk, status=job.status, iniciado_em=job.iniciado_em).update(
+            status='PROCESSANDO', etapa='iniciado', iniciado_em=timezone.now(), tentativas=F('tentativas') + 1
+        )
+        if reservado:
+            if job.status == 'PROCESSANDO':
+                logger.warning("Job %s retomado após o prazo de reserva vencer", job.pk)
+            job.refresh_from_db()
+            return job
+
+
+def executar_job(job: JobExtracao) -> JobExtracao:
+    def atualizar_etapa(etapa):
+        JobExtracao.objects.filter(pk=job.pk).update(etapa=etapa)
+
+    try:
+        dados = processar_pdf(job.arquivo.path, sha256=job.sha256 or None, progresso=atualizar_etapa)
+    except Exception as e:
+        logger.exception("Falha no job %s", job.pk)
+        dados = {"erro": "Falha ao processar o PDF", "detalhes": str(e)}
+
+    job.resultado = dados
+    job.status = 'ERRO' if 'erro' in dados else 'CONCLUIDO'
+    job.etapa = 'finalizado'
+    job.concluido_em = timezone.now()
+    job.save(update_fields=['resultado', 'status', 'etapa', 'concluido_em'])
+
+    # O PDF só é necessário durante o processamento
+    if job.arquivo:
+        job.arquivo.delete(save=False)
+        JobExtracao.objects.filter(pk=job.pk).update(arquivo='')
+    return job
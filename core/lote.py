@@ -0,0 +1,112 @@
+import contextvars
+import logging
+import threading
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, Tuple
+
+from django.conf import settings
+from django.db import connection
+
+from .services import processar_pdf
+
+logger = logging.getLogger(__name__)
+
+
+class EntradaIgnorada:
+    """Entrada do lote que não é processada; o motivo vai para a linha NDJSON do arquivo"""
+
+    def __init__(self, motivo: str):
+        self.motivo = motivo
+
+
+def _eh_zip(arquivo) -> bool:
+    return arquivo.name.lower().endswith('.zip') or zipfile.is_zipfile(arquivo)
+
+
+def iterar_entradas(arquivos) -> Iterator[Tuple[str, Any]]:
+    """
+    Gera (nome, conteúdo) para cada PDF recebido
+    ZIPs são lidos entrada por entrada, sem extrair o arquivo inteiro; entradas que não são
+    PDF, passam de PDF_MAX_BYTES ou têm taxa de compressão suspeita (bomba de descompressão)
+    geram EntradaIgnorada, conferida pelo cabeçalho do ZIP antes de descompactar
+    """
+    max_bytes = getattr(settings, 'PDF_MAX_BYTES', 50 * 1024 * 1024)
+    max_taxa = getattr(settings, 'PDF_BATCH_ZIP_MAX_RATIO', 100)
+    for arquivo in arquivos:
+        if not _eh_zip(arquivo):
+            yield arquivo.name, arquivo
+            continue
+        try:
+            with zipfile.ZipFile(arquivo) as zf:
+                for info in zf.infolist():
+                    if info.is_dir():
+                        continue
+                    if not info.filename.lower().endswith('.pdf'):
+                        yield info.filename, EntradaIgnorada('Arquivo ignorado: não é um PDF')
+                        continue
+                    if max_bytes and info.file_size > max_bytes:
+                        yield info.filename, EntradaIgnorada(
+                            f'PDF recusado: {info.file_size} bytes descompactado (limite: {max_bytes})'
+                        )
+                        continue
+                    if max_taxa and info.file_size > max_taxa * max(info.compress_size, 1):
+                        yield info.filename, EntradaIgnorada(
+                            f'PDF recusado: taxa de compressão acima de {max_taxa}:1'
+                        )
+                        continue
+                    with zf.open(info) as entrada:
+                        # Nunca lê mais que o limite, mesmo que o cabeçalho informe um tamanho falso
+                        conteudo = entrada.read(max_bytes + 1) if max_bytes else entrada.read()
+                    if max_bytes and len(conteudo) > max_bytes:
+                        yield info.filename, EntradaIgnorada(f'PDF recusado: maior que o limite de {max_bytes} bytes')
+                        continue
+                    yield info.filename, conteudo
+        except zipfile.BadZipFile:
+            yield arquivo.name, EntradaIgnorada('Arquivo ignorado: ZIP inválido')
+
+
+def _processar_entrada(nome: str, conteudo, limite_pdf, limite_llm) -> Dict[str, Any]:
+    try:
+        if isinstance(conteudo, EntradaIgnorada):
+            return {'arquivo': nome, 'sucesso': False, 'erro': conteudo.motivo}
+        dados = processar_pdf(conteudo, limite_pdf=limite_pdf, limite_llm=limite_llm)
+        return {'arquivo': nome, 'sucesso': 'erro' not in dados, 'dados': dados}
+    except Exception as e:
+        logger.exception("Falha ao processar %s no lote", nome)
+        return {'arquivo': nome, 'sucesso': False, 'erro': 'Falha ao processar o PDF', 'detalhes': str(e)}
+    finally:
+        # Cada thread abre a própria conexão com o banco
+        connection.close()
+
+
+def processar_lote(arquivos: Iterable) -> Iterator[Dict[str, Any]]:
+    """
+    Processa os PDFs em paralelo e gera o resultado de cada um assim que fica pronto
+    A leitura do PDF e a consulta ao LLM têm limites de concorrência separados, e só
+    alguns arquivos ficam em memória por vez (o ZIP é consumido conforme há vaga)
+    """
+    max_workers = getattr(settings, 'PDF_BATCH_WORKERS', 4)
+    limite_pdf = threading.BoundedSemaphore(getattr(settings, 'PDF_BATCH_PARSE_CONCURRENCY', 2))
+    limite_llm = threading.BoundedSemaphore(getattr(settings, 'PDF_BATCH_LLM_CONCURRENCY', 4))
+
+    entradas = iterar_entradas(arquivos)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pendentes = set()
+        esgotado = False
+        while pendentes or not esgotado:
+            while not esgotado and len(pendentes) < max_workers * 2:
+                try:
+                    nome, conteudo = next(entradas)
+                except StopIteration:
+                    esgotado = True
+                    break
+                # Cada thread roda em uma cópia do contexto: as etapas entram na medição da requisição
+                contexto = contextvars.copy_context()
+                pendentes.add(executor.submit(contexto.run, _processar_entrada, nome, conteudo, limite_pdf, limite_llm))
+
+            if not pendentes:
+                break
+            concluidos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+            for futuro in concluidos:
+                yield futuro.result()
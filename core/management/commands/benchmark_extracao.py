@@ -0,0 +1,154 @@
+import json
+import platform
+import subprocess
+import tempfile
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from core.agents.backend import redefinir_agente
+from core.benchmarks.corpus import gerar_corpus
+from core.benchmarks.medicao import Etapa
+from core.models import Classificacao, Pessoas
+from core.normalizacao import normalizar_descricao
+from core.services import ProcessadorPDF, processar_pdf
+from core.views_validacao import criar_lancamento
+
+
+def _commit_atual() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return 'desconhecido'
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark ponta a ponta com DANFEs sintéticas: extração de texto, processar_pdf com LLM falso "
+        "e criação de lançamentos. Roda em um banco de teste descartável e grava o resultado em JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documentos', type=int, default=20, help="Quantidade de PDFs no corpus")
+        parser.add_argument('--max-paginas', type=int, default=50, help="Número máximo de páginas por PDF")
+        parser.add_argument('--fracao-dificil', type=float, default=0.2, help="Fração de PDFs com texto difícil de extrair")
+        parser.add_argument('--semente', type=int, default=42, help="Semente do gerador (corpus reprodutível)")
+        parser.add_argument('--latencia-llm-ms', type=float, default=800, help="Latência média do LLM falso (desvio de 1/4 dela)")
+        parser.add_argument('--corpus', default='', help="Diretório do corpus (padrão: diretório temporário)")
+        parser.add_argument('--saida', default='', help="Arquivo JSON de resultado (padrão: benchmark-<commit>-<data>.json)")
+
+    def handle(self, *args, **options):
+        commit = _commit_atual()
+        diretorio = options['corpus'] or tempfile.mkdtemp(prefix='corpus_danfe_')
+        self.stdout.write(f"Gerando {options['documentos']} DANFEs sintéticas em {diretorio}...")
+        documentos = gerar_corpus(
+            diretorio, options['documentos'], options['max_paginas'], options['fracao_dificil'], options['semente']
+        )
+
+        # Banco de teste descartável: o benchmark grava cache e lançamentos
+        nome_banco_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+        try:
+            with override_settings(
+                LLM_BACKEND='core.agents.agente_falso.AgenteFalso',
+                LLM_FAKE_LATENCY_MS=options['latencia_llm_ms'],
+                LLM_FAKE_JITTER_MS=options['latencia_llm_ms'] / 4,
+            ):
+                redefinir_agente()
+                etapas = [
+                    self._etapa_texto(documentos),
+                    self._etapa_processar_pdf(documentos),
+                    self._etapa_lancamento(documentos),
+                ]
+        finally:
+            redefinir_agente()
+            connection.creation.destroy_test_db(nome_banco_original, verbosity=0)
+
+        resultado = {
+            'commit': commit,
+            'data': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'parametros': {chave: options[chave] for chave in (
+                'documentos', 'max_paginas', 'fracao_dificil', 'semente', 'latencia_llm_ms'
+            )},
+            'corpus': {
+                'paginas_total': sum(doc.paginas for doc in documentos),
+                'paginas_max': max(doc.paginas for doc in documentos),
+                'itens_total': sum(doc.itens for doc in documentos),
+                'dificeis': sum(doc.dificil for doc in documentos),
+            },
+            'etapas': {etapa.nome: etapa.resumo() for etapa in etapas},
+        }
+
+        saida = options['saida'] or f"benchmark-{commit}-{datetime.now():%Y%m%d-%H%M%S}.json"
+        with open(saida, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+
+        for etapa in etapas:
+            resumo = etapa.resumo()
+            latencia = resumo['latencia_ms']
+            self.stdout.write(
+                f"{etapa.nome:<20} p50={latencia['p50']:>9.2f}ms p95={latencia['p95']:>9.2f}ms "
+                f"p99={latencia['p99']:>9.2f}ms vazão={resumo['vazao_por_segundo']:>8.2f}/s "
+                f"pico RSS={resumo['rss_pico_kb'] / 1024:.1f}MB erros={resumo['erros']}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Resultado gravado em {saida}"))
+
+    def _etapa_texto(self, documentos):
+        etapa = Etapa('extrair_texto_pdf')
+        processador = ProcessadorPDF()
+        with etapa.rodando():
+            for doc in documentos:
+                with etapa.execucao():
+                    processador.extrair_texto_pdf(doc.caminho)
+        return etapa
+
+    def _etapa_processar_pdf(self, documentos):
+        etapa = Etapa('processar_pdf')
+        with etapa.rodando():
+            for doc in documentos:
+                try:
+                    with etapa.execucao():
+                        dados = processar_pdf(doc.caminho)
+                        if 'erro' in dados:
+                            raise RuntimeError(dados['erro'])
+                except RuntimeError:
+                    pass
+        return etapa
+
+    def _etapa_lancamento(self, documentos):
+        categorias = {descricao for doc in documentos for descricao in doc.classificacoes}
+        Classificacao.objects.bulk_create([
+            Classificacao(tipo='DESPESA', descricao=c, descricao_normalizada=normalizar_descricao(c)) for c in categorias
+        ])
+        fabrica = RequestFactory()
+
+        etapa = Etapa('criar_lancamento')
+        with etapa.rodando():
+            for indice, doc in enumerate(documentos):
+                Pessoas.objects.get_or_create(cnpj_cpf=doc.cnpj, defaults={'tipo': 'FORNECEDOR', 'razao_social': f"FORNECEDOR {doc.cnpj}"})
+                Pessoas.objects.get_or_create(cnpj_cpf=doc.cpf, defaults={'tipo': 'FATURADO', 'razao_social': f"FATURADO {doc.cpf}"})
+                corpo = {
+                    'fornecedor': {'cnpj': doc.cnpj},
+                    'faturado': {'cpf': doc.cpf},
+                    'nota_fiscal': {'numero': str(doc.numero), 'valor': doc.valor_total, 'data_emissao': doc.data_emissao},
+                    'quantidade_parcelas': 1 + indice % 12,
+                    'classificacao_despesa': doc.classificacoes,
+                }
+                requisicao = fabrica.post('/api/criar-lancamento/', json.dumps(corpo), content_type='application/json')
+                try:
+                    with etapa.execucao():
+                        resposta = json.loads(criar_lancamento(requisicao).content)
+                        if not resposta.get('sucesso'):
+                            raise RuntimeError(resposta.get('erro'))
+                except RuntimeError:
+                    pass
+        return etapa
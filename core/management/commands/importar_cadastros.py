@@ -0,0 +1,43 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importacao import FORMATOS, MODELOS, detectar_formato, importar_cadastros
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa fornecedores/faturados/clientes (pessoas) ou classificações de um CSV com cabeçalho "
+        "ou JSON (array ou uma linha por registro), em streaming e gravando em lotes. "
+        "Documentos existentes são atualizados; linhas rejeitadas são listadas com o motivo"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help="Caminho do arquivo ('-' para a entrada padrão)")
+        parser.add_argument('--modelo', choices=MODELOS, required=True, help="Cadastro importado")
+        parser.add_argument('--formato', choices=FORMATOS, help="Padrão: pela extensão do arquivo (CSV se não for .json/.jsonl)")
+        parser.add_argument('--tipo', default='', help="Tipo usado quando a linha não traz a coluna tipo (ex.: FORNECEDOR, DESPESA)")
+        parser.add_argument('--lote', type=int, default=None, help="Linhas por transação (padrão: IMPORTACAO_LOTE)")
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or detectar_formato(options['arquivo'])
+        try:
+            arquivo = sys.stdin.buffer if options['arquivo'] == '-' else open(options['arquivo'], 'rb')
+        except OSError as e:
+            raise CommandError(str(e))
+
+        with arquivo:
+            for evento in importar_cadastros(arquivo, options['modelo'], formato, options['tipo'], options['lote']):
+                if 'erro' in evento:
+                    local = f"linha {evento['linha']}" if evento['linha'] is not None else "arquivo"
+                    self.stderr.write(f"{local}: {evento['erro']}")
+                elif 'progresso' in evento:
+                    p = evento['progresso']
+                    self.stdout.write(f"{p['lidas']} linha(s) lidas, {p['gravadas']} gravadas ({p['linhas_por_segundo']:.0f} linhas/s)")
+                else:
+                    r = evento['resumo']
+                    self.stdout.write(self.style.SUCCESS(
+                        f"{r['lidas']} linha(s) lidas: {r['gravadas']} gravadas, {r['ignoradas']} ignoradas "
+                        f"(repetidas ou já cadastradas), {r['rejeitadas']} rejeitadas em {r['segundos']:.1f}s "
+                        f"({r['linhas_por_segundo']:.0f} linhas/s)"
+                    ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core.cache import limpar_cache, remover_expirados
+
+
+class Command(BaseCommand):
+    help = "Remove entradas do cache de resultados de extração de PDF"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--expirados',
+            action='store_true',
+            help="Remove apenas as entradas com validade vencida (PDF_CACHE_TTL)",
+        )
+
+    def handle(self, *args, **options):
+        if options['expirados']:
+            removidos = remover_expirados()
+        else:
+            removidos = limpar_cache()
+        self.stdout.write(self.style.SUCCESS(f"{removidos} entrada(s) removida(s) do cache"))
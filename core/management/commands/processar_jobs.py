@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.jobs import executar_job, reservar_proximo_job
+
+
+class Command(BaseCommand):
+    help = "Worker da fila de extrações assíncronas (tabela job_extracao)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--uma-vez',
+            action='store_true',
+            help="Processa os jobs pendentes e encerra, em vez de continuar aguardando novos",
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=1.0,
+            help="Segundos de espera entre consultas quando a fila está vazia",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Aguardando jobs de extração...")
+        while True:
+            job = reservar_proximo_job()
+            if job is None:
+                if options['uma_vez']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+
+            job = executar_job(job)
+            self.stdout.write(f"Job {job.id} ({job.nome_arquivo}): {job.status}")
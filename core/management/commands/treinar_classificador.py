@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.agents.classificador import ClassificadorDespesa, exemplos_lancados
+
+
+class Command(BaseCommand):
+    help = (
+        "Treina o classificador local de despesas com os lançamentos (produtos e classificações). "
+        "Por padrão é incremental: só os movimentos lançados depois do último treino são acrescentados"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--completo',
+            action='store_true',
+            help="Descarta o modelo salvo e treina de novo com todos os lançamentos",
+        )
+
+    def handle(self, *args, **options):
+        caminho = str(settings.CLASSIFICADOR_MODELO_PATH)
+        classificador = ClassificadorDespesa()
+        if not options['completo']:
+            try:
+                classificador = ClassificadorDespesa.carregar(caminho)
+            except FileNotFoundError:
+                pass
+
+        novos = classificador.treinar(exemplos_lancados(classificador.ultimo_movimento))
+        if novos or options['completo']:
+            classificador.salvar(caminho)
+        self.stdout.write(self.style.SUCCESS(
+            f"{novos} lançamento(s) novo(s); modelo com {classificador.documentos} documento(s) "
+            f"e {len(classificador.categorias)} categoria(s) em {caminho}"
+        ))
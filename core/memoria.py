@@ -0,0 +1,13 @@
+import resource
+
+
+def rss_atual_kb() -> int:
+    """RSS atual do processo (Linux: /proc); em outros sistemas usa o pico informado pelo getrusage"""
+    try:
+        with open('/proc/self/status') as status:
+            for linha in status:
+                if linha.startswith('VmRSS:'):
+                    return int(linha.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
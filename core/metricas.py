@@ -0,0 +1,94 @@
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+
+# Com PROMETHEUS_MULTIPROC_DIR definido (gunicorn com vários workers), cada processo grava
+# seus valores em arquivos nesse diretório e o /metrics agrega todos na leitura
+
+REQUISICAO_DURACAO = Histogram(
+    'sistema_pdf_requisicao_duracao_segundos',
+    "Latência das requisições por rota (nome da URL)",
+    ['rota', 'metodo', 'status'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+REQUISICAO_CONSULTAS_DB = Histogram(
+    'sistema_pdf_requisicao_consultas_db',
+    "Consultas ao banco executadas por requisição",
+    ['rota'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+EXTRACOES = Counter(
+    'sistema_pdf_extracoes',
+    "Extrações de PDF por resultado (ok, cache, duplicada, recusada, pdf_invalido, erro_llm, json_invalido, bloqueada)",
+    ['resultado'],
+)
+LLM_LATENCIA = Histogram(
+    'sistema_pdf_llm_latencia_segundos',
+    "Latência das consultas ao LLM, incluindo novas tentativas",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120),
+)
+LLM_EM_ANDAMENTO = Gauge(
+    'sistema_pdf_llm_em_andamento',
+    "Consultas ao LLM em andamento",
+    multiprocess_mode='livesum',
+)
+LLM_CHAMADAS = Counter(
+    'sistema_pdf_llm_chamadas',
+    "Tentativas de consulta ao LLM por resultado (sucessos, falhas, novas_tentativas, tempo_esgotado, recusadas_circuito)",
+    ['resultado'],
+)
+PDF_PAGINAS = Histogram(
+    'sistema_pdf_pdf_paginas',
+    "Número de páginas dos PDFs processados",
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100, 200),
+)
+PDF_BYTES = Histogram(
+    'sistema_pdf_pdf_bytes',
+    "Tamanho em bytes dos PDFs processados",
+    buckets=(16e3, 64e3, 256e3, 1e6, 4e6, 16e6, 64e6),
+)
+CACHE_CADASTROS = Counter(
+    'sistema_pdf_cache_cadastros',
+    "Consultas ao cache de cadastros (pessoas, classificacoes) por resultado (acerto, falta)",
+    ['cache', 'resultado'],
+)
+
+
+def registrar_requisicao(rota: str, metodo: str, status: int, duracao_s: float, consultas: int):
+    REQUISICAO_DURACAO.labels(rota, metodo, str(status)).observe(duracao_s)
+    REQUISICAO_CONSULTAS_DB.labels(rota).observe(consultas)
+
+
+def registrar_extracao(resultado: str):
+    EXTRACOES.labels(resultado).inc()
+
+
+def registrar_llm(resultado: str):
+    LLM_CHAMADAS.labels(resultado).inc()
+
+
+def registrar_pdf(paginas: int, tamanho_bytes: int):
+    PDF_PAGINAS.observe(paginas)
+    PDF_BYTES.observe(tamanho_bytes)
+
+
+def registrar_cache_cadastros(cache: str, acertos: int, faltas: int):
+    if acertos:
+        CACHE_CADASTROS.labels(cache, 'acerto').inc(acertos)
+    if faltas:
+        CACHE_CADASTROS.labels(cache, 'falta').inc(faltas)
+
+
+def exportar() -> bytes:
+    """Métricas no formato texto do Prometheus, agregando os workers no modo multiprocesso"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+    else:
+        registro = REGISTRY
+    return generate_latest(registro)
+
+
+TIPO_CONTEUDO = CONTENT_TYPE_LATEST
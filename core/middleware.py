@@ -0,0 +1,85 @@
+import json
+import logging
+import time
+
+from django.db import connection
+
+from .metricas import registrar_requisicao
+from .timing import encerrar_medicao, iniciar_medicao, iterar_com_medicao, registrar_duracao
+
+logger = logging.getLogger('core.timing')
+
+
+class ServerTimingMiddleware:
+    """
+    Abre a medição da requisição, devolve as etapas no cabeçalho Server-Timing
+    e registra uma linha de log estruturada (JSON) por requisição
+    Em respostas em streaming os cabeçalhos saem antes do corpo ser gerado: não há
+    Server-Timing e o log é gravado quando o corpo termina, com as etapas do streaming
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        medicao, token = iniciar_medicao()
+        try:
+            response = self.get_response(request)
+        finally:
+            encerrar_medicao(token)
+
+        if response.streaming:
+            response.streaming_content = self._corpo_medido(response.streaming_content, request, response, medicao)
+            return response
+
+        response['Server-Timing'] = medicao.server_timing()
+        self._registrar(request, response, medicao)
+        return response
+
+    def _corpo_medido(self, corpo, request, response, medicao):
+        try:
+            yield from iterar_com_medicao(corpo, medicao)
+        finally:
+            self._registrar(request, response, medicao)
+
+    def _registrar(self, request, response, medicao):
+        total_ms = medicao.total_ms()
+        registrar_duracao('requisicao', total_ms)
+
+        etapas = {}
+        for nome, duracao in medicao.etapas:
+            etapas[nome] = round(etapas.get(nome, 0) + duracao, 1)
+
+        match = getattr(request, 'resolver_match', None)
+        logger.info(json.dumps({
+            'metodo': request.method,
+            'caminho': request.path,
+            'rota': match.url_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 1),
+            'etapas': etapas,
+        }, ensure_ascii=False))
+
+
+class MetricasMiddleware:
+    """Latência e número de consultas ao banco por requisição, agrupados pelo nome da URL"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        consultas = [0]
+
+        def contar_consulta(execute, sql, params, many, context):
+            consultas[0] += 1
+            return execute(sql, params, many, context)
+
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(contar_consulta):
+            response = self.get_response(request)
+        duracao = time.perf_counter() - inicio
+
+        match = getattr(request, 'resolver_match', None)
+        rota = (match.url_name or 'sem_nome') if match else 'nao_encontrada'
+        registrar_requisicao(rota, request.method, response.status_code, duracao, consultas[0])
+        return response
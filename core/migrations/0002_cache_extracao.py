@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheExtracao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(help_text='SHA-256 do conteúdo do PDF', max_length=64, unique=True)),
+                ('dados', models.JSONField(help_text='Resultado da extração')),
+                ('acessos', models.IntegerField(default=0, help_text='Quantidade de vezes que o resultado foi reaproveitado')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('ultimo_acesso', models.DateTimeField(auto_now_add=True, db_index=True, help_text='Data do último acesso (usada na remoção por tamanho)')),
+            ],
+            options={
+                'verbose_name': 'Cache de Extração',
+                'verbose_name_plural': 'Caches de Extração',
+                'db_table': 'cache_extracao',
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_cache_extracao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobExtracao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('arquivo', models.FileField(blank=True, help_text='PDF enviado (removido após o processamento)', upload_to='jobs/%Y/%m/')),
+                ('nome_arquivo', models.CharField(help_text='Nome original do arquivo', max_length=255)),
+                ('sha256', models.CharField(blank=True, help_text='SHA-256 calculado no upload', max_length=64)),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('PROCESSANDO', 'Processando'), ('CONCLUIDO', 'Concluído'), ('ERRO', 'Erro')], default='PENDENTE', help_text='Situação do job', max_length=20)),
+                ('etapa', models.CharField(blank=True, help_text='Etapa atual do processamento', max_length=50)),
+                ('resultado', models.JSONField(blank=True, help_text='Resultado da extração', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('concluido_em', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Job de Extração',
+                'verbose_name_plural': 'Jobs de Extração',
+                'db_table': 'job_extracao',
+                'indexes': [models.Index(fields=['status', 'created_at'], name='job_extraca_status_6b1453_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_job_extracao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimentocontas',
+            name='identificacao_nf',
+            field=models.CharField(blank=True, help_text='CNPJ do emitente, série e número da nota fiscal (impede lançamento duplicado)', max_length=40, null=True, unique=True),
+        ),
+    ]
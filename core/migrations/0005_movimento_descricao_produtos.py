@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_movimento_identificacao_nf'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimentocontas',
+            name='descricao_produtos',
+            field=models.TextField(blank=True, default='', help_text='Produtos da nota fiscal, um por linha (usados no treino do classificador de despesas)'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:20
+
+from django.db import migrations, models
+
+from core.normalizacao import normalizar_descricao
+
+
+def preencher_descricao_normalizada(apps, schema_editor):
+    Classificacao = apps.get_model('core', 'Classificacao')
+    classificacoes = list(Classificacao.objects.only('id', 'descricao'))
+    for classificacao in classificacoes:
+        classificacao.descricao_normalizada = normalizar_descricao(classificacao.descricao)
+    Classificacao.objects.bulk_update(classificacoes, ['descricao_normalizada'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_movimento_descricao_produtos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classificacao',
+            name='descricao_normalizada',
+            field=models.CharField(default='', editable=False, help_text='Descrição sem acentos e em maiúsculas (usada nas consultas)', max_length=100),
+        ),
+        migrations.RunPython(preencher_descricao_normalizada, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='classificacao',
+            index=models.Index(fields=['tipo', 'descricao_normalizada'], name='classificac_tipo_c0c422_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pessoas',
+            index=models.Index(fields=['tipo', 'cnpj_cpf'], name='pessoas_tipo_fcf088_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_classificacao_descricao_normalizada'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jobextracao',
+            name='tentativas',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Vezes em que o job foi reservado por um worker'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+from core.normalizacao import normalizar_documento
+
+
+def normalizar_cnpj_cpf(apps, schema_editor):
+    """
+    Regrava Pessoas.cnpj_cpf com normalizar_documento: antes só pontos, barra e hífen eram
+    removidos, e as consultas passaram a comparar o documento normalizado
+    Um documento cuja forma normalizada já pertence a outra pessoa é mantido como está
+    (cnpj_cpf é único); a duplicidade fica para ser resolvida no cadastro
+    """
+    Pessoas = apps.get_model('core', 'Pessoas')
+    pessoas = list(Pessoas.objects.exclude(cnpj_cpf__isnull=True).exclude(cnpj_cpf='').only('id', 'cnpj_cpf'))
+    ocupados = {pessoa.cnpj_cpf for pessoa in pessoas}
+    alteradas = []
+    for pessoa in pessoas:
+        normalizado = normalizar_documento(pessoa.cnpj_cpf)
+        if normalizado == pessoa.cnpj_cpf or not normalizado or normalizado in ocupados:
+            continue
+        ocupados.discard(pessoa.cnpj_cpf)
+        ocupados.add(normalizado)
+        pessoa.cnpj_cpf = normalizado
+        alteradas.append(pessoa)
+    Pessoas.objects.bulk_update(alteradas, ['cnpj_cpf'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_job_extracao_tentativas'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalizar_cnpj_cpf, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,9 @@
 from django.db import models
 from django.core.validators import MinValueValidator
 
+from .normalizacao import normalizar_descricao, normalizar_documento
+from .parcelamento import calcular_vencimentos, dividir_valor
+
 class Pessoas(models.Model):
     """
     Model para armazenar pessoas (fornecedores, clientes, faturados)
@@ -27,10 +30,17 @@ class Pessoas(models.Model):
         db_table = 'pessoas'
         verbose_name = 'Pessoa'
         verbose_name_plural = 'Pessoas'
+        indexes = [models.Index(fields=['tipo', 'cnpj_cpf'])]
         
     def __str__(self):
         return f"{self.razao_social}"
     
+    def save(self, *args, **kwargs):
+        # Documento sempre sem máscara: as consultas comparam por igualdade no índice
+        if self.cnpj_cpf:
+            self.cnpj_cpf = normalizar_documento(self.cnpj_cpf)
+        super().save(*args, **kwargs)
+    
     def inativar(self):
         """Método para inativar um cadastro (regra de negócio)"""
         self.ativo = False
@@ -54,6 +64,7 @@ class Classificacao(models.Model):
     
     tipo = models.CharField(max_length=20, choices=TIPO_CHOICES, help_text="Tipo: Receita ou Despesa")
     descricao = models.CharField(max_length=100, help_text="Descrição da classificação")
+    descricao_normalizada = models.CharField(max_length=100, editable=False, default='', help_text="Descrição sem acentos e em maiúsculas (usada nas consultas)")
     ativo = models.BooleanField(default=True, help_text="Indica se a classificação está ativa")
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -61,9 +72,14 @@ class Classificacao(models.Model):
         db_table = 'classificacao'
         verbose_name = 'Classificação'
         verbose_name_plural = 'Classificações'
+        indexes = [models.Index(fields=['tipo', 'descricao_normalizada'])]
         
     def __str__(self):
         return self.descricao
+    
+    def save(self, *args, **kwargs):
+        self.descricao_normalizada = normalizar_descricao(self.descricao)
+        super().save(*args, **kwargs)
 
 
 class MovimentoContas(models.Model):
@@ -89,6 +105,8 @@ class MovimentoContas(models.Model):
     data_emissao = models.DateField(help_text="Data de emissão")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ABERTO', help_text="Status do movimento")
     ativo = models.BooleanField(default=True, help_text="Indica se o movimento está ativo")
+    descricao_produtos = models.TextField(blank=True, default='', help_text="Produtos da nota fiscal, um por linha (usados no treino do classificador de despesas)")
+    identificacao_nf = models.CharField(max_length=40, unique=True, blank=True, null=True, help_text="CNPJ do emitente, série e número da nota fiscal (impede lançamento duplicado)")
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -103,34 +121,24 @@ class MovimentoContas(models.Model):
         """
         Método para criar as parcelas automaticamente
         Implementa a regra: parcelas com data de vencimento distinto
+        Vencimentos mensais a partir da emissão (ajustados ao fim do mês), valores em centavos
+        exatos que somam o total, gravados com um único INSERT
         """
         if self.quantidade_parcelas > 1:
-            valor_parcela = self.valor_total / self.quantidade_parcelas
-            data_base = self.data_emissao
+            vencimentos = calcular_vencimentos(self.data_emissao, self.quantidade_parcelas)
+            valores = dividir_valor(self.valor_total, self.quantidade_parcelas)
             
-            for i in range(self.quantidade_parcelas):
-                # Calcula vencimento (mês seguinte para cada parcela)
-                if i == 0:
-                    data_vencimento = data_base
-                else:
-                    # Adiciona um mês para cada parcela
-                    mes = data_base.month + i
-                    ano = data_base.year
-                    while mes > 12:
-                        mes -= 12
-                        ano += 1
-                    data_vencimento = data_base.replace(year=ano, month=mes)
-                
-                # Cria identificação única para a parcela
-                identificacao = f"{self.id}-{i+1:03d}-{data_vencimento.strftime('%Y%m')}"
-                
-                ParcelaContas.objects.create(
+            ParcelaContas.objects.bulk_create([
+                ParcelaContas(
                     movimento=self,
-                    numero_parcela=i+1,
+                    numero_parcela=i + 1,
                     valor_parcela=valor_parcela,
                     data_vencimento=data_vencimento,
-                    identificacao_unica=identificacao
+                    # Identificação única da parcela
+                    identificacao_unica=f"{self.id}-{i+1:03d}-{data_vencimento.strftime('%Y%m')}"
                 )
+                for i, (data_vencimento, valor_parcela) in enumerate(zip(vencimentos, valores))
+            ])
 
 
 class ParcelaContas(models.Model):
@@ -178,3 +186,56 @@ class MovimentoClassificacao(models.Model):
         
     def __str__(self):
         return str(self.classificacao)
+
+
+class CacheExtracao(models.Model):
+    """
+    Model para o cache persistente de resultados de extração
+    Indexado pelo SHA-256 do PDF: reenvios do mesmo arquivo não repetem a leitura nem a consulta ao Gemini
+    """
+    sha256 = models.CharField(max_length=64, unique=True, help_text="SHA-256 do conteúdo do PDF")
+    dados = models.JSONField(help_text="Resultado da extração")
+    acessos = models.IntegerField(default=0, help_text="Quantidade de vezes que o resultado foi reaproveitado")
+    created_at = models.DateTimeField(auto_now_add=True)
+    ultimo_acesso = models.DateTimeField(auto_now_add=True, db_index=True, help_text="Data do último acesso (usada na remoção por tamanho)")
+    
+    class Meta:
+        db_table = 'cache_extracao'
+        verbose_name = 'Cache de Extração'
+        verbose_name_plural = 'Caches de Extração'
+        
+    def __str__(self):
+        return self.sha256
+
+
+class JobExtracao(models.Model):
+    """
+    Model para a fila de extrações assíncronas
+    O upload é gravado e processado pelo comando `processar_jobs`, sem segurar a requisição HTTP
+    """
+    STATUS_CHOICES = [
+        ('PENDENTE', 'Pendente'),
+        ('PROCESSANDO', 'Processando'),
+        ('CONCLUIDO', 'Concluído'),
+        ('ERRO', 'Erro'),
+    ]
+    
+    arquivo = models.FileField(upload_to='jobs/%Y/%m/', blank=True, help_text="PDF enviado (removido após o processamento)")
+    nome_arquivo = models.CharField(max_length=255, help_text="Nome original do arquivo")
+    sha256 = models.CharField(max_length=64, blank=True, help_text="SHA-256 calculado no upload")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDENTE', help_text="Situação do job")
+    etapa = models.CharField(max_length=50, blank=True, help_text="Etapa atual do processamento")
+    resultado = models.JSONField(blank=True, null=True, help_text="Resultado da extração")
+    created_at = models.DateTimeField(auto_now_add=True)
+    iniciado_em = models.DateTimeField(blank=True, null=True)
+    concluido_em = models.DateTimeField(blank=True, null=True)
+    tentativas = models.PositiveSmallIntegerField(default=0, help_text="Vezes em que o job foi reservado por um worker")
+    
+    class Meta:
+        db_table = 'job_extracao'
+        verbose_name = 'Job de Extração'
+        verbose_name_plural = 'Jobs de Extração'
+        indexes = [models.Index(fields=['status', 'created_at'])]
+        
+    def __str__(self):
+        return f"Job {self.id} - {self.nome_arquivo}"
@@ -0,0 +1,182 @@
+import io
+import logging
+import os
+import xml.etree.ElementTree as ET
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import IO, Any, Dict, List, Union
+
+from django.conf import settings
+
+from .agents.backend import obter_agente
+from .agents.classificador import classificar_despesa, texto_classificacao
+from .agents.extrator_regras import formatar_cnpj, formatar_cpf, somente_digitos
+from .duplicidade import identificar_dados, movimento_existente
+from .timing import medir
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE_NFE = 'http://www.portalfiscal.inf.br/nfe'
+
+# (tag pai, tag) -> valor lido; só a primeira ocorrência de cada caminho é usada
+CAMINHOS = {
+    ('ide', 'nNF'): 'numero',
+    ('ide', 'serie'): 'serie',
+    ('ide', 'dhEmi'): 'emissao',
+    ('ide', 'dEmi'): 'emissao',  # layout 2.00
+    ('emit', 'CNPJ'): 'emit_cnpj',
+    ('emit', 'CPF'): 'emit_cpf',
+    ('emit', 'xNome'): 'emit_nome',
+    ('emit', 'xFant'): 'emit_fantasia',
+    ('dest', 'CNPJ'): 'dest_cnpj',
+    ('dest', 'CPF'): 'dest_cpf',
+    ('dest', 'xNome'): 'dest_nome',
+    ('ICMSTot', 'vNF'): 'valor_total',
+    ('infProt', 'chNFe'): 'chave',
+}
+
+# Elementos repetidos: descartados da árvore assim que lidos
+REPETIDOS = ('det', 'dup')
+
+
+def eh_nfe_xml(arquivo) -> bool:
+    nome = getattr(arquivo, 'name', '') or ''
+    return nome.lower().endswith('.xml')
+
+
+def _documento(cnpj: str, cpf: str) -> str:
+    if cnpj:
+        return formatar_cnpj(somente_digitos(cnpj))
+    if cpf:
+        return formatar_cpf(somente_digitos(cpf))
+    return ''
+
+
+def _data_br(valor: str) -> str:
+    # dhEmi/dVenc vêm em ISO (AAAA-MM-DD, com ou sem hora e fuso)
+    try:
+        return date.fromisoformat(valor[:10]).strftime('%d/%m/%Y')
+    except ValueError:
+        return ''
+
+
+def _valor_br(valor: str) -> str:
+    try:
+        numero = Decimal(valor)
+    except InvalidOperation:
+        return ''
+    return f"{numero:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def ler_nfe_xml(origem: Union[str, os.PathLike, bytes, IO[bytes]]) -> Dict[str, Any]:
+    """
+    Lê a NF-e (nfeProc ou NFe) com iterparse, em memória constante: cada item (det)
+    e duplicata (dup) é retirado da árvore depois de lido
+    Devolve os campos no mesmo formato do resultado de processar_pdf
+    """
+    if isinstance(origem, (bytes, bytearray)):
+        origem = io.BytesIO(origem)
+    elif hasattr(origem, 'seek'):
+        origem.seek(0)
+
+    valores: Dict[str, str] = {}
+    produtos: Dict[str, None] = {}  # conjunto ordenado das descrições
+    vencimentos: List[str] = []
+    pilha = []
+    for evento, elem in ET.iterparse(origem, events=('start', 'end')):
+        namespace, _, nome = elem.tag.rpartition('}')
+        if evento == 'start':
+            if not pilha and (namespace.lstrip('{') != NAMESPACE_NFE or nome not in ('nfeProc', 'NFe')):
+                raise ValueError("O XML não é uma NF-e")
+            if nome == 'infNFe':
+                valores.setdefault('id', elem.get('Id', ''))
+            pilha.append((nome, elem))
+            continue
+
+        pilha.pop()
+        pai = pilha[-1][0] if pilha else ''
+        texto = (elem.text or '').strip()
+        campo = CAMINHOS.get((pai, nome))
+        if campo:
+            valores.setdefault(campo, texto)
+        elif (pai, nome) == ('prod', 'xProd') and texto:
+            produtos[texto] = None
+        elif (pai, nome) == ('dup', 'dVenc'):
+            vencimentos.append(texto)
+        if nome in REPETIDOS and pilha:
+            pilha[-1][1].remove(elem)
+
+    if not valores:
+        raise ValueError("O XML não é uma NF-e")
+
+    chave = somente_digitos(valores.get('chave') or valores.get('id', ''))
+    dados: Dict[str, Any] = {
+        'fornecedor': {
+            'razao_social': valores.get('emit_nome', ''),
+            'nome_fantasia': valores.get('emit_fantasia', ''),
+            'cnpj': _documento(valores.get('emit_cnpj', ''), valores.get('emit_cpf', '')),
+        },
+        # Destinatário pessoa jurídica também vai no campo cpf, que é o usado na validação
+        'faturado': {
+            'nome_completo': valores.get('dest_nome', ''),
+            'cpf': _documento(valores.get('dest_cnpj', ''), valores.get('dest_cpf', '')),
+        },
+        'numero_nota_fiscal': valores.get('numero', '').lstrip('0') or valores.get('numero', ''),
+        'serie': valores.get('serie', ''),
+        'data_emissao': _data_br(valores.get('emissao', '')),
+        'descricao_produtos': list(produtos),
+        'quantidade_parcelas': len(vencimentos) or 1,
+        'data_vencimento': _data_br(vencimentos[0]) if vencimentos else '',
+        'valor_total': _valor_br(valores.get('valor_total', '')),
+        'classificacao_despesa': [],
+    }
+    if len(chave) == 44:
+        dados['chave_acesso'] = chave
+    return dados
+
+
+def _classificar(texto: str) -> List[str]:
+    """Pede ao LLM só a classificação da despesa, a partir do emitente e dos produtos"""
+    try:
+        resposta = obter_agente().extrair_dados(texto, campos=['classificacao_despesa'])
+    except Exception as e:
+        logger.warning("Classificação da NF-e indisponível: %s", e)
+        return []
+    if 'erro' in resposta:
+        logger.warning("Classificação da NF-e falhou: %s", resposta['erro'])
+        return []
+    return resposta.get('classificacao_despesa') or []
+
+
+def processar_nfe_xml(origem: Union[str, os.PathLike, bytes, IO[bytes]]) -> Dict[str, Any]:
+    """
+    Extrai os dados direto do XML autorizado, sem leitura de PDF
+    O LLM só é consultado para a classificação da despesa (NFE_XML_LLM_CLASSIFICATION)
+    """
+    try:
+        with medir('xml'):
+            dados = ler_nfe_xml(origem)
+    except (ET.ParseError, ValueError) as e:
+        return {"erro": "XML de NF-e inválido", "detalhes": str(e)}
+
+    movimento_id = movimento_existente(identificar_dados(dados))
+    if movimento_id:
+        return {**dados, 'duplicada': True, 'movimento_id': movimento_id, 'em_cache': False}
+
+    texto = texto_classificacao(dados['fornecedor']['razao_social'], dados['descricao_produtos'])
+    with medir('classificador'):
+        dados['classificacao_despesa'] = classificar_despesa(texto)
+    campos_classificador = ['classificacao_despesa'] if dados['classificacao_despesa'] else []
+
+    campos_llm = []
+    if not campos_classificador and getattr(settings, 'NFE_XML_LLM_CLASSIFICATION', True) and dados['descricao_produtos']:
+        with medir('llm'):
+            dados['classificacao_despesa'] = _classificar(texto)
+        campos_llm = ['classificacao_despesa']
+
+    dados['origem_campos'] = {
+        'xml': [campo for campo in dados if campo not in campos_llm + campos_classificador],
+        'classificador': campos_classificador,
+        'llm': campos_llm,
+    }
+    return {**dados, 'em_cache': False}
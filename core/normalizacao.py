@@ -0,0 +1,16 @@
+import unicodedata
+
+
+def sem_acentos(texto: str) -> str:
+    """Remove acentos e converte para maiúsculas (comparação de rótulos e descrições)"""
+    return unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode('ascii').upper()
+
+
+def normalizar_documento(documento: str) -> str:
+    """CNPJ/CPF sem máscara (pontos, barra, hífen e espaços), como gravado em Pessoas.cnpj_cpf"""
+    return ''.join(c for c in str(documento or '') if c.isalnum()).upper()
+
+
+def normalizar_descricao(descricao: str) -> str:
+    """Descrição sem acentos, em maiúsculas e com espaços simples (Classificacao.descricao_normalizada)"""
+    return ' '.join(sem_acentos(str(descricao or '')).split())
@@ -0,0 +1,26 @@
+import io
+from typing import List, Union
+
+import pdfplumber
+
+# Separa o texto de uma página do da seguinte no texto extraído. O form feed é quebra de linha
+# para str.splitlines e espaço para \s nas regex, então quem lê por linhas não é afetado
+SEPARADOR_PAGINA = "\f"
+
+# Funções executadas nos processos do pool de extração. O pool usa "spawn": o filho importa
+# só este módulo, sem Django, em vez de herdar por fork o estado (conexões, threads) do worker
+
+
+def extrair_texto_pagina(pagina) -> str:
+    try:
+        return pagina.extract_text() or ""
+    except Exception:
+        return ""
+
+
+def extrair_intervalo(fonte: Union[str, bytes], inicio: int, fim: int) -> List[str]:
+    # Cada processo abre o arquivo e lê só o seu intervalo de páginas
+    if isinstance(fonte, bytes):
+        fonte = io.BytesIO(fonte)
+    with pdfplumber.open(fonte) as pdf:
+        return [extrair_texto_pagina(pdf.pages[i]) for i in range(inicio, fim)]
@@ -0,0 +1,30 @@
+import calendar
+from datetime import date
+from decimal import ROUND_DOWN, Decimal
+from typing import List
+
+CENTAVO = Decimal('0.01')
+
+
+def somar_meses(data: date, meses: int) -> date:
+    """Mesmo dia `meses` depois; dias 29 a 31 caem no último dia dos meses mais curtos"""
+    indice = data.month - 1 + meses
+    ano, mes = data.year + indice // 12, indice % 12 + 1
+    return date(ano, mes, min(data.day, calendar.monthrange(ano, mes)[1]))
+
+
+def calcular_vencimentos(primeiro_vencimento: date, quantidade: int) -> List[date]:
+    """Vencimentos mensais a partir do primeiro (sempre contados dele, sem acumular o ajuste de fim de mês)"""
+    return [somar_meses(primeiro_vencimento, i) for i in range(quantidade)]
+
+
+def dividir_valor(total, quantidade: int) -> List[Decimal]:
+    """
+    Divide o total em parcelas de centavos exatos; a sobra da divisão vai para a
+    primeira parcela, então a soma das parcelas é sempre igual ao total
+    """
+    total = Decimal(str(total)).quantize(CENTAVO)
+    parcela = (total / quantidade).quantize(CENTAVO, rounding=ROUND_DOWN)
+    valores = [parcela] * quantidade
+    valores[0] = total - parcela * (quantidade - 1)
+    return valores
@@ -1,26 +1,405 @@
+import hashlib
+import io
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import closing, nullcontext
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
 import pdfplumber
-from typing import Any, Dict
+from django.conf import settings
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdftypes import resolve1
+from pdfplumber.page import Page
+
+from .agents.backend import obter_agente, resultado_extracao
+from .agents.classificador import classificar_despesa, texto_classificacao_danfe
+from .agents.extrator_regras import ExtratorRegras, campos_pendentes
+from .agents.prompt import CAMPOS_ESQUEMA
+from .cache import buscar_resultado, salvar_resultado
+from .duplicidade import identificar_dados, movimento_existente
+from .memoria import rss_atual_kb
+from .metricas import registrar_extracao, registrar_pdf
+from .normalizacao import sem_acentos
+from .paginas_pdf import SEPARADOR_PAGINA, extrair_intervalo, extrair_texto_pagina
+from .timing import medir
+
+# Caminho em disco, bytes em memória ou arquivo aberto (inclusive UploadedFile do Django)
+FontePDF = Union[str, os.PathLike, bytes, IO[bytes]]
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _obter_executor(max_workers: int) -> ProcessPoolExecutor:
+    """Pool de processos compartilhado pelo worker (criado sob demanda)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context('spawn'))
+        return _executor
+
+
+def _descartar_executor(executor: ProcessPoolExecutor):
+    """Tira do ar um pool quebrado (filho morto por OOM/sinal); o próximo uso cria outro"""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _normalizar_fonte(origem: FontePDF) -> Union[str, IO[bytes]]:
+    """
+    Converte a origem recebida em algo que o pdfplumber abre diretamente:
+    um caminho ou um stream posicionável
+    """
+    if isinstance(origem, (str, os.PathLike)):
+        return os.fspath(origem)
+    if isinstance(origem, (bytes, bytearray, memoryview)):
+        return io.BytesIO(origem)
+    # Uploads grandes já foram gravados pelo Django em um temporário de nome único
+    if hasattr(origem, 'temporary_file_path'):
+        return origem.temporary_file_path()
+    if getattr(origem, 'seekable', lambda: False)():
+        origem.seek(0)
+        return origem
+    # Stream sem seek: copia para um temporário em memória que só vai ao disco se crescer
+    limite = getattr(settings, 'FILE_UPLOAD_MAX_MEMORY_SIZE', 2621440)
+    spool = tempfile.SpooledTemporaryFile(max_size=limite)
+    shutil.copyfileobj(origem, spool)
+    spool.seek(0)
+    return spool
+
 
-from .agents.agent_1 import AgenteGemini
+def _paginas_sob_demanda(pdf) -> Iterator[Page]:
+    """Cria as páginas uma a uma, sem montar a lista completa de pdf.pages"""
+    doctop = 0
+    for numero, objeto in enumerate(PDFPage.create_pages(pdf.doc), start=1):
+        pagina = Page(pdf, objeto, page_number=numero, initial_doctop=doctop)
+        doctop += pagina.height
+        yield pagina
+
+
+def _contar_paginas(pdf) -> Optional[int]:
+    # /Count da árvore de páginas: lido sem instanciar nenhuma página
+    try:
+        return int(resolve1(resolve1(pdf.doc.catalog['Pages'])['Count']))
+    except Exception:
+        return None
+
+
+class PoliticaExtracao:
+    """
+    Decide quando parar de ler páginas da DANFE
+    Os campos pedidos ao Gemini ficam no cabeçalho (emitente/destinatário) e no quadro de totais,
+    quase sempre na primeira página; as páginas de continuação só trazem mais produtos
+    """
+    BLOCOS = {
+        'cabecalho': ('CHAVE DE ACESSO', 'NATUREZA DA OPERACAO'),
+        'destinatario': ('DESTINATARIO',),
+        'totais': ('VALOR TOTAL DA NOTA', 'CALCULO DO IMPOSTO'),
+    }
+
+    def __init__(self, max_paginas: Optional[int] = None):
+        self.max_paginas = max_paginas or getattr(settings, 'PDF_EARLY_EXIT_MAX_PAGES', 3)
+        self.blocos_vistos = set()
+        self.paginas_lidas = 0
+
+    def deve_parar(self, texto_pagina: str) -> bool:
+        self.paginas_lidas += 1
+        texto = sem_acentos(texto_pagina)
+        for bloco, marcadores in self.BLOCOS.items():
+            if any(marcador in texto for marcador in marcadores):
+                self.blocos_vistos.add(bloco)
+        return len(self.blocos_vistos) == len(self.BLOCOS) or self.paginas_lidas >= self.max_paginas
+
+
+class LimitePDFExcedido(Exception):
+    """PDF recusado por passar de um limite configurado (páginas, bytes ou memória do worker)"""
 
 
 class ProcessadorPDF:
-    def extrair_texto_pdf(self, pdf_path: str) -> str:
-        texto = ""
-        with pdfplumber.open(pdf_path) as pdf:
-            for pagina in pdf.pages:
-                try:
-                    txt = pagina.extract_text() or ""
-                except Exception:
-                    txt = ""
-                if txt:
-                    texto += txt + "\n"
-        return texto.strip()
-
-
-def processar_pdf(pdf_path: str) -> Dict[str, Any]:
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        paginas_paralelo: Optional[int] = None,
+        baixa_memoria: Optional[bool] = None,
+    ):
+        self.max_workers = max_workers or getattr(settings, 'PDF_PARALLEL_WORKERS', 2)
+        self.paginas_paralelo = paginas_paralelo or getattr(settings, 'PDF_PARALLEL_MIN_PAGES', 8)
+        self.baixa_memoria = getattr(settings, 'PDF_LOW_MEMORY', False) if baixa_memoria is None else baixa_memoria
+        self.max_caracteres = getattr(settings, 'PDF_LOW_MEMORY_MAX_CHARS', 200000)
+        self.max_paginas = getattr(settings, 'PDF_MAX_PAGES', 500)
+        self.max_rss_kb = getattr(settings, 'PDF_MAX_RSS_MB', 1024) * 1024
+        # Total de páginas do último PDF aberto (mesmo quando a leitura parou antes do fim)
+        self.total_paginas = 0
+        self.rss_inicial_kb = self.rss_pico_kb = 0
+
+    def _verificar_paginas(self, total: Optional[int]):
+        if total and self.max_paginas and total > self.max_paginas:
+            raise LimitePDFExcedido(f"O PDF tem {total} páginas (limite: {self.max_paginas})")
+
+    def _verificar_memoria(self):
+        rss = rss_atual_kb()
+        self.rss_pico_kb = max(self.rss_pico_kb, rss)
+        if self.max_rss_kb and rss > self.max_rss_kb:
+            raise LimitePDFExcedido(
+                f"Memória do worker em {rss // 1024} MB durante a leitura (limite: {self.max_rss_kb // 1024} MB)"
+            )
+
+    def iterar_paginas(self, origem: FontePDF) -> Iterator[str]:
+        """
+        Gera o texto de cada página sob demanda; o arquivo fica aberto só enquanto houver leitura
+        Cada página é criada só quando chega a vez dela e seus objetos de layout são liberados
+        logo depois da extração; os limites de páginas e de memória são conferidos a cada página
+        """
+        fonte = _normalizar_fonte(origem)
+        self.rss_inicial_kb = self.rss_pico_kb = rss_atual_kb()
+        with pdfplumber.open(fonte) as pdf:
+            self.total_paginas = _contar_paginas(pdf) or 0
+            self._verificar_paginas(self.total_paginas)
+            for pagina in _paginas_sob_demanda(pdf):
+                self._verificar_paginas(pagina.page_number)
+                texto = extrair_texto_pagina(pagina)
+                pagina.close()
+                self._verificar_memoria()
+                yield texto
+
+    def extrair_texto_pdf(self, origem: FontePDF, politica: Optional[PoliticaExtracao] = None) -> str:
+        # Os limites de páginas, memória e caracteres valem em todos os caminhos de leitura
+        if politica is not None:
+            return self._juntar_limitado(self._ler_ate_politica(origem, politica))
+        if self.baixa_memoria:
+            return self._juntar_limitado(self.iterar_paginas(origem))
+
+        fonte = _normalizar_fonte(origem)
+        self.rss_inicial_kb = self.rss_pico_kb = rss_atual_kb()
+        with pdfplumber.open(fonte) as pdf:
+            self._verificar_paginas(_contar_paginas(pdf))
+            total_paginas = self.total_paginas = len(pdf.pages)
+            if self.max_workers <= 1 or total_paginas < self.paginas_paralelo:
+                textos = [extrair_texto_pagina(pagina) for pagina in pdf.pages]
+                self._verificar_memoria()
+                return self._juntar_limitado(iter(textos))
+        textos = self._extrair_paralelo(fonte, total_paginas)
+        self._verificar_memoria()
+        return self._juntar_limitado(iter(textos))
+
+    def _juntar_limitado(self, paginas: Iterator[str]) -> str:
+        """
+        Junta o texto das páginas até PDF_LOW_MEMORY_MAX_CHARS (0 desativa), lendo a próxima
+        página só se ainda houver espaço. Guarda apenas os trechos aproveitados e monta a
+        string uma única vez; o que passar do limite é descartado: o prompt usa bem menos
+        que isso e cabeçalho e totais ficam nas primeiras páginas
+        """
+        trechos: List[str] = []
+        restante = self.max_caracteres or None
+        try:
+            for texto in paginas:
+                if texto:
+                    trecho = texto[:restante] if restante else texto
+                    trechos.append(trecho)
+                    if restante:
+                        restante -= len(trecho)
+                if restante is not None and restante <= 0:
+                    break
+        finally:
+            fechar = getattr(paginas, 'close', None)
+            if fechar:
+                fechar()
+        return SEPARADOR_PAGINA.join(trechos).strip()
+
+    def memoria(self) -> Dict[str, int]:
+        """Memória do worker durante a última leitura, informada nos metadados do resultado"""
+        return {'rss_inicial_kb': self.rss_inicial_kb, 'rss_pico_kb': self.rss_pico_kb}
+
+    def _ler_ate_politica(self, origem: FontePDF, politica: PoliticaExtracao) -> Iterator[str]:
+        """
+        Páginas até a política mandar parar; em paralelo quando o limite de páginas da política
+        (PDF_EARLY_EXIT_MAX_PAGES) chega a PDF_PARALLEL_MIN_PAGES
+        """
+        if self.max_workers > 1 and politica.max_paginas >= self.paginas_paralelo:
+            paginas = self._ler_em_blocos(origem, politica.max_paginas)
+        else:
+            paginas = self.iterar_paginas(origem)
+        with closing(paginas):
+            for texto in paginas:
+                yield texto
+                if politica.deve_parar(texto):
+                    return
+
+    def _ler_em_blocos(self, origem: FontePDF, limite: int) -> Iterator[str]:
+        """
+        Leitura antecipada em paralelo: blocos de PDF_PARALLEL_WORKERS páginas, uma por processo,
+        entregues na ordem; o bloco seguinte só é pedido se a política ainda não mandou parar,
+        então no máximo PDF_PARALLEL_WORKERS - 1 páginas são lidas além do necessário
+        """
+        fonte = _normalizar_fonte(origem)
+        with pdfplumber.open(fonte) as pdf:
+            total_paginas = _contar_paginas(pdf) or len(pdf.pages)
+        self._verificar_paginas(total_paginas)
+        ultima = min(total_paginas, limite)
+        if ultima < self.paginas_paralelo:
+            yield from self.iterar_paginas(fonte)
+            return
+
+        self.total_paginas = total_paginas
+        self.rss_inicial_kb = self.rss_pico_kb = rss_atual_kb()
+        fonte = self._fonte_para_processos(fonte)
+        for inicio in range(0, ultima, self.max_workers):
+            paginas = range(inicio, min(inicio + self.max_workers, ultima))
+            textos = self._extrair_intervalos(fonte, [(pagina, pagina + 1) for pagina in paginas])
+            self._verificar_memoria()
+            yield from textos
+
+    def _fonte_para_processos(self, fonte: Union[str, IO[bytes]]) -> Union[str, bytes]:
+        if isinstance(fonte, str):
+            return fonte
+        # Streams não atravessam processos: os workers recebem o conteúdo em bytes
+        fonte.seek(0)
+        return fonte.read()
+
+    def _extrair_paralelo(self, fonte: Union[str, IO[bytes]], total_paginas: int) -> List[str]:
+        """Divide as páginas em intervalos contíguos e extrai cada um em um processo"""
+        tamanho = -(-total_paginas // self.max_workers)
+        intervalos = [
+            (inicio, min(inicio + tamanho, total_paginas))
+            for inicio in range(0, total_paginas, tamanho)
+        ]
+        return self._extrair_intervalos(self._fonte_para_processos(fonte), intervalos)
+
+    def _extrair_intervalos(self, fonte: Union[str, bytes], intervalos: List[Tuple[int, int]]) -> List[str]:
+        """Texto dos intervalos contíguos de páginas, cada um em um processo do pool, na ordem"""
+        executor = _obter_executor(self.max_workers)
+        try:
+            futuros = [executor.submit(extrair_intervalo, fonte, inicio, fim) for inicio, fim in intervalos]
+            textos: List[str] = []
+            for futuro in futuros:
+                textos.extend(futuro.result())
+            return textos
+        except BrokenProcessPool:
+            inicio, fim = intervalos[0][0], intervalos[-1][1]
+            logger.warning("Pool de extração quebrado; lendo as %d páginas neste processo", fim - inicio)
+            _descartar_executor(executor)
+            return extrair_intervalo(fonte, inicio, fim)
+
+def tamanho_fonte(fonte: Union[str, IO[bytes]]) -> int:
+    if isinstance(fonte, str):
+        return os.path.getsize(fonte)
+    tamanho = fonte.seek(0, os.SEEK_END)
+    fonte.seek(0)
+    return tamanho
+
+
+def calcular_sha256(fonte: Union[str, IO[bytes]]) -> str:
+    hasher = hashlib.sha256()
+    if isinstance(fonte, str):
+        with open(fonte, 'rb') as arquivo:
+            for bloco in iter(lambda: arquivo.read(65536), b''):
+                hasher.update(bloco)
+    else:
+        fonte.seek(0)
+        for bloco in iter(lambda: fonte.read(65536), b''):
+            hasher.update(bloco)
+        fonte.seek(0)
+    return hasher.hexdigest()
+
+
+def processar_pdf(
+    origem: FontePDF,
+    sha256: Optional[str] = None,
+    progresso: Optional[Callable[[str], None]] = None,
+    limite_pdf=None,
+    limite_llm=None,
+) -> Dict[str, Any]:
+    """
+    Extrai os dados do PDF, reaproveitando o resultado de um envio anterior do mesmo arquivo
+    O hash pode vir pronto do upload (HashUploadHandler); senão é calculado aqui.
+    `progresso` recebe o nome de cada etapa (usado pelos jobs assíncronos);
+    `limite_pdf` e `limite_llm` (ex.: semáforos) limitam a concorrência de cada etapa no processamento em lote
+    """
+    progresso = progresso or (lambda etapa: None)
+    limite_pdf = limite_pdf or nullcontext()
+    limite_llm = limite_llm or nullcontext()
+    fonte = _normalizar_fonte(origem)
+    tamanho = tamanho_fonte(fonte)
+    max_bytes = getattr(settings, 'PDF_MAX_BYTES', 50 * 1024 * 1024)
+    if max_bytes and tamanho > max_bytes:
+        registrar_extracao('recusada')
+        return {"erro": "PDF recusado", "detalhes": f"O arquivo tem {tamanho} bytes (limite: {max_bytes})"}
+    if not sha256:
+        with medir('hash'):
+            sha256 = calcular_sha256(fonte)
+
+    with medir('cache'):
+        dados = buscar_resultado(sha256)
+    if dados is not None:
+        registrar_extracao('cache')
+        movimento_id = movimento_existente(identificar_dados(dados))
+        if movimento_id:
+            dados = {**dados, 'duplicada': True, 'movimento_id': movimento_id}
+        return {**dados, 'em_cache': True}
+
     processador = ProcessadorPDF()
-    agente = AgenteGemini()
-    texto = processador.extrair_texto_pdf(pdf_path)
-    dados = agente.extrair_dados(texto)
-    return dados
+    politica = PoliticaExtracao() if getattr(settings, 'PDF_EARLY_EXIT', True) else None
+    progresso('leitura_pdf')
+    try:
+        with limite_pdf, medir('pdf_texto'):
+            texto = processador.extrair_texto_pdf(fonte, politica=politica)
+    except LimitePDFExcedido as e:
+        registrar_extracao('recusada')
+        return {"erro": "PDF recusado", "detalhes": str(e), 'memoria': processador.memoria()}
+    except Exception as e:
+        # PDF corrompido ou fora do padrão: pdfminer/pdfplumber levantam exceções variadas
+        logger.warning("Falha ao ler o PDF %s: %r", sha256, e)
+        registrar_extracao('pdf_invalido')
+        return {"erro": "PDF inválido", "detalhes": f"Não foi possível ler o PDF: {e}"}
+
+    registrar_pdf(processador.total_paginas, tamanho)
+
+    # Campos de formato fixo saem das regras; o Gemini só recebe o que faltar
+    with medir('regras'):
+        dados_regras = ExtratorRegras().extrair(texto)
+
+    # Nota já lançada: devolve o movimento existente sem consultar o LLM
+    movimento_id = movimento_existente(identificar_dados(dados_regras))
+    if movimento_id:
+        registrar_extracao('duplicada')
+        logger.info("Extração %s: nota já lançada no movimento %d", sha256[:12], movimento_id)
+        return {**dados_regras, 'duplicada': True, 'movimento_id': movimento_id, 'memoria': processador.memoria(), 'em_cache': False}
+
+    # Classificador local treinado com os lançamentos; com confiança baixa o campo fica para o LLM
+    # Recebe o mesmo formato do treino (emitente e produtos), não a página inteira
+    with medir('classificador'):
+        classificacao = classificar_despesa(texto_classificacao_danfe(texto, dados_regras))
+    if classificacao:
+        dados_regras['classificacao_despesa'] = classificacao
+
+    pendentes = campos_pendentes(dados_regras, list(CAMPOS_ESQUEMA))
+    progresso('consulta_llm')
+    with limite_llm, medir('llm'):
+        # O agente só é resolvido quando há campos para o LLM: sem GEMINI_API_KEY as notas
+        # resolvidas por cache, regras ou duplicidade continuam funcionando
+        dados = obter_agente().extrair_dados(texto, campos=pendentes) if pendentes else {}
+    dados.update(dados_regras)
+    dados['origem_campos'] = {
+        'regras': [campo for campo in CAMPOS_ESQUEMA if campo in dados_regras and campo != 'classificacao_despesa'],
+        'classificador': ['classificacao_despesa'] if classificacao else [],
+        'llm': pendentes,
+    }
+    registrar_extracao(resultado_extracao(dados))
+    logger.info("Extração %s: %d campo(s) por regras, %d pelo LLM", sha256[:12], len(dados['origem_campos']['regras']), len(pendentes))
+
+    # Falhas não são guardadas para que um novo envio tente de novo
+    if 'erro' not in dados:
+        with medir('cache_gravar'):
+            salvar_resultado(sha256, dados)
+    return {**dados, 'memoria': processador.memoria(), 'em_cache': False}
@@ -1,3 +1,1164 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
+from decimal import Decimal
+from multiprocessing import get_context
+from unittest import mock
+
+from django.apps import apps as django_apps
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import numpy as np
+from prometheus_client import REGISTRY
+
+from core import services
+from core.agents.agente_falso import AgenteFalso
+from core.agents.backend import redefinir_agente
+from core.agents.classificador import ClassificadorDespesa, exemplos_lancados, texto_classificacao, texto_classificacao_danfe, vetorizar
+from core.agents.cliente_llm import CircuitoAberto, ClienteLLM, ErroLLM
+from core.agents.compactador import compactar_texto
+from core.agents.extrator_regras import ExtratorRegras, validar_chave_acesso, validar_cnpj, validar_cpf
+from core.benchmarks.corpus import gerar_documento
+from core.cache import buscar_resultado, salvar_resultado
+from core.cache_cadastros import CacheConsultas, invalidar_classificacoes, invalidar_pessoas, obter_cache
+from core.duplicidade import identificar_dados, identificar_nota, movimento_existente
+from core.importacao import importar_cadastros
+from core.indice_classificacoes import IndiceTrigramas, obter_indice, sugerir_classificacoes
+from core.jobs import reservar_proximo_job
+from core.models import CacheExtracao, Classificacao, JobExtracao, MovimentoClassificacao, MovimentoContas, Pessoas
+from core.nfe_xml import processar_nfe_xml
+from core.paginas_pdf import SEPARADOR_PAGINA
+from core.parcelamento import calcular_vencimentos, dividir_valor
+from core.services import LimitePDFExcedido, PoliticaExtracao, ProcessadorPDF, processar_pdf
+
+# Consultas de criar_lancamento com parcela única, sem depender da quantidade de classificações:
+# duplicidade, pessoas, classificações, savepoint, movimento, parcela, classificações do movimento, release
+ORCAMENTO_CONSULTAS_LANCAMENTO = 8
+
+
+@override_settings(CADASTROS_CACHE_ENABLED=False)
+class CriarLancamentoConsultasTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Pessoas.objects.create(tipo='FORNECEDOR', razao_social='FORNECEDOR TESTE', cnpj_cpf='11222333000181')
+        Pessoas.objects.create(tipo='FATURADO', razao_social='FATURADO TESTE', cnpj_cpf='12345678909')
+        for i in range(20):
+            Classificacao.objects.create(tipo='DESPESA', descricao=f'Categoria {i}')
+
+    def lancar(self, numero, classificacoes):
+        corpo = {
+            'fornecedor': {'cnpj': '11.222.333/0001-81'},
+            'faturado': {'cpf': '123.456.789-09'},
+            'nota_fiscal': {'numero': str(numero), 'serie': '1', 'valor': '1.000,00', 'data_emissao': '10/01/2025'},
+            'quantidade_parcelas': 1,
+            'classificacao_despesa': classificacoes,
+        }
+        resposta = self.client.post('/api/criar-lancamento/', json.dumps(corpo), content_type='application/json')
+        self.assertTrue(resposta.json().get('sucesso'), resposta.json())
+        return resposta.json()['id']
+
+    def test_consultas_nao_crescem_com_as_classificacoes(self):
+        for numero, quantidade in enumerate((1, 5, 20), start=1):
+            with self.subTest(classificacoes=quantidade):
+                with self.assertNumQueries(ORCAMENTO_CONSULTAS_LANCAMENTO):
+                    movimento_id = self.lancar(numero, [f'categoria {i}' for i in range(quantidade)])
+                self.assertEqual(MovimentoClassificacao.objects.filter(movimento_id=movimento_id).count(), quantidade)
+
+    def test_classificacao_inexistente_nao_gera_consulta_extra(self):
+        with self.assertNumQueries(ORCAMENTO_CONSULTAS_LANCAMENTO):
+            movimento_id = self.lancar(99, ['Categoria 1', 'Não cadastrada', 'CATEGORIA 2'])
+        self.assertEqual(MovimentoClassificacao.objects.filter(movimento_id=movimento_id).count(), 2)
+
+    @override_settings(CADASTROS_CACHE_ENABLED=True)
+    def test_cache_de_cadastros_reduz_consultas(self):
+        from core.cache_cadastros import invalidar_classificacoes, invalidar_pessoas
+
+        invalidar_pessoas()
+        invalidar_classificacoes()
+        classificacoes = [f'Categoria {i}' for i in range(10)]
+        self.lancar(1, classificacoes)
+        with CaptureQueriesContext(connection) as consultas:
+            self.lancar(2, classificacoes)
+        self.assertLessEqual(len(consultas), ORCAMENTO_CONSULTAS_LANCAMENTO - 2)
+
+
+@override_settings(CADASTROS_CACHE_ENABLED=False)
+class ValidarDocumentoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fornecedor = Pessoas.objects.create(tipo='FORNECEDOR', razao_social='FORNECEDOR TESTE', cnpj_cpf='11222333000181')
+        cls.faturado = Pessoas.objects.create(tipo='FATURADO', razao_social='FATURADO TESTE', cnpj_cpf='12345678909')
+        cls.combustiveis = Classificacao.objects.create(tipo='DESPESA', descricao='Combustíveis e Lubrificantes')
+        for i in range(10):
+            Classificacao.objects.create(tipo='DESPESA', descricao=f'Categoria {i}')
+
+    def setUp(self):
+        # Novo carimbo: o índice de sugestões é reconstruído com as classificações deste teste
+        invalidar_classificacoes()
+
+    def validar(self, corpo):
+        resposta = self.client.post('/api/validar-documento/', json.dumps(corpo), content_type='application/json')
+        self.assertEqual(resposta.status_code, 200)
+        return resposta.json()
+
+    def test_cadastros_encontrados(self):
+        with self.assertNumQueries(2):  # pessoas e classificações, uma consulta cada
+            dados = self.validar({
+                'fornecedor': {'cnpj': '11.222.333/0001-81'},
+                'faturado': {'cpf': '123.456.789-09'},
+                'classificacao_despesa': ['combustiveis e lubrificantes'] + [f'CATEGORIA {i}' for i in range(10)],
+            })
+        self.assertEqual(dados['fornecedor'], {
+            'existe': True, 'id': self.fornecedor.id, 'nome': 'FORNECEDOR TESTE',
+            'mensagem': 'Fornecedor encontrado: FORNECEDOR TESTE',
+        })
+        self.assertEqual((dados['faturado']['existe'], dados['faturado']['id']), (True, self.faturado.id))
+        self.assertEqual(len(dados['classificacoes']), 11)
+        self.assertTrue(all(c['existe'] for c in dados['classificacoes']))
+        self.assertEqual(dados['classificacoes'][0]['id'], self.combustiveis.id)
+
+    def test_cadastros_inexistentes_com_sugestoes(self):
+        corpo = {
+            'fornecedor': {'cnpj': '11.444.777/0001-61'},
+            'faturado': {'cpf': '529.982.247-25'},
+            'classificacao_despesa': ['Combustivel e Lubrificante', 'Sementes de Soja'],
+        }
+        # pessoas, classificações e a carga do índice de sugestões
+        with self.assertNumQueries(3):
+            dados = self.validar(corpo)
+        self.assertEqual(dados['fornecedor'], {'existe': False, 'mensagem': 'Fornecedor não encontrado no banco de dados'})
+        self.assertEqual(dados['faturado'], {'existe': False, 'mensagem': 'Faturado não encontrado no banco de dados'})
+
+        parecida, sem_sugestao = dados['classificacoes']
+        self.assertEqual(parecida['descricao'], 'Combustivel e Lubrificante')
+        self.assertFalse(parecida['existe'])
+        self.assertEqual([s['id'] for s in parecida['sugestoes']], [self.combustiveis.id])
+        self.assertEqual(parecida['sugestoes'][0]['descricao'], 'Combustíveis e Lubrificantes')
+        self.assertIn('Você quis dizer: "Combustíveis e Lubrificantes"?', parecida['mensagem'])
+        self.assertEqual(sem_sugestao['sugestoes'], [])
+        self.assertEqual(sem_sugestao['mensagem'], 'Classificação "Sementes de Soja" não encontrada')
+
+        # Com o índice carregado, as sugestões não consultam o banco
+        with self.assertNumQueries(2):
+            self.validar(corpo)
+
+    @override_settings(CADASTROS_CACHE_ENABLED=True)
+    def test_cache_de_cadastros_dispensa_consultas(self):
+        invalidar_pessoas()
+        corpo = {'fornecedor': {'cnpj': '11222333000181'}, 'faturado': {'cpf': '52998224725'}, 'classificacao_despesa': ['Categoria 1']}
+        with self.assertNumQueries(2):
+            self.validar(corpo)
+        with self.assertNumQueries(0):
+            dados = self.validar(corpo)
+        self.assertEqual((dados['fornecedor']['existe'], dados['faturado']['existe']), (True, False))
+
+    def test_metodo_nao_permitido(self):
+        self.assertEqual(self.client.get('/api/validar-documento/').status_code, 405)
+
+
+class CacheConsultasTests(SimpleTestCase):
+
+    def setUp(self):
+        diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, diretorio, True)
+        self.caminho = os.path.join(diretorio, 'teste.versao')
+        self.cargas = []
+
+    def criar(self, max_itens=10, ttl=60):
+        return CacheConsultas('teste', max_itens=max_itens, ttl=ttl, caminho_versao=self.caminho)
+
+    def carregar(self, chaves):
+        self.cargas.append(sorted(chaves))
+        return {chave: chave.upper() for chave in chaves if chave != 'inexistente'}
+
+    def test_acertos_faltas_e_consulta_negativa(self):
+        cache = self.criar()
+        self.assertEqual(cache.obter_varios(['a', 'b', 'inexistente'], self.carregar), {'a': 'A', 'b': 'B', 'inexistente': None})
+        self.assertEqual(cache.obter_varios(['a', 'inexistente', 'c'], self.carregar), {'a': 'A', 'inexistente': None, 'c': 'C'})
+        self.assertEqual(self.cargas, [['a', 'b', 'inexistente'], ['c']])
+        self.assertEqual(cache.estatisticas(), {'itens': 4, 'acertos': 2, 'faltas': 4})
+
+    def test_expira_pelo_ttl(self):
+        cache = self.criar(ttl=10)
+        with mock.patch('core.cache_cadastros.time.monotonic', return_value=100.0):
+            cache.obter_varios(['a'], self.carregar)
+        with mock.patch('core.cache_cadastros.time.monotonic', return_value=109.0):
+            cache.obter_varios(['a'], self.carregar)
+        with mock.patch('core.cache_cadastros.time.monotonic', return_value=110.0):
+            cache.obter_varios(['a'], self.carregar)
+        self.assertEqual(self.cargas, [['a'], ['a']])
+
+    def test_descarta_o_menos_usado(self):
+        cache = self.criar(max_itens=2)
+        cache.obter_varios(['a', 'b'], self.carregar)
+        cache.obter_varios(['a'], self.carregar)  # 'b' passa a ser o menos usado
+        cache.obter_varios(['c'], self.carregar)
+        self.assertEqual(cache.estatisticas()['itens'], 2)
+        cache.obter_varios(['a', 'b', 'c'], self.carregar)
+        self.assertEqual(self.cargas, [['a', 'b'], ['c'], ['b']])
+
+    def test_gravacao_em_outro_processo_descarta_o_cache(self):
+        cache, outro_processo = self.criar(), self.criar()
+        cache.obter_varios(['a'], self.carregar)
+        cache.obter_varios(['a'], self.carregar)
+        outro_processo.invalidar()
+        self.assertEqual(cache.versao_compartilhada(), outro_processo.versao_compartilhada())
+        cache.obter_varios(['a'], self.carregar)
+        self.assertEqual(self.cargas, [['a'], ['a']])
+
+    def test_leitura_concorrente_com_gravacao_nao_fica_em_cache(self):
+        cache, outro_processo = self.criar(), self.criar()
+
+        def carregar_durante_gravacao(chaves):
+            outro_processo.invalidar()  # o valor lido pode ser anterior à gravação
+            return self.carregar(chaves)
+
+        self.assertEqual(cache.obter_varios(['a'], carregar_durante_gravacao), {'a': 'A'})
+        self.assertEqual(cache.estatisticas()['itens'], 0)
+        cache.obter_varios(['a'], self.carregar)
+        cache.obter_varios(['a'], self.carregar)
+        self.assertEqual(self.cargas, [['a'], ['a']])
+
+
+@override_settings(PDF_CACHE_TTL=3600, PDF_CACHE_MAX_ENTRIES=2)
+class CacheExtracaoTests(TestCase):
+
+    def envelhecer(self, sha256, **campos):
+        CacheExtracao.objects.filter(sha256=sha256).update(**{campo: timezone.now() - timedelta(seconds=s) for campo, s in campos.items()})
+
+    def test_resultado_gravado_e_reaproveitado(self):
+        salvar_resultado('a' * 64, {'numero_nota_fiscal': '1234'})
+        self.assertEqual(buscar_resultado('a' * 64), {'numero_nota_fiscal': '1234'})
+        self.assertEqual(buscar_resultado('a' * 64), {'numero_nota_fiscal': '1234'})
+        self.assertIsNone(buscar_resultado('b' * 64))
+        self.assertEqual(CacheExtracao.objects.get(sha256='a' * 64).acessos, 2)
+
+    def test_expira_pelo_ttl(self):
+        salvar_resultado('a' * 64, {'numero_nota_fiscal': '1'})
+        self.envelhecer('a' * 64, created_at=3601)
+        self.assertIsNone(buscar_resultado('a' * 64))
+        # A próxima gravação remove o que venceu
+        salvar_resultado('b' * 64, {'numero_nota_fiscal': '2'})
+        self.assertEqual(list(CacheExtracao.objects.values_list('sha256', flat=True)), ['b' * 64])
+
+    def test_remove_o_menos_acessado_ao_gravar(self):
+        salvar_resultado('a' * 64, {'numero_nota_fiscal': '1'})
+        salvar_resultado('b' * 64, {'numero_nota_fiscal': '2'})
+        self.envelhecer('a' * 64, ultimo_acesso=20)
+        self.envelhecer('b' * 64, ultimo_acesso=10)
+        buscar_resultado('a' * 64)  # 'b' passa a ser o acesso mais antigo
+        salvar_resultado('c' * 64, {'numero_nota_fiscal': '3'})
+        self.assertEqual(sorted(CacheExtracao.objects.values_list('sha256', flat=True)), ['a' * 64, 'c' * 64])
+
+    def test_comando_limpar_cache(self):
+        salvar_resultado('a' * 64, {'numero_nota_fiscal': '1'})
+        salvar_resultado('b' * 64, {'numero_nota_fiscal': '2'})
+        self.envelhecer('a' * 64, created_at=3601)
+        saida = io.StringIO()
+        call_command('limpar_cache_extracao', '--expirados', stdout=saida)
+        self.assertIn('1 entrada(s) removida(s)', saida.getvalue())
+        self.assertEqual(list(CacheExtracao.objects.values_list('sha256', flat=True)), ['b' * 64])
+        call_command('limpar_cache_extracao', stdout=saida)
+        self.assertFalse(CacheExtracao.objects.exists())
+
+    @override_settings(LLM_BACKEND='core.agents.agente_falso.AgenteFalso', LLM_FAKE_LATENCY_MS=0, LLM_FAKE_JITTER_MS=0)
+    def test_flag_em_cache(self):
+        redefinir_agente()
+        self.addCleanup(redefinir_agente)
+
+        with mock.patch.object(ProcessadorPDF, 'extrair_texto_pdf', return_value=DANFE_SEM_CHAVE) as extrair:
+            primeira = processar_pdf(SimpleUploadedFile('nota.pdf', b'%PDF-1.4 primeira'))
+            segunda = processar_pdf(SimpleUploadedFile('copia.pdf', b'%PDF-1.4 primeira'))
+        self.assertEqual(extrair.call_count, 1)
+        self.assertEqual((primeira['em_cache'], segunda['em_cache']), (False, True))
+        self.assertEqual(segunda['numero_nota_fiscal'], primeira['numero_nota_fiscal'])
+        self.assertNotIn('memoria', segunda)
+
+
+class ParcelamentoTests(TestCase):
+
+    def test_vencimentos_no_fim_do_mes(self):
+        self.assertEqual(
+            calcular_vencimentos(date(2024, 1, 31), 4),
+            [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30)],
+        )
+        self.assertEqual(calcular_vencimentos(date(2024, 11, 15), 3)[-1], date(2025, 1, 15))
+
+    def test_centavos_somam_o_total(self):
+        valores = dividir_valor(Decimal('100.00'), 3)
+        self.assertEqual(valores, [Decimal('33.34'), Decimal('33.33'), Decimal('33.33')])
+        self.assertEqual(sum(dividir_valor(1234.57, 60)), Decimal('1234.57'))
+
+    def test_parcelas_gravadas_em_um_insert(self):
+        pessoa = Pessoas.objects.create(tipo='FORNECEDOR', razao_social='FORNECEDOR TESTE', cnpj_cpf='11222333000181')
+        movimento = MovimentoContas.objects.create(
+            tipo='PAGAR', pessoa=pessoa, descricao='Financiamento', valor_total=Decimal('10000.00'),
+            quantidade_parcelas=60, data_emissao=date(2024, 1, 31),
+        )
+        with self.assertNumQueries(1):
+            movimento.criar_parcelas()
+        parcelas = list(movimento.parcelas.all())
+        self.assertEqual(len(parcelas), 60)
+        self.assertEqual(sum(p.valor_parcela for p in parcelas), Decimal('10000.00'))
+        self.assertEqual(parcelas[1].data_vencimento, date(2024, 2, 29))
+
+
+CHAVE_TESTE = '52240111222333000181550010000012341000000015'
+
+DANFE_SEM_CHAVE = """RECEBEMOS DE AGRO FORNECEDORA LTDA OS PRODUTOS CONSTANTES DA NOTA FISCAL INDICADA AO LADO
+DATA DE RECEBIMENTO IDENTIFICAÇÃO E ASSINATURA DO RECEBEDOR
+DANFE DOCUMENTO AUXILIAR DA NOTA FISCAL ELETRÔNICA
+0 - ENTRADA 1 - SAÍDA
+Nº 000.001.234
+SÉRIE 001 FOLHA 1/1
+NATUREZA DA OPERAÇÃO VENDA DE MERCADORIA
+CNPJ 11.222.333/0001-81 INSCRIÇÃO ESTADUAL 10.123.456-7
+NOME/RAZÃO SOCIAL CNPJ/CPF DATA DA EMISSÃO
+PRODUTOR RURAL TESTE 123.456.789-09 10/01/2024
+CÁLCULO DO IMPOSTO
+BASE DE CÁLC. DO ICMS VALOR DO ICMS BASE DE CÁLC. ICMS S.T. VALOR DO ICMS SUBST. V. TOT. PRODUTOS
+0,00 0,00 0,00 0,00 1.500,00
+VALOR DO FRETE VALOR DO SEGURO DESCONTO OUTRAS DESPESAS VALOR TOTAL IPI VALOR TOTAL DA NOTA
+35,00 0,00 0,00 0,00 0,00 1.535,00
+DADOS ADICIONAIS
+CONTRATO COM TERMINO 2024
+"""
+
+
+class ExtratorRegrasTests(SimpleTestCase):
+
+    def extrair(self, texto):
+        return ExtratorRegras().extrair(texto)
+
+    def test_numero_e_serie_no_cabecalho(self):
+        dados = self.extrair(DANFE_SEM_CHAVE)
+        self.assertEqual(dados['numero_nota_fiscal'], '1234')
+        self.assertEqual(dados['serie'], '1')
+
+    def test_numero_nao_casa_dentro_de_palavra(self):
+        self.assertNotIn('numero_nota_fiscal', self.extrair("CONTRATO COM TERMINO 2024\nDATA 10/01/2024"))
+        # "No" solto, fora do contexto de nota fiscal, também não é o número
+        self.assertNotIn('numero_nota_fiscal', self.extrair("PEDIDO No 4521 ENTREGUE NO PRAZO"))
+
+    def test_numero_e_serie_da_chave_prevalecem(self):
+        dados = self.extrair(DANFE_SEM_CHAVE + "CHAVE DE ACESSO\n" + " ".join(CHAVE_TESTE[i:i + 4] for i in range(0, 44, 4)))
+        self.assertEqual(dados['chave_acesso'], CHAVE_TESTE)
+        self.assertEqual((dados['numero_nota_fiscal'], dados['serie']), ('1234', '1'))
+
+    def test_valor_total_pela_coluna_do_rotulo(self):
+        self.assertEqual(self.extrair(DANFE_SEM_CHAVE)['valor_total'], '1.535,00')
+
+    def test_valor_total_na_propria_linha(self):
+        self.assertEqual(self.extrair("VALOR TOTAL DA NOTA: R$ 2.010,50")['valor_total'], '2.010,50')
+        self.assertEqual(self.extrair("VALOR TOTAL DA NOTA\n2.010,50")['valor_total'], '2.010,50')
+
+    def test_colunas_desalinhadas_ficam_para_o_llm(self):
+        texto = "VALOR DO FRETE VALOR DO SEGURO VALOR TOTAL DA NOTA\n35,00 1.535,00"
+        self.assertNotIn('valor_total', self.extrair(texto))
+
+    def test_fornecedor_e_faturado(self):
+        dados = self.extrair(DANFE_SEM_CHAVE)
+        self.assertEqual(dados['fornecedor']['cnpj'], '11.222.333/0001-81')
+        self.assertEqual(dados['faturado']['cpf'], '123.456.789-09')
+        self.assertEqual(dados['data_emissao'], '10/01/2024')
+
+    def test_digitos_verificadores(self):
+        self.assertTrue(validar_cnpj('11222333000181'))
+        self.assertFalse(validar_cnpj('11222333000182'))
+        self.assertFalse(validar_cnpj('11111111111111'))
+        self.assertTrue(validar_cpf('12345678909'))
+        self.assertFalse(validar_cpf('12345678900'))
+        self.assertTrue(validar_chave_acesso(CHAVE_TESTE))
+        self.assertFalse(validar_chave_acesso(CHAVE_TESTE[:-1] + '6'))
+        self.assertFalse(validar_chave_acesso(CHAVE_TESTE[:-1]))
+
+
+class EntradaSemSeek(io.RawIOBase):
+    """Simula a entrada padrão: lida uma vez, sem voltar ao início"""
+
+    def __init__(self, conteudo: bytes):
+        self._conteudo = io.BytesIO(conteudo)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        dados = self._conteudo.read(len(buffer))
+        buffer[:len(dados)] = dados
+        return len(dados)
+
+
+class ImportacaoCadastrosTests(TestCase):
+
+    def importar(self, conteudo: str, modelo='pessoas', formato='csv', **kwargs):
+        eventos = list(importar_cadastros(io.BytesIO(conteudo.encode('utf-8')), modelo, formato, **kwargs))
+        return [e for e in eventos if 'erro' in e], eventos[-1]['resumo']
+
+    def test_csv_com_erros_por_linha(self):
+        erros, resumo = self.importar(
+            "tipo;cnpj_cpf;razao_social;email\n"
+            "FORNECEDOR;11.222.333/0001-81;AGRO FORNECEDORA LTDA;contato@agro.com.br\n"
+            "FATURADO;123.456.789-00;CPF INVALIDO;\n"
+            "CLIENTE;123.456.789-09;;\n"
+            "FATURADO;123.456.789-09;PRODUTOR RURAL;nao-e-email\n"
+        )
+        self.assertEqual([e['linha'] for e in erros], [3, 4, 5])
+        self.assertIn('CNPJ/CPF inválido', erros[0]['erro'])
+        self.assertIn('razão social', erros[1]['erro'])
+        self.assertIn('e-mail inválido', erros[2]['erro'])
+        self.assertEqual((resumo['lidas'], resumo['gravadas'], resumo['rejeitadas']), (4, 1, 3))
+        self.assertEqual(Pessoas.objects.get().cnpj_cpf, '11222333000181')
+
+    def test_json_array_atualiza_existente(self):
+        Pessoas.objects.create(tipo='FORNECEDOR', razao_social='NOME ANTIGO', cnpj_cpf='11222333000181')
+        erros, resumo = self.importar(json.dumps([
+            {'tipo': 'FORNECEDOR', 'cnpj': '11.222.333/0001-81', 'razao_social': 'NOME NOVO'},
+            {'tipo': 'FATURADO', 'cpf': '12345678909', 'nome': 'PRODUTOR RURAL'},
+            'não é objeto',
+        ]), formato='json')
+        self.assertEqual(erros, [{'linha': 3, 'erro': 'registro não é um objeto'}])
+        self.assertEqual(resumo['gravadas'], 2)
+        self.assertEqual(Pessoas.objects.get(cnpj_cpf='11222333000181').razao_social, 'NOME NOVO')
+        self.assertEqual(Pessoas.objects.count(), 2)
+
+    def test_csv_maior_que_a_amostra_do_dialeto(self):
+        linhas = ''.join(f"Classificação número {i:05d} com descrição longa;DESPESA\n" for i in range(400))
+        erros, resumo = self.importar("descricao;tipo\n" + linhas, modelo='classificacoes', tamanho_lote=150)
+        self.assertEqual(erros, [])
+        self.assertEqual((resumo['lidas'], resumo['gravadas']), (400, 400))
+        self.assertTrue(Classificacao.objects.filter(descricao='Classificação número 00399 com descrição longa').exists())
+
+    def test_comando_le_da_entrada_padrao(self):
+        conteudo = "descricao,tipo\nManutenção e Operação,DESPESA\nInsumos Agrícolas,DESPESA\n".encode('utf-8')
+        entrada = io.TextIOWrapper(io.BufferedReader(EntradaSemSeek(conteudo)), encoding='utf-8')
+        saida, erros = io.StringIO(), io.StringIO()
+        with mock.patch('sys.stdin', entrada):
+            call_command('importar_cadastros', '-', modelo='classificacoes', stdout=saida, stderr=erros)
+        self.assertEqual(erros.getvalue(), '')
+        self.assertIn('2 gravadas', saida.getvalue())
+        self.assertEqual(Classificacao.objects.count(), 2)
+
+
+def amostra_llm(resultado):
+    return REGISTRY.get_sample_value('sistema_pdf_llm_chamadas_total', {'resultado': resultado}) or 0
+
+
+class ClienteLLMTests(SimpleTestCase):
+
+    def cliente(self, respostas, **kwargs):
+        """Cliente cuja chamada devolve (ou levanta, ou espera) cada item de respostas em ordem"""
+        fila = list(respostas)
+
+        async def chamada(prompt, timeout):
+            resposta = fila.pop(0)
+            if isinstance(resposta, float):
+                await asyncio.sleep(resposta)
+                return 'tarde demais'
+            if isinstance(resposta, BaseException):
+                raise resposta
+            return resposta
+
+        opcoes = {'tentativas': 3, 'backoff_base': 0, 'timeout': 1.0, 'limite_falhas': 5, 'tempo_aberto': 30.0}
+        return ClienteLLM(chamada, **{**opcoes, **kwargs})
+
+    def test_nova_tentativa_apos_erro_temporario(self):
+        antes = amostra_llm('novas_tentativas')
+        cliente = self.cliente([ConnectionError('caiu'), ConnectionError('caiu'), '{"ok": true}'])
+        self.assertEqual(cliente.gerar_sync('prompt'), '{"ok": true}')
+        contadores = cliente.contadores()
+        self.assertEqual((contadores['novas_tentativas'], contadores['sucessos'], contadores['em_andamento']), (2, 1, 0))
+        self.assertEqual(amostra_llm('novas_tentativas') - antes, 2)
+
+    def test_erro_definitivo_nao_repete(self):
+        cliente = self.cliente([ValueError('requisição inválida'), 'não chega aqui'])
+        with self.assertRaises(ValueError):
+            cliente.gerar_sync('prompt')
+        self.assertEqual(cliente.contadores()['novas_tentativas'], 0)
+
+    def test_tempo_esgotado_conta_e_desiste(self):
+        antes = amostra_llm('tempo_esgotado')
+        cliente = self.cliente([0.5, 0.5], tentativas=2, timeout=0.02)
+        with self.assertRaises(ErroLLM):
+            cliente.gerar_sync('prompt')
+        self.assertEqual(cliente.contadores()['tempo_esgotado'], 2)
+        self.assertEqual(amostra_llm('tempo_esgotado') - antes, 2)
+
+    def test_circuito_abre_e_libera_uma_chamada_de_teste(self):
+        cliente = self.cliente(
+            [ConnectionError('caiu'), ConnectionError('caiu'), '{"ok": true}'],
+            tentativas=1, limite_falhas=2, tempo_aberto=0.05,
+        )
+        antes = amostra_llm('recusadas_circuito')
+        for _ in range(2):
+            with self.assertRaises(ErroLLM):
+                cliente.gerar_sync('prompt')
+        self.assertEqual(cliente.circuito.estado, 'aberto')
+        with self.assertRaises(CircuitoAberto):
+            cliente.gerar_sync('prompt')
+        self.assertEqual(amostra_llm('recusadas_circuito') - antes, 1)
+
+        time.sleep(0.06)
+        self.assertEqual(cliente.circuito.estado, 'meio_aberto')
+        self.assertTrue(cliente.circuito.permitir())
+        self.assertFalse(cliente.circuito.permitir())  # só uma chamada de teste por vez
+        cliente.circuito.teste_em_andamento = False
+        self.assertEqual(cliente.gerar_sync('prompt'), '{"ok": true}')
+        self.assertEqual(cliente.circuito.estado, 'fechado')
+
+    @override_settings(
+        GEMINI_TIMEOUT=5.0, GEMINI_MAX_CONCURRENCY=2, GEMINI_RETRIES=1, GEMINI_BACKOFF_BASE=0.1,
+        GEMINI_BACKOFF_MAX=1.0, GEMINI_CIRCUIT_FAILURES=2, GEMINI_CIRCUIT_RESET=10.0, GEMINI_PROMPT_MAX_CHARS=500,
+        LLM_FAKE_LATENCY_MS=100, LLM_FAKE_JITTER_MS=0,
+    )
+    def test_agente_le_os_limites_das_settings(self):
+        agente = AgenteFalso()
+        cliente = agente.cliente
+        self.assertEqual(
+            (cliente.timeout, cliente.max_concorrencia, cliente.tentativas, cliente.backoff_base, cliente.backoff_max),
+            (5.0, 2, 1, 0.1, 1.0),
+        )
+        self.assertEqual((cliente.circuito.limite_falhas, cliente.circuito.tempo_aberto), (2, 10.0))
+        self.assertEqual((agente.limite_texto, agente.latencia, agente.variacao), (500, 0.1, 0.0))
+
+
+class ExtracaoParalelaTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.diretorio = tempfile.mkdtemp()
+        cls.caminho = os.path.join(cls.diretorio, 'danfe.pdf')
+        gerar_documento(cls.caminho, 10, False, random.Random(7))
+        cls.texto_serial = ProcessadorPDF(max_workers=1).extrair_texto_pdf(cls.caminho)
+
+    @classmethod
+    def tearDownClass(cls):
+        if services._executor is not None:
+            services._executor.shutdown()
+            services._executor = None
+        shutil.rmtree(cls.diretorio, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_paralelo_igual_ao_serial(self):
+        processador = ProcessadorPDF(max_workers=2, paginas_paralelo=2)
+        self.assertEqual(processador.extrair_texto_pdf(self.caminho), self.texto_serial)
+        self.assertEqual(processador.total_paginas, 10)
+
+    def test_pool_quebrado_e_substituido(self):
+        quebrado = ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn'))
+        with self.assertRaises(BrokenProcessPool):
+            quebrado.submit(os._exit, 1).result()
+        services._executor = quebrado
+
+        processador = ProcessadorPDF(max_workers=2, paginas_paralelo=2)
+        self.assertEqual(processador.extrair_texto_pdf(self.caminho), self.texto_serial)
+        self.assertIsNone(services._executor)
+        # A próxima leitura paralela cria um pool novo
+        self.assertEqual(processador.extrair_texto_pdf(self.caminho), self.texto_serial)
+        self.assertIsNot(services._executor, quebrado)
+
+    def espiar_blocos(self):
+        return mock.patch.object(
+            ProcessadorPDF, '_extrair_intervalos', autospec=True, side_effect=ProcessadorPDF._extrair_intervalos,
+        )
+
+    def politica(self, max_paginas, parar_no_cabecalho=True):
+        politica = PoliticaExtracao(max_paginas=max_paginas)
+        if not parar_no_cabecalho:
+            politica.BLOCOS = {'inexistente': ('MARCADOR AUSENTE',)}
+        return politica
+
+    def test_leitura_antecipada_em_blocos_paralelos(self):
+        # Página 1 já tem cabeçalho e totais: só o primeiro bloco (2 páginas) é lido
+        serial = ProcessadorPDF(max_workers=1).extrair_texto_pdf(self.caminho, politica=self.politica(8))
+        processador = ProcessadorPDF(max_workers=2, paginas_paralelo=4)
+        with self.espiar_blocos() as blocos:
+            self.assertEqual(processador.extrair_texto_pdf(self.caminho, politica=self.politica(8)), serial)
+        self.assertEqual([c.args[2] for c in blocos.call_args_list], [[(0, 1), (1, 2)]])
+
+        # Sem os marcadores, lê em ordem até o limite da política
+        serial = ProcessadorPDF(max_workers=1).extrair_texto_pdf(self.caminho, politica=self.politica(5, False))
+        with self.espiar_blocos() as blocos:
+            texto = processador.extrair_texto_pdf(self.caminho, politica=self.politica(5, False))
+        self.assertEqual(texto, serial)
+        self.assertEqual(texto.count(SEPARADOR_PAGINA), 4)
+        self.assertEqual([c.args[2] for c in blocos.call_args_list], [[(0, 1), (1, 2)], [(2, 3), (3, 4)], [(4, 5)]])
+
+    def test_leitura_antecipada_curta_fica_serial(self):
+        processador = ProcessadorPDF(max_workers=2, paginas_paralelo=4)
+        with self.espiar_blocos() as blocos:
+            texto = processador.extrair_texto_pdf(self.caminho, politica=self.politica(3, False))
+        blocos.assert_not_called()
+        self.assertEqual(texto.count(SEPARADOR_PAGINA), 2)
+
+
+@override_settings(LLM_BACKEND='core.agents.agente_falso.AgenteFalso')
+class LimitesLeituraPDFTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.diretorio = tempfile.mkdtemp()
+        cls.caminho = os.path.join(cls.diretorio, 'danfe.pdf')
+        gerar_documento(cls.caminho, 10, False, random.Random(11))
+        redefinir_agente()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.diretorio, ignore_errors=True)
+        redefinir_agente()
+        super().tearDownClass()
+
+    @override_settings(PDF_LOW_MEMORY_MAX_CHARS=300)
+    def test_limite_de_caracteres_na_leitura_antecipada(self):
+        texto = ProcessadorPDF().extrair_texto_pdf(self.caminho, politica=PoliticaExtracao())
+        self.assertLessEqual(len(texto), 300)
+        self.assertTrue(texto.startswith('RECEBEMOS DE'))
+
+    @override_settings(PDF_MAX_PAGES=5)
+    def test_limite_de_paginas_na_leitura_antecipada(self):
+        with self.assertRaises(LimitePDFExcedido):
+            ProcessadorPDF().extrair_texto_pdf(self.caminho, politica=PoliticaExtracao())
+
+    def test_pdf_corrompido_e_contado(self):
+        antes = REGISTRY.get_sample_value('sistema_pdf_extracoes_total', {'resultado': 'pdf_invalido'}) or 0
+        with open(self.caminho, 'rb') as arquivo:
+            truncado = arquivo.read()[:400]
+        resultado = processar_pdf(truncado)
+        self.assertEqual(resultado['erro'], 'PDF inválido')
+        depois = REGISTRY.get_sample_value('sistema_pdf_extracoes_total', {'resultado': 'pdf_invalido'})
+        self.assertEqual(depois - antes, 1)
+
+
+@override_settings(
+    LLM_BACKEND='core.agents.agente_falso.AgenteFalso', LLM_FAKE_LATENCY_MS=0, LLM_FAKE_JITTER_MS=0,
+    PDF_MAX_BYTES=100_000, PDF_BATCH_ZIP_MAX_RATIO=100,
+)
+class ExtracaoLoteTests(TransactionTestCase):
+
+    def setUp(self):
+        redefinir_agente()
+        self.addCleanup(redefinir_agente)
+        diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, diretorio, True)
+        caminho = os.path.join(diretorio, 'danfe.pdf')
+        gerar_documento(caminho, 1, False, random.Random(3))
+        with open(caminho, 'rb') as arquivo:
+            self.pdf = arquivo.read()
+
+    def enviar(self, *arquivos):
+        resposta = self.client.post('/extrair-lote/', {'pdf_files': list(arquivos)})
+        self.assertEqual(resposta['Content-Type'], 'application/x-ndjson')
+        linhas = [json.loads(linha) for linha in b''.join(resposta.streaming_content).decode().splitlines()]
+        return {linha['arquivo']: linha for linha in linhas}
+
+    def zip(self, nome, entradas):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as zf:
+            for entrada, conteudo, compressao in entradas:
+                zf.writestr(entrada, conteudo, compress_type=compressao)
+        return SimpleUploadedFile(nome, buffer.getvalue(), content_type='application/zip')
+
+    def test_entradas_do_zip_recusadas_sem_descompactar(self):
+        arquivo = self.zip('notas.zip', [
+            ('nota.pdf', self.pdf, zipfile.ZIP_DEFLATED),
+            ('leia-me.txt', b'texto', zipfile.ZIP_DEFLATED),
+            ('grande.pdf', os.urandom(150_000), zipfile.ZIP_STORED),
+            ('bomba.pdf', b'%PDF-1.4\n' + b'0' * 90_000, zipfile.ZIP_DEFLATED),
+        ])
+        with mock.patch.object(zipfile.ZipFile, 'open', autospec=True, side_effect=zipfile.ZipFile.open) as abrir:
+            resultados = self.enviar(arquivo)
+        self.assertEqual([chamada.args[1].filename for chamada in abrir.call_args_list], ['nota.pdf'])
+
+        self.assertEqual(set(resultados), {'nota.pdf', 'leia-me.txt', 'grande.pdf', 'bomba.pdf'})
+        self.assertTrue(resultados['nota.pdf']['sucesso'])
+        self.assertEqual(resultados['leia-me.txt']['erro'], 'Arquivo ignorado: não é um PDF')
+        self.assertIn('150000 bytes descompactado', resultados['grande.pdf']['erro'])
+        self.assertIn('taxa de compressão', resultados['bomba.pdf']['erro'])
+        self.assertFalse(any(r['sucesso'] for nome, r in resultados.items() if nome != 'nota.pdf'))
+
+    def test_pdf_avulso_e_zip_invalido(self):
+        resultados = self.enviar(
+            SimpleUploadedFile('avulsa.pdf', self.pdf, content_type='application/pdf'),
+            SimpleUploadedFile('quebrado.zip', b'PK\x03\x04 corrompido', content_type='application/zip'),
+        )
+        self.assertTrue(resultados['avulsa.pdf']['sucesso'])
+        self.assertEqual(resultados['quebrado.zip']['erro'], 'Arquivo ignorado: ZIP inválido')
+
+    def test_sem_arquivos(self):
+        self.assertEqual(self.client.post('/extrair-lote/').status_code, 400)
+
+    def test_tempos_registrados_ao_fim_do_streaming(self):
+        with self.assertLogs('core.timing', 'INFO') as logs:
+            resposta = self.client.post('/extrair-lote/', {
+                'pdf_files': [SimpleUploadedFile('avulsa.pdf', self.pdf, content_type='application/pdf')],
+            })
+            self.assertNotIn('Server-Timing', resposta)
+            self.assertEqual(logs.output, [])  # nada registrado antes do corpo ser gerado
+            b''.join(resposta.streaming_content)
+        registro = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(registro['rota'], 'extrair_lote')
+        self.assertIn('upload', registro['etapas'])
+        self.assertIn('pdf_texto', registro['etapas'])
+        self.assertIn('regras', registro['etapas'])
+
+    def test_upload_cronometrado_no_recebimento(self):
+        # O CsrfViewMiddleware lê o corpo antes da view: a etapa vem do HashUploadHandler
+        resposta = self.client.post('/extrair-dados/', {
+            'pdf_file': SimpleUploadedFile('nota.pdf', self.pdf, content_type='application/pdf'),
+        })
+        etapas = [parte.split(';')[0] for parte in resposta['Server-Timing'].split(', ')]
+        self.assertEqual(etapas.count('upload'), 1)
+        self.assertLess(etapas.index('upload'), etapas.index('processar_pdf'))
+
+
+@override_settings(JOB_LEASE_SECONDS=600, JOB_MAX_ATTEMPTS=2)
+class ReservaJobsTests(TestCase):
+
+    def criar_job(self, nome='nota.pdf'):
+        return JobExtracao.objects.create(nome_arquivo=nome, etapa='na_fila')
+
+    def vencer_prazo(self, job):
+        JobExtracao.objects.filter(pk=job.pk).update(iniciado_em=timezone.now() - timedelta(seconds=601))
+
+    def test_reserva_o_mais_antigo_uma_unica_vez(self):
+        primeiro, segundo = self.criar_job('a.pdf'), self.criar_job('b.pdf')
+        self.assertEqual(reservar_proximo_job().pk, primeiro.pk)
+        reservado = reservar_proximo_job()
+        self.assertEqual((reservado.pk, reservado.status, reservado.tentativas), (segundo.pk, 'PROCESSANDO', 1))
+        self.assertIsNone(reservar_proximo_job())
+
+    def test_job_com_prazo_vencido_volta_a_ser_reservado(self):
+        job = self.criar_job()
+        reservar_proximo_job()
+        self.assertIsNone(reservar_proximo_job())  # ainda no prazo: o worker pode estar vivo
+
+        self.vencer_prazo(job)
+        retomado = reservar_proximo_job()
+        self.assertEqual((retomado.pk, retomado.tentativas), (job.pk, 2))
+        self.assertGreater(retomado.iniciado_em, timezone.now() - timedelta(seconds=60))
+
+    def test_tentativas_esgotadas_viram_erro(self):
+        job = self.criar_job()
+        reservar_proximo_job()
+        self.vencer_prazo(job)
+        reservar_proximo_job()
+        self.vencer_prazo(job)
+
+        self.assertIsNone(reservar_proximo_job())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.etapa, job.tentativas), ('ERRO', 'finalizado', 2))
+        self.assertIn('interrompido 2 vez(es)', job.resultado['detalhes'])
+
+
+class CompactadorTests(SimpleTestCase):
+
+    PAGINA_1 = """DANFE Nº 000001234 SÉRIE 1
+AGRO FORNECEDORA LTDA CNPJ 11.222.333/0001-81
+DESTINATÁRIO/REMETENTE
+PRODUTOR RURAL TESTE 123.456.789-09 10/01/2024
+CÁLCULO DO IMPOSTO
+BASE DE CÁLCULO DO ICMS VALOR DO ICMS BASE DE CÁLC. ICMS S.T. VALOR DO ICMS SUBST.
+0,00 0,00 0,00 0,00
+VALOR DO FRETE VALOR DO SEGURO DESCONTO OUTRAS DESPESAS
+0,00 0,00 0,00 0,00
+VALOR TOTAL DA NOTA
+120,00
+DADOS DO PRODUTO/SERVIÇO
+0001 PARAFUSO UN 1 10,00
+0001 PARAFUSO UN 1 10,00
+DADOS ADICIONAIS
+INFORMAÇÕES COMPLEMENTARES PEDIDO 998877 ENTREGA NA FAZENDA"""
+
+    PAGINA_2 = """DANFE Nº 000001234 SÉRIE 1
+AGRO FORNECEDORA LTDA CNPJ 11.222.333/0001-81
+0002 CORREIA EM V B-62 UN 2 50,00
+0003 FILTRO DE AR UN 1 50,00"""
+
+    def compactar(self, limite=10000):
+        return compactar_texto(SEPARADOR_PAGINA.join([self.PAGINA_1, self.PAGINA_2]), limite)[0].splitlines()
+
+    def test_itens_e_totais_sobrevivem(self):
+        linhas = self.compactar()
+        # Linhas iguais na mesma página não são cabeçalho repetido
+        self.assertEqual(linhas.count('0,00 0,00 0,00 0,00'), 2)
+        self.assertEqual(linhas.count('0001 PARAFUSO UN 1 10,00'), 2)
+        self.assertIn('120,00', linhas)
+        # Os itens da página seguinte não ficam presos no quadro de dados adicionais
+        self.assertIn('0002 CORREIA EM V B-62 UN 2 50,00', linhas)
+        self.assertIn('0003 FILTRO DE AR UN 1 50,00', linhas)
+
+    def test_cabecalho_repetido_e_dados_adicionais_saem(self):
+        linhas = self.compactar()
+        self.assertEqual(linhas.count('DANFE Nº 000001234 SÉRIE 1'), 1)
+        self.assertEqual(linhas.count('AGRO FORNECEDORA LTDA CNPJ 11.222.333/0001-81'), 1)
+        self.assertFalse(any('PEDIDO 998877' in linha for linha in linhas))
+
+    def test_limite_corta_itens_antes_dos_totais(self):
+        linhas = self.compactar(limite=400)
+        self.assertIn('120,00', linhas)
+        self.assertNotIn('0003 FILTRO DE AR UN 1 50,00', linhas)
+
+
+class NormalizacaoDocumentoMigracaoTests(TestCase):
+
+    def test_documentos_existentes_normalizados(self):
+        migracao = importlib.import_module('core.migrations.0008_pessoas_cnpj_cpf_normalizado')
+        pessoa = Pessoas.objects.create(tipo='FORNECEDOR', razao_social='AGRO', cnpj_cpf='11222333000181')
+        outra = Pessoas.objects.create(tipo='FATURADO', razao_social='PRODUTOR', cnpj_cpf='12345678909')
+        repetida = Pessoas.objects.create(tipo='CLIENTE', razao_social='REPETIDO', cnpj_cpf='99999999999')
+        # Formatos gravados antes da normalização completa (save() já normaliza, então via update)
+        Pessoas.objects.filter(pk=pessoa.pk).update(cnpj_cpf='11 222 333 0001 81')
+        Pessoas.objects.filter(pk=repetida.pk).update(cnpj_cpf='123 456 789 09')
+
+        migracao.normalizar_cnpj_cpf(django_apps, None)
+
+        self.assertEqual(Pessoas.objects.get(pk=pessoa.pk).cnpj_cpf, '11222333000181')
+        self.assertEqual(Pessoas.objects.get(pk=outra.pk).cnpj_cpf, '12345678909')
+        # A forma normalizada já é de outra pessoa: o valor antigo é mantido
+        self.assertEqual(Pessoas.objects.get(pk=repetida.pk).cnpj_cpf, '123 456 789 09')
+
+
+class IndiceClassificacoesTests(TestCase):
+
+    def indice(self):
+        indice = IndiceTrigramas()
+        indice.reconstruir([
+            (1, 'DESPESA', 'Combustíveis e Lubrificantes'),
+            (2, 'DESPESA', 'Combustível'),
+            (3, 'DESPESA', 'Manutenção de Máquinas'),
+            (4, 'RECEITA', 'Combustível'),
+        ])
+        return indice
+
+    def test_ordena_pela_similaridade(self):
+        sugestoes = self.indice().buscar('DESPESA', 'COMBUSTIVEL', k=3)
+        self.assertEqual([s['id'] for s in sugestoes], [2, 1])
+        self.assertEqual(sugestoes[0]['similaridade'], 1.0)
+        self.assertGreater(sugestoes[0]['similaridade'], sugestoes[1]['similaridade'])
+
+    def test_similaridade_minima_e_tipo(self):
+        indice = self.indice()
+        self.assertEqual([s['id'] for s in indice.buscar('DESPESA', 'combustiveis', minimo=0.7)], [2])
+        self.assertEqual(indice.buscar('DESPESA', 'Sementes de Soja', minimo=0.5), [])
+        self.assertEqual([s['id'] for s in indice.buscar('RECEITA', 'Combustível')], [4])
+
+    def test_indice_acompanha_o_cadastro(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Classificacao.objects.create(tipo='DESPESA', descricao='Defensivos Agrícolas')
+        self.assertEqual(sugerir_classificacoes('DESPESA', 'Defensivo Agricola')[0]['descricao'], 'Defensivos Agrícolas')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            nova = Classificacao.objects.create(tipo='DESPESA', descricao='Defensivos Biológicos')
+        self.assertIn(nova.id, [s['id'] for s in sugerir_classificacoes('DESPESA', 'Defensivos Biologicos')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            nova.ativo = False
+            nova.save()
+        self.assertNotIn(nova.id, [s['id'] for s in sugerir_classificacoes('DESPESA', 'Defensivos Biologicos')])
+
+    def test_gravacao_de_outro_worker_no_meio_reconstroi(self):
+        sugerir_classificacoes('DESPESA', 'Sementes')
+        indice = obter_indice()
+        cache = obter_cache('classificacoes')
+        outro_worker = CacheConsultas('classificacoes', max_itens=10, ttl=60, caminho_versao=cache.caminho_versao)
+
+        # Gravação deste processo sem ninguém no meio: o índice acompanha o carimbo sem reconstruir
+        with self.captureOnCommitCallbacks(execute=True):
+            Classificacao.objects.create(tipo='DESPESA', descricao='Defensivos Agrícolas')
+        self.assertEqual(indice.versao, cache.versao_compartilhada())
+
+        # Outro worker grava (sem sinais neste processo) antes da próxima gravação local
+        Classificacao.objects.bulk_create([Classificacao(tipo='DESPESA', descricao='Sementes de Soja', descricao_normalizada='SEMENTES DE SOJA')])
+        outro_worker.invalidar()
+        with self.captureOnCommitCallbacks(execute=True):
+            Classificacao.objects.create(tipo='DESPESA', descricao='Fertilizantes')
+        self.assertNotEqual(indice.versao, cache.versao_compartilhada())
+        self.assertEqual(sugerir_classificacoes('DESPESA', 'Sementes de Soja')[0]['descricao'], 'Sementes de Soja')
+
+
+@override_settings(CADASTROS_CACHE_ENABLED=False)
+class DuplicidadeNotaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Pessoas.objects.create(tipo='FORNECEDOR', razao_social='FORNECEDOR TESTE', cnpj_cpf='11222333000181')
+        Pessoas.objects.create(tipo='FATURADO', razao_social='FATURADO TESTE', cnpj_cpf='12345678909')
+
+    def lancar(self, **nota_fiscal):
+        corpo = {
+            'fornecedor': {'cnpj': '11.222.333/0001-81'},
+            'faturado': {'cpf': '123.456.789-09'},
+            'nota_fiscal': {'valor': '1.000,00', 'data_emissao': '10/01/2025', **nota_fiscal},
+            'classificacao_despesa': [],
+        }
+        return self.client.post('/api/criar-lancamento/', json.dumps(corpo), content_type='application/json').json()
+
+    def test_identificacao_pela_chave(self):
+        # A chave prevalece sobre os campos digitados e gera a mesma identificação que eles
+        self.assertEqual(identificar_nota(CHAVE_TESTE, '99.999.999/0001-99', '7', '1'), '11222333000181-1-1234')
+        self.assertEqual(
+            identificar_nota(CHAVE_TESTE), identificar_nota('', '11.222.333/0001-81', '001', '000.001.234')
+        )
+
+    def test_identificacao_sem_chave_valida(self):
+        self.assertEqual(identificar_nota('', '11.222.333/0001-81', '0', '1234'), '11222333000181-0-1234')
+        # Chave com dígito verificador errado é ignorada
+        self.assertEqual(identificar_nota(CHAVE_TESTE[:-1] + '6', '11222333000181', '2', '55'), '11222333000181-2-55')
+        self.assertIsNone(identificar_nota('', '11222333000181', '1', ''))
+        self.assertIsNone(identificar_nota('', '', '1', '1234'))
+        self.assertEqual(
+            identificar_dados({'fornecedor': {'cnpj': '11.222.333/0001-81'}, 'serie': 1, 'numero_nota_fiscal': 1234}),
+            '11222333000181-1-1234',
+        )
+
+    def test_serie_vem_da_chave_e_sem_serie_nao_ha_identificacao(self):
+        # Mesma nota: pela chave a série é 1; sem chave e sem série não se identifica (nada de série 0)
+        self.assertEqual(identificar_nota(CHAVE_TESTE, '11.222.333/0001-81', '', '1234'), '11222333000181-1-1234')
+        self.assertEqual(identificar_dados({'chave_acesso': CHAVE_TESTE, 'numero_nota_fiscal': '1234'}), '11222333000181-1-1234')
+        self.assertIsNone(identificar_nota('', '11.222.333/0001-81', '', '1234'))
+        self.assertIsNone(identificar_dados({'fornecedor': {'cnpj': '11.222.333/0001-81'}, 'numero_nota_fiscal': '1234'}))
+
+        primeiro = self.lancar(chave_acesso=CHAVE_TESTE)
+        self.assertEqual(MovimentoContas.objects.get(pk=primeiro['id']).identificacao_nf, '11222333000181-1-1234')
+        sem_serie = self.lancar(numero='1234')
+        self.assertTrue(sem_serie['sucesso'])
+        self.assertIsNone(MovimentoContas.objects.get(pk=sem_serie['id']).identificacao_nf)
+
+    def test_segundo_lancamento_da_mesma_nota_e_recusado(self):
+        primeiro = self.lancar(numero='1234', serie='1')
+        self.assertTrue(primeiro['sucesso'])
+        segundo = self.lancar(chave_acesso=CHAVE_TESTE)
+        self.assertEqual((segundo['duplicada'], segundo['id']), (True, primeiro['id']))
+        self.assertEqual(MovimentoContas.objects.count(), 1)
+
+    def test_nota_ja_lancada_nao_resolve_o_agente(self):
+        # Sem GEMINI_API_KEY, obter_agente falha: a duplicidade é detectada antes de precisar dele
+        existente = self.lancar(numero='1234', serie='1')['id']
+        arquivo = SimpleUploadedFile('nota.pdf', b'%PDF-1.4', content_type='application/pdf')
+        with mock.patch.object(ProcessadorPDF, 'extrair_texto_pdf', return_value=DANFE_SEM_CHAVE), \
+                mock.patch('core.services.obter_agente', side_effect=ValueError('GEMINI_API_KEY ausente')) as agente:
+            dados = processar_pdf(arquivo, sha256='0' * 64)
+        agente.assert_not_called()
+        self.assertEqual((dados['duplicada'], dados['movimento_id']), (True, existente))
+
+    def test_insercao_concorrente_vira_duplicada(self):
+        existente = self.lancar(numero='1234', serie='1')['id']
+        consultas = []
+
+        def movimento_existente_atrasado(identificacao):
+            # A primeira verificação não vê o lançamento da outra requisição (ainda sem commit)
+            consultas.append(identificacao)
+            return None if len(consultas) == 1 else movimento_existente(identificacao)
+
+        with mock.patch('core.views_validacao.movimento_existente', side_effect=movimento_existente_atrasado):
+            resposta = self.lancar(numero='1234', serie='1')
+        self.assertEqual(len(consultas), 2)  # a segunda vem do tratamento do IntegrityError
+        self.assertEqual((resposta['duplicada'], resposta['id']), (True, existente))
+        self.assertEqual(MovimentoContas.objects.count(), 1)
+
+
+NFE_XML = os.path.join(os.path.dirname(__file__), 'testdata', 'nfe_autorizada.xml')
+
+
+@override_settings(NFE_XML_LLM_CLASSIFICATION=False)
+class NfeXmlTests(TestCase):
+
+    def setUp(self):
+        with open(NFE_XML, 'rb') as arquivo:
+            self.xml = arquivo.read()
+        classificador = mock.patch('core.nfe_xml.classificar_despesa', return_value=['Combustíveis e Lubrificantes'])
+        self.classificador = classificador.start()
+        self.addCleanup(classificador.stop)
+
+    def test_campos_mapeados(self):
+        dados = processar_nfe_xml(self.xml)
+        self.assertEqual(dados['fornecedor'], {
+            'razao_social': 'AGRO FORNECEDORA LTDA', 'nome_fantasia': 'AGRO FORNECEDORA', 'cnpj': '11.222.333/0001-81',
+        })
+        self.assertEqual(dados['faturado'], {'nome_completo': 'PRODUTOR RURAL TESTE', 'cpf': '123.456.789-09'})
+        self.assertEqual((dados['numero_nota_fiscal'], dados['serie']), ('1234', '1'))
+        self.assertEqual(dados['chave_acesso'], CHAVE_TESTE)
+        self.assertEqual(dados['data_emissao'], '10/01/2024')
+        self.assertEqual(dados['valor_total'], '1.535,00')
+        # Itens repetidos entram uma vez; vencimentos vêm das duplicatas
+        self.assertEqual(dados['descricao_produtos'], ['OLEO DIESEL S10', 'FILTRO DE AR PRIMARIO'])
+        self.assertEqual((dados['quantidade_parcelas'], dados['data_vencimento']), (2, '10/02/2024'))
+        self.assertEqual(dados['classificacao_despesa'], ['Combustíveis e Lubrificantes'])
+        self.assertEqual(dados['origem_campos']['classificador'], ['classificacao_despesa'])
+        self.assertNotIn('classificacao_despesa', dados['origem_campos']['xml'])
+
+    def test_endpoint_aceita_o_upload(self):
+        arquivo = SimpleUploadedFile('nota.xml', self.xml, content_type='text/xml')
+        dados = self.client.post('/extrair-xml/', {'xml_file': arquivo}).json()
+        self.assertEqual(dados['valor_total'], '1.535,00')
+
+    def test_xml_que_nao_e_nfe_e_recusado(self):
+        for conteudo in (
+            b'<?xml version="1.0"?><pedido><numero>1</numero></pedido>',
+            self.xml.replace(b'http://www.portalfiscal.inf.br/nfe', b'http://exemplo.com/outro'),
+            self.xml[:300],
+            b'%PDF-1.4 nada de XML',
+        ):
+            self.assertEqual(processar_nfe_xml(conteudo)['erro'], 'XML de NF-e inválido')
+
+    def test_nota_ja_lancada_nao_classifica(self):
+        fornecedor = Pessoas.objects.create(tipo='FORNECEDOR', razao_social='AGRO', cnpj_cpf='11222333000181')
+        movimento = MovimentoContas.objects.create(
+            tipo='PAGAR', pessoa=fornecedor, descricao='NF 1234', valor_total=Decimal('1535.00'),
+            data_emissao=date(2024, 1, 10), identificacao_nf='11222333000181-1-1234',
+        )
+        dados = processar_nfe_xml(self.xml)
+        self.assertEqual((dados['duplicada'], dados['movimento_id']), (True, movimento.id))
+        self.classificador.assert_not_called()
+
+
+DANFE_COM_ITENS = DANFE_SEM_CHAVE.replace("DADOS ADICIONAIS", """DADOS DO PRODUTO/SERVIÇO
+CÓDIGO DESCRIÇÃO UN QTD VALOR
+0001 OLEO DIESEL S10 UN 100 1.000,00
+0002 OLEO LUBRIFICANTE 15W40 UN 5 500,00
+0003 OLEO DIESEL S10 UN 10 100,00
+DADOS ADICIONAIS""")
+
+COMBUSTIVEIS = 'Combustíveis e Lubrificantes'
+SEMENTES = 'Sementes e Defensivos'
+
+
+@override_settings(
+    LLM_BACKEND='core.agents.agente_falso.AgenteFalso', LLM_FAKE_LATENCY_MS=0, LLM_FAKE_JITTER_MS=0,
+    CLASSIFICADOR_MIN_DOCUMENTOS=1,
+)
+class ClassificadorDespesaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.posto = Pessoas.objects.create(tipo='FORNECEDOR', razao_social='POSTO RODOVIA LTDA', cnpj_cpf='11222333000181')
+        cls.agro = Pessoas.objects.create(tipo='FORNECEDOR', razao_social='AGRO SEMENTES LTDA', cnpj_cpf='11444777000161')
+        cls.combustiveis = Classificacao.objects.create(tipo='DESPESA', descricao=COMBUSTIVEIS)
+        cls.sementes = Classificacao.objects.create(tipo='DESPESA', descricao=SEMENTES)
+
+    def setUp(self):
+        redefinir_agente()
+        self.addCleanup(redefinir_agente)
+        self.diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.diretorio, True)
+        self.caminho = os.path.join(self.diretorio, 'classificador.npz')
+
+    def lancar(self, pessoa, produtos, classificacao):
+        movimento = MovimentoContas.objects.create(
+            tipo='PAGAR', pessoa=pessoa, descricao='NF', valor_total=Decimal('100.00'),
+            data_emissao=date(2024, 1, 10), descricao_produtos='\n'.join(produtos),
+        )
+        MovimentoClassificacao.objects.create(movimento=movimento, classificacao=classificacao, valor_classificado=Decimal('100.00'))
+        return movimento
+
+    def lancar_exemplos(self):
+        self.lancar(self.posto, ['OLEO DIESEL S10', 'GASOLINA COMUM'], self.combustiveis)
+        self.lancar(self.posto, ['OLEO LUBRIFICANTE 15W40', 'OLEO DIESEL S500'], self.combustiveis)
+        self.lancar(self.agro, ['SEMENTE SOJA TMG IPRO', 'HERBICIDA GLIFOSATO'], self.sementes)
+        self.lancar(self.agro, ['FUNGICIDA AZOXISTROBINA', 'SEMENTE MILHO HIBRIDO'], self.sementes)
+
+    def treinado(self):
+        classificador = ClassificadorDespesa()
+        classificador.treinar(exemplos_lancados())
+        return classificador
+
+    def test_vetorizar(self):
+        indices, pesos = vetorizar('Óleo Diesel S10  NF 123')
+        self.assertAlmostEqual(float(np.linalg.norm(pesos)), 1.0, places=5)
+        self.assertEqual(len(set(indices.tolist())), len(indices))
+        # Acentos, caixa, espaços e dígitos não mudam os n-gramas
+        outros, _ = vetorizar('OLEO DIESEL S55 NF 999')
+        self.assertEqual(sorted(indices.tolist()), sorted(outros.tolist()))
+        self.assertEqual(len(vetorizar('')[0]), 0)
+
+    def test_limiar_e_margem(self):
+        self.lancar_exemplos()
+        classificador = self.treinado()
+        self.assertEqual(classificador.documentos, 4)
+        self.assertEqual(sorted(classificador.categorias), [COMBUSTIVEIS, SEMENTES])
+
+        # A outra categoria passa do limiar, mas fica fora da margem da melhor
+        diesel = texto_classificacao('POSTO RODOVIA LTDA', ['OLEO DIESEL S10'])
+        self.assertGreater(classificador.pontuar(diesel)[SEMENTES], 0.02)
+        self.assertEqual(classificador.classificar(diesel, 0.02), [COMBUSTIVEIS])
+        # Abaixo do limiar: nenhuma categoria (o campo fica para o LLM)
+        self.assertEqual(classificador.classificar('PARAFUSO SEXTAVADO', 0.5), [])
+        # Nota com produtos das duas categorias: a segunda fica dentro da margem da melhor
+        mista = texto_classificacao('', [
+            'OLEO DIESEL S10', 'GASOLINA COMUM', 'OLEO LUBRIFICANTE 15W40',
+            'SEMENTE SOJA TMG IPRO', 'HERBICIDA GLIFOSATO', 'FUNGICIDA AZOXISTROBINA',
+        ])
+        self.assertEqual(sorted(classificador.classificar(mista, 0.1)), [COMBUSTIVEIS, SEMENTES])
+        self.assertEqual(ClassificadorDespesa().classificar(mista, 0.1), [])
+
+    def test_salvar_e_carregar(self):
+        self.lancar_exemplos()
+        classificador = self.treinado()
+        classificador.salvar(self.caminho)
+        carregado = ClassificadorDespesa.carregar(self.caminho)
+        self.assertEqual(carregado.categorias, classificador.categorias)
+        self.assertEqual((carregado.documentos, carregado.ultimo_movimento), (classificador.documentos, classificador.ultimo_movimento))
+        texto = texto_classificacao('AGRO SEMENTES LTDA', ['HERBICIDA GLIFOSATO'])
+        for categoria, pontuacao in classificador.pontuar(texto).items():
+            self.assertAlmostEqual(carregado.pontuar(texto)[categoria], pontuacao, places=5)
+        self.assertEqual(os.listdir(self.diretorio), ['classificador.npz'])
+
+    def test_retreino_incremental(self):
+        self.lancar_exemplos()
+        with override_settings(CLASSIFICADOR_MODELO_PATH=self.caminho):
+            call_command('treinar_classificador', stdout=io.StringIO())
+            novo = self.lancar(self.agro, ['INSETICIDA PIRETROIDE'], self.sementes)
+            saida = io.StringIO()
+            call_command('treinar_classificador', stdout=saida)
+        self.assertIn('1 lançamento(s) novo(s); modelo com 5 documento(s)', saida.getvalue())
+        self.assertEqual(ClassificadorDespesa.carregar(self.caminho).ultimo_movimento, novo.id)
+
+        exemplos = list(exemplos_lancados(novo.id - 1))
+        self.assertEqual(exemplos, [(novo.id, 'AGRO SEMENTES LTDA\nINSETICIDA PIRETROIDE', [SEMENTES])])
+
+    def test_danfe_no_formato_do_treino(self):
+        texto = texto_classificacao_danfe(DANFE_COM_ITENS, ExtratorRegras().extrair(DANFE_COM_ITENS))
+        self.assertEqual(texto, 'AGRO FORNECEDORA LTDA\nCÓDIGO DESCRIÇÃO UN QTD VALOR\nOLEO DIESEL S10 UN\nOLEO LUBRIFICANTE 15W40 UN')
+        # A página inteira, com outro formato que o do treino, pontua bem menos
+        self.lancar_exemplos()
+        classificador = self.treinado()
+        self.assertGreater(classificador.pontuar(texto)[COMBUSTIVEIS], 0.3)
+        self.assertLess(classificador.pontuar(DANFE_COM_ITENS)[COMBUSTIVEIS], 0.2)
+
+    def processar(self, sha256):
+        arquivo = SimpleUploadedFile('nota.pdf', b'%PDF-1.4', content_type='application/pdf')
+        with mock.patch.object(ProcessadorPDF, 'extrair_texto_pdf', return_value=DANFE_COM_ITENS):
+            return processar_pdf(arquivo, sha256=sha256)
+
+    def test_classificacao_local_e_fallback_para_o_llm(self):
+        self.lancar_exemplos()
+        self.treinado().salvar(self.caminho)
+        with override_settings(CLASSIFICADOR_MODELO_PATH=self.caminho, CLASSIFICADOR_CONFIANCA_MIN=0.2):
+            dados = self.processar('1' * 64)
+        self.assertEqual(dados['classificacao_despesa'], [COMBUSTIVEIS])
+        self.assertEqual(dados['origem_campos']['classificador'], ['classificacao_despesa'])
+        self.assertNotIn('classificacao_despesa', dados['origem_campos']['llm'])
+
+        with override_settings(CLASSIFICADOR_MODELO_PATH=self.caminho, CLASSIFICADOR_CONFIANCA_MIN=0.99):
+            dados = self.processar('2' * 64)
+        self.assertEqual(dados['origem_campos']['classificador'], [])
+        self.assertIn('classificacao_despesa', dados['origem_campos']['llm'])
+        self.assertEqual(dados['classificacao_despesa'], ['INSUMOS AGRÍCOLAS'])
 
-# Create your tests here.
@@ -0,0 +1,111 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Limites (em ms) dos buckets dos histogramas por etapa
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+_medicao_atual: contextvars.ContextVar = contextvars.ContextVar('medicao_atual', default=None)
+
+
+class Histograma:
+    def __init__(self):
+        self.contagens = [0] * (len(BUCKETS_MS) + 1)
+        self.soma_ms = 0.0
+        self.total = 0
+
+    def registrar(self, duracao_ms: float):
+        self.contagens[bisect.bisect_left(BUCKETS_MS, duracao_ms)] += 1
+        self.soma_ms += duracao_ms
+        self.total += 1
+
+    def resumo(self) -> Dict:
+        acumulado, buckets = 0, {}
+        for limite, contagem in zip(BUCKETS_MS + ('+Inf',), self.contagens):
+            acumulado += contagem
+            buckets[str(limite)] = acumulado
+        return {'total': self.total, 'soma_ms': round(self.soma_ms, 3), 'buckets': buckets}
+
+
+_histogramas: Dict[str, Histograma] = {}
+_histogramas_lock = threading.Lock()
+
+
+def registrar_duracao(nome: str, duracao_ms: float):
+    with _histogramas_lock:
+        _histogramas.setdefault(nome, Histograma()).registrar(duracao_ms)
+
+
+def histogramas() -> Dict[str, Dict]:
+    """Resumo dos histogramas acumulados pelo processo (contagens cumulativas por bucket)"""
+    with _histogramas_lock:
+        return {nome: histograma.resumo() for nome, histograma in _histogramas.items()}
+
+
+class Medicao:
+    """Etapas cronometradas de uma requisição, na ordem em que terminaram"""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.etapas: List[Tuple[str, float]] = []
+
+    def adicionar(self, nome: str, duracao_ms: float):
+        self.etapas.append((nome, duracao_ms))
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.inicio) * 1000
+
+    def server_timing(self) -> str:
+        partes = [f"{nome};dur={duracao:.1f}" for nome, duracao in self.etapas]
+        partes.append(f"total;dur={self.total_ms():.1f}")
+        return ", ".join(partes)
+
+
+def iniciar_medicao() -> Tuple[Medicao, contextvars.Token]:
+    medicao = Medicao()
+    return medicao, _medicao_atual.set(medicao)
+
+
+def encerrar_medicao(token: contextvars.Token):
+    _medicao_atual.reset(token)
+
+
+def medicao_atual() -> Optional[Medicao]:
+    return _medicao_atual.get()
+
+
+def iterar_com_medicao(iteravel: Iterable, medicao: Medicao) -> Iterator:
+    """
+    Percorre o iterável com a medição ativa: o corpo de uma resposta em streaming é gerado
+    depois que o middleware já saiu, e suas etapas ainda contam para a requisição
+    Cada item é gerado dentro de um contexto próprio, independente de quem consome o iterável
+    """
+    contexto = contextvars.copy_context()
+    contexto.run(_medicao_atual.set, medicao)
+    iterador = iter(iteravel)
+    while True:
+        try:
+            item = contexto.run(next, iterador)
+        except StopIteration:
+            return
+        yield item
+
+
+@contextmanager
+def medir(nome: str):
+    """
+    Cronometra um trecho como a etapa `nome`
+    Vai para o histograma do processo e, dentro de uma requisição, para o Server-Timing
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao_ms = (time.perf_counter() - inicio) * 1000
+        registrar_duracao(nome, duracao_ms)
+        medicao = _medicao_atual.get()
+        if medicao is not None:
+            medicao.adicionar(nome, duracao_ms)
@@ -0,0 +1,44 @@
+import hashlib
+import time
+
+from django.core.files.uploadhandler import FileUploadHandler
+
+from .timing import medicao_atual, registrar_duracao
+
+
+class HashUploadHandler(FileUploadHandler):
+    """
+    Calcula o SHA-256 de cada arquivo enquanto o upload é recebido
+    Não armazena nada: repassa os chunks para os handlers seguintes e
+    registra o hash em request.upload_sha256[<nome do campo>]
+    Também cronometra o recebimento como a etapa `upload`, do primeiro arquivo ao fim
+    do corpo: o parse acontece no primeiro acesso a request.POST/FILES (em geral no
+    CsrfViewMiddleware), antes da view
+    """
+
+    inicio_upload = None
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.hasher = hashlib.sha256()
+        if self.inicio_upload is None:
+            self.inicio_upload = time.perf_counter()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not hasattr(self.request, 'upload_sha256'):
+            self.request.upload_sha256 = {}
+        self.request.upload_sha256[self.field_name] = self.hasher.hexdigest()
+        return None
+
+    def upload_complete(self):
+        if self.inicio_upload is None:
+            return
+        duracao_ms = (time.perf_counter() - self.inicio_upload) * 1000
+        registrar_duracao('upload', duracao_ms)
+        medicao = medicao_atual()
+        if medicao is not None:
+            medicao.adicionar('upload', duracao_ms)
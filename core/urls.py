@@ -2,13 +2,26 @@ from django.urls import path
 from . import views
 from .views_validacao import (
     interface_validacao, criar_fornecedor, criar_faturado, criar_classificacao, criar_lancamento,
-    validar_fornecedor_api, validar_faturado_api, validar_classificacao_api
+    validar_fornecedor_api, validar_faturado_api, validar_classificacao_api, validar_documento_api
 )
+from .views_jobs import enviar_job, status_job, resultado_job
+from .views_metricas import metricas
+from .views_importacao import importar_cadastros_api
 from .agents import agente2
 
 urlpatterns = [
     path('', views.upload_pdf, name='upload_pdf'),
     path('extrair-dados/', views.extrair_dados, name='extrair_dados'),
+    path('extrair-xml/', views.extrair_xml, name='extrair_xml'),
+    path('extrair-lote/', views.extrair_lote, name='extrair_lote'),
+    
+    # Extração assíncrona (fila processada pelo comando processar_jobs)
+    path('jobs/', enviar_job, name='enviar_job'),
+    path('jobs/<int:job_id>/', resultado_job, name='resultado_job'),
+    path('jobs/<int:job_id>/status/', status_job, name='status_job'),
+    
+    # Métricas no formato do Prometheus
+    path('metrics', metricas, name='metricas'),
     
     # Interface de Validação Interativa
     path('validacao/', interface_validacao, name='interface_validacao'),
@@ -17,6 +30,7 @@ urlpatterns = [
     path('api/validar-fornecedor/', validar_fornecedor_api, name='validar_fornecedor_api'),
     path('api/validar-faturado/', validar_faturado_api, name='validar_faturado_api'),
     path('api/validar-classificacao/', validar_classificacao_api, name='validar_classificacao_api'),
+    path('api/validar-documento/', validar_documento_api, name='validar_documento_api'),
     
     # APIs de Criação - Novas rotas para interface
     path('api/criar-fornecedor/', criar_fornecedor, name='criar_fornecedor'),
@@ -24,6 +38,9 @@ urlpatterns = [
     path('api/criar-classificacao/', criar_classificacao, name='criar_classificacao'),
     path('api/criar-lancamento/', criar_lancamento, name='criar_lancamento'),
     
+    # Importação em lote de cadastros (CSV/JSON)
+    path('api/importar-cadastros/', importar_cadastros_api, name='importar_cadastros'),
+    
     # Redirecionamento para validação
     path('redirecionar-validacao/', views.redirecionar_validacao, name='redirecionar_validacao'),
     
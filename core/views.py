@@ -1,39 +1,48 @@
 import json
-import os
-from django.shortcuts import render, redirect
-from django.http import JsonResponse
 from django.conf import settings
+from django.shortcuts import render, redirect
+from django.http import JsonResponse, StreamingHttpResponse
 from django.urls import reverse
 from .forms import PDFUploadForm
+from .lote import processar_lote
+from .nfe_xml import eh_nfe_xml, processar_nfe_xml
 from .services import processar_pdf
+from .views_jobs import criar_job_de_upload
+from .timing import medir
+
+def processar_upload(request, campo='pdf_file'):
+    """
+    Processa o PDF enviado direto do upload, sem cópia para MEDIA_ROOT:
+    arquivos pequenos são lidos da memória e os grandes do temporário do Django.
+    O SHA-256 calculado durante o recebimento (HashUploadHandler) é usado no cache
+    """
+    sha256 = getattr(request, 'upload_sha256', {}).get(campo)
+    # XML autorizado da NF-e: os campos vêm prontos, sem leitura de PDF
+    if eh_nfe_xml(request.FILES[campo]):
+        return processar_nfe_xml(request.FILES[campo])
+    try:
+        with medir('processar_pdf'):
+            return processar_pdf(request.FILES[campo], sha256=sha256)
+    except Exception as e:
+        return {"erro": "Falha ao processar o PDF", "detalhes": str(e)}
 
 def upload_pdf(request):
     if request.method == 'POST':
+        # O recebimento do upload é cronometrado no HashUploadHandler
         form = PDFUploadForm(request.POST, request.FILES)
         if form.is_valid():
-            pdf_file = request.FILES['pdf_file']
+            # Modo assíncrono: grava o upload na fila e acompanha pela página do job
+            if getattr(settings, 'PDF_ASYNC_JOBS', False) and not eh_nfe_xml(request.FILES['pdf_file']):
+                job = criar_job_de_upload(request)
+                return redirect('resultado_job', job_id=job.id)
             
-            temp_path = os.path.join(settings.MEDIA_ROOT, 'temp', pdf_file.name)
-            os.makedirs(os.path.dirname(temp_path), exist_ok=True)
+            dados = processar_upload(request)
             
-            with open(temp_path, 'wb+') as destination:
-                for chunk in pdf_file.chunks():
-                    destination.write(chunk)
-            
-            try:
-                dados = processar_pdf(temp_path)
-            except Exception as e:
-                dados = {"erro": "Falha ao processar o PDF", "detalhes": str(e)}
-            finally:
-                try:
-                    os.remove(temp_path)
-                except Exception:
-                    pass
-            
-            return render(request, 'core/resultado_extracao.html', {
-                'dados': dados,
-                'dados_json': json.dumps(dados, indent=2, ensure_ascii=False)
-            })
+            with medir('template'):
+                return render(request, 'core/resultado_extracao.html', {
+                    'dados': dados,
+                    'dados_json': json.dumps(dados, indent=2, ensure_ascii=False)
+                })
     else:
         form = PDFUploadForm()
     
@@ -41,29 +50,32 @@ def upload_pdf(request):
 
 def extrair_dados(request):
     if request.method == 'POST' and request.FILES.get('pdf_file'):
-        pdf_file = request.FILES['pdf_file']
-        
-        temp_path = os.path.join(settings.MEDIA_ROOT, 'temp', pdf_file.name)
-        os.makedirs(os.path.dirname(temp_path), exist_ok=True)
-        
-        with open(temp_path, 'wb+') as destination:
-            for chunk in pdf_file.chunks():
-                destination.write(chunk)
-        
-        try:
-            dados = processar_pdf(temp_path)
-        except Exception as e:
-            dados = {"erro": "Falha ao processar o PDF", "detalhes": str(e)}
-        finally:
-            try:
-                os.remove(temp_path)
-            except Exception:
-                pass
-        
+        dados = processar_upload(request)
         return JsonResponse(dados)
     
     return JsonResponse({'erro': 'Arquivo não enviado'})
 
+def extrair_xml(request):
+    """
+    API de extração a partir do XML da NF-e (nfeProc), no mesmo formato de extrair_dados
+    """
+    if request.method == 'POST' and request.FILES.get('xml_file'):
+        return JsonResponse(processar_nfe_xml(request.FILES['xml_file']))
+    
+    return JsonResponse({'erro': 'Arquivo não enviado'})
+
+def extrair_lote(request):
+    """
+    Extrai vários PDFs (campo pdf_files, aceita também arquivos .zip) em uma única requisição
+    Responde em NDJSON: uma linha JSON por arquivo, enviada assim que ele termina
+    """
+    arquivos = request.FILES.getlist('pdf_files') if request.method == 'POST' else []
+    if not arquivos:
+        return JsonResponse({'erro': 'Arquivo não enviado'}, status=400)
+    
+    linhas = (json.dumps(resultado, ensure_ascii=False) + '\n' for resultado in processar_lote(arquivos))
+    return StreamingHttpResponse(linhas, content_type='application/x-ndjson')
+
 def redirecionar_validacao(request):
     """
     Redireciona para a interface de validação com os dados do PDF
@@ -78,6 +90,8 @@ def redirecionar_validacao(request):
             'nf_numero': request.POST.get('nf_numero', ''),
             'nf_valor': request.POST.get('nf_valor', ''),
             'nf_data': request.POST.get('nf_data', ''),
+            'nf_serie': request.POST.get('nf_serie', ''),
+            'nf_chave': request.POST.get('nf_chave', ''),
         }
         
         # Adicionar classificações
@@ -0,0 +1,25 @@
+import json
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from core.importacao import FORMATOS, MODELOS, detectar_formato, importar_cadastros
+
+@csrf_exempt
+def importar_cadastros_api(request):
+    """
+    API de importação em lote de pessoas ou classificações (campo arquivo, CSV ou JSON)
+    Responde em NDJSON: uma linha por rejeição e por lote gravado, e o resumo no final
+    """
+    arquivo = request.FILES.get('arquivo') if request.method == 'POST' else None
+    if not arquivo:
+        return JsonResponse({'erro': 'Arquivo não enviado'}, status=400)
+    
+    modelo = request.POST.get('modelo', '')
+    if modelo not in MODELOS:
+        return JsonResponse({'erro': f'Modelo inválido: use {", ".join(MODELOS)}'}, status=400)
+    formato = request.POST.get('formato') or detectar_formato(arquivo.name)
+    if formato not in FORMATOS:
+        return JsonResponse({'erro': f'Formato inválido: use {", ".join(FORMATOS)}'}, status=400)
+    
+    eventos = importar_cadastros(arquivo, modelo, formato, request.POST.get('tipo', ''))
+    linhas = (json.dumps(evento, ensure_ascii=False) + '\n' for evento in eventos)
+    return StreamingHttpResponse(linhas, content_type='application/x-ndjson')
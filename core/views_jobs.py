@@ -0,0 +1,56 @@
+import json
+from django.conf import settings
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from core.jobs import criar_job
+from core.models import JobExtracao
+
+def criar_job_de_upload(request, campo='pdf_file'):
+    sha256 = getattr(request, 'upload_sha256', {}).get(campo, '')
+    return criar_job(request.FILES[campo], sha256)
+
+def descrever_job(job):
+    return {
+        'id': job.id,
+        'status': job.status,
+        'etapa': job.etapa,
+        'finalizado': job.status in ('CONCLUIDO', 'ERRO'),
+        'status_url': reverse('status_job', args=[job.id]),
+        'resultado_url': reverse('resultado_job', args=[job.id]),
+    }
+
+@csrf_exempt
+def enviar_job(request):
+    """
+    API para enfileirar a extração de um PDF; responde na hora com o id do job
+    """
+    if request.method == 'POST' and request.FILES.get('pdf_file'):
+        job = criar_job_de_upload(request)
+        return JsonResponse(descrever_job(job), status=202)
+    
+    return JsonResponse({'erro': 'Arquivo não enviado'}, status=400)
+
+def status_job(request, job_id):
+    """
+    API de acompanhamento do job (consultada periodicamente pela página de espera)
+    """
+    job = get_object_or_404(JobExtracao, pk=job_id)
+    return JsonResponse(descrever_job(job))
+
+def resultado_job(request, job_id):
+    """
+    Mostra o resultado da extração quando o job termina, ou a página de espera enquanto isso
+    """
+    job = get_object_or_404(JobExtracao, pk=job_id)
+    if job.status in ('CONCLUIDO', 'ERRO'):
+        return render(request, 'core/resultado_extracao.html', {
+            'dados': job.resultado,
+            'dados_json': json.dumps(job.resultado, indent=2, ensure_ascii=False)
+        })
+    
+    return render(request, 'core/job_status.html', {
+        'job': job,
+        'intervalo_ms': int(getattr(settings, 'PDF_ASYNC_POLL_SECONDS', 2) * 1000),
+    })
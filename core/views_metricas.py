@@ -0,0 +1,8 @@
+from django.http import HttpResponse
+from core.metricas import TIPO_CONTEUDO, exportar
+
+def metricas(request):
+    """
+    Métricas no formato texto do Prometheus (agregadas entre os workers do gunicorn)
+    """
+    return HttpResponse(exportar(), content_type=TIPO_CONTEUDO)
@@ -1,9 +1,13 @@
 from django.shortcuts import render
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.db import transaction
+from django.db import IntegrityError, transaction
 import json
+from core.cache_cadastros import buscar_classificacao, buscar_classificacoes, buscar_pessoa, buscar_pessoas
+from core.duplicidade import identificar_nota, movimento_existente
+from core.indice_classificacoes import sugerir_classificacoes
 from core.models import Pessoas, Classificacao, MovimentoContas, ParcelaContas, MovimentoClassificacao
+from core.normalizacao import normalizar_descricao, normalizar_documento
 
 def validar_fornecedor_api(request):
     """
@@ -16,13 +20,10 @@ def validar_fornecedor_api(request):
                 return JsonResponse({'erro': 'CNPJ não fornecido'}, status=400)
             
             # Limpar CNPJ
-            cnpj_limpo = cnpj.replace('.', '').replace('/', '').replace('-', '')
+            cnpj_limpo = normalizar_documento(cnpj)
             
-            # Verificar se existe
-            fornecedor = Pessoas.objects.filter(
-                cnpj_cpf=cnpj_limpo, 
-                tipo='FORNECEDOR'
-            ).first()
+            # Verificar se existe (cache de cadastros)
+            fornecedor = buscar_pessoa('FORNECEDOR', cnpj_limpo)
             
             if fornecedor:
                 return JsonResponse({
@@ -53,13 +54,10 @@ def validar_faturado_api(request):
                 return JsonResponse({'erro': 'CPF não fornecido'}, status=400)
             
             # Limpar CPF
-            cpf_limpo = cpf.replace('.', '').replace('-', '')
+            cpf_limpo = normalizar_documento(cpf)
             
-            # Verificar se existe
-            faturado = Pessoas.objects.filter(
-                cnpj_cpf=cpf_limpo, 
-                tipo='FATURADO'
-            ).first()
+            # Verificar se existe (cache de cadastros)
+            faturado = buscar_pessoa('FATURADO', cpf_limpo)
             
             if faturado:
                 return JsonResponse({
@@ -89,11 +87,8 @@ def validar_classificacao_api(request):
             if not descricao:
                 return JsonResponse({'erro': 'Descrição não fornecida'}, status=400)
             
-            # Verificar se existe
-            classificacao = Classificacao.objects.filter(
-                descricao__iexact=descricao,
-                tipo='DESPESA'
-            ).first()
+            # Verificar se existe (cache de cadastros)
+            classificacao = buscar_classificacao('DESPESA', descricao)
             
             if classificacao:
                 return JsonResponse({
@@ -103,16 +98,99 @@ def validar_classificacao_api(request):
                     'mensagem': f'Classificação encontrada: {classificacao.descricao}'
                 })
             else:
-                return JsonResponse({
-                    'existe': False,
-                    'mensagem': f'Classificação "{descricao}" não encontrada'
-                })
+                # Sem correspondência exata: oferece as classificações parecidas
+                return JsonResponse(classificacao_nao_encontrada(descricao))
                 
         except Exception as e:
             return JsonResponse({'erro': str(e)}, status=500)
     
     return JsonResponse({'erro': 'Método não permitido'}, status=405)
 
+def classificacao_nao_encontrada(descricao, tipo='DESPESA'):
+    sugestoes = sugerir_classificacoes(tipo, descricao) if descricao else []
+    mensagem = f'Classificação "{descricao}" não encontrada'
+    if sugestoes:
+        mensagem += '. Você quis dizer: ' + ', '.join(f'"{s["descricao"]}"' for s in sugestoes) + '?'
+    return {'existe': False, 'mensagem': mensagem, 'sugestoes': sugestoes}
+
+def resolver_cadastros(cnpj_fornecedor, cpf_faturado, classificacoes):
+    """
+    Resolve fornecedor, faturado e classificações de despesa de um documento
+    pelo cache de cadastros; o que não está em cache é lido com uma consulta por
+    tabela (IN nos índices de Pessoas(tipo, cnpj_cpf) e de
+    Classificacao(tipo, descricao_normalizada))
+    """
+    cnpj_fornecedor = normalizar_documento(cnpj_fornecedor)
+    cpf_faturado = normalizar_documento(cpf_faturado)
+    
+    chaves = [chave for chave in (('FORNECEDOR', cnpj_fornecedor), ('FATURADO', cpf_faturado)) if chave[1]]
+    pessoas = buscar_pessoas(chaves) if chaves else {}
+    
+    descricoes = [str(d or '').strip() for d in classificacoes]
+    encontradas = buscar_classificacoes(('DESPESA', descricao) for descricao in descricoes if descricao)
+    
+    return {
+        'fornecedor': pessoas.get(('FORNECEDOR', cnpj_fornecedor)) if cnpj_fornecedor else None,
+        'faturado': pessoas.get(('FATURADO', cpf_faturado)) if cpf_faturado else None,
+        'classificacoes': [(descricao, encontradas.get(('DESPESA', normalizar_descricao(descricao)))) for descricao in descricoes],
+    }
+
+@csrf_exempt
+def validar_documento_api(request):
+    """
+    API para validar em uma única requisição todos os cadastros do documento extraído
+    (fornecedor, faturado e classificações), no mesmo formato das APIs individuais
+    """
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            classificacoes = data.get('classificacao_despesa') or data.get('classificacoes') or []
+            cadastros = resolver_cadastros(
+                (data.get('fornecedor') or {}).get('cnpj') or '',
+                (data.get('faturado') or {}).get('cpf') or '',
+                classificacoes,
+            )
+            
+            fornecedor = cadastros['fornecedor']
+            faturado = cadastros['faturado']
+            return JsonResponse({
+                'fornecedor': {
+                    'existe': True,
+                    'id': fornecedor.id,
+                    'nome': fornecedor.razao_social,
+                    'mensagem': f'Fornecedor encontrado: {fornecedor.razao_social}'
+                } if fornecedor else {
+                    'existe': False,
+                    'mensagem': 'Fornecedor não encontrado no banco de dados'
+                },
+                'faturado': {
+                    'existe': True,
+                    'id': faturado.id,
+                    'nome': faturado.razao_social,
+                    'mensagem': f'Faturado encontrado: {faturado.razao_social}'
+                } if faturado else {
+                    'existe': False,
+                    'mensagem': 'Faturado não encontrado no banco de dados'
+                },
+                'classificacoes': [
+                    {
+                        'existe': True,
+                        'id': classificacao.id,
+                        'descricao': classificacao.descricao,
+                        'mensagem': f'Classificação encontrada: {classificacao.descricao}'
+                    } if classificacao else {
+                        'descricao': descricao,
+                        **classificacao_nao_encontrada(descricao)
+                    }
+                    for descricao, classificacao in cadastros['classificacoes']
+                ],
+            })
+            
+        except Exception as e:
+            return JsonResponse({'erro': str(e)}, status=500)
+    
+    return JsonResponse({'erro': 'Método não permitido'}, status=405)
+
 def interface_validacao(request):
     """
     Renderiza a interface de validação interativa com dados do PDF
@@ -133,6 +211,8 @@ def interface_validacao(request):
             'numero': request.GET.get('nf_numero', ''),
             'valor': request.GET.get('nf_valor', ''),
             'data_emissao': request.GET.get('nf_data', ''),
+            'serie': request.GET.get('nf_serie', ''),
+            'chave_acesso': request.GET.get('nf_chave', ''),
         },
         'classificacoes': request.GET.getlist('classificacoes[]') if request.GET.getlist('classificacoes[]') else [],
         'produtos': request.GET.getlist('produtos[]') if request.GET.getlist('produtos[]') else [],
@@ -168,7 +248,7 @@ def criar_fornecedor(request):
             nome_fantasia = data.get('nome_fantasia', '').strip()
             
             # Limpar CNPJ (remover máscaras)
-            cnpj_limpo = cnpj.replace('.', '').replace('/', '').replace('-', '')
+            cnpj_limpo = normalizar_documento(cnpj)
             
             # Verificar se já existe
             if Pessoas.objects.filter(cnpj_cpf=cnpj_limpo, tipo='FORNECEDOR').exists():
@@ -218,7 +298,7 @@ def criar_faturado(request):
             nome = data.get('nome', '').strip() or data.get('nome_completo', '').strip()
             
             # Limpar CPF (remover máscaras)
-            cpf_limpo = cpf.replace('.', '').replace('-', '')
+            cpf_limpo = normalizar_documento(cpf)
             
             # Verificar se já existe
             if Pessoas.objects.filter(cnpj_cpf=cpf_limpo, tipo='FATURADO').exists():
@@ -267,7 +347,7 @@ def criar_classificacao(request):
             tipo = data.get('tipo', 'DESPESA').upper()
             
             # Verificar se já existe
-            if Classificacao.objects.filter(descricao__iexact=descricao, tipo=tipo).exists():
+            if Classificacao.objects.filter(descricao_normalizada=normalizar_descricao(descricao), tipo=tipo).exists():
                 return JsonResponse({
                     'sucesso': False,
                     'erro': f'Classificação "{descricao}" já existe'
@@ -298,6 +378,14 @@ def criar_classificacao(request):
         'erro': 'Método não permitido'
     })
 
+def resposta_nota_duplicada(movimento_id):
+    return JsonResponse({
+        'sucesso': False,
+        'duplicada': True,
+        'id': movimento_id,
+        'erro': f'Nota fiscal já lançada no movimento ID: {movimento_id}'
+    })
+
 @csrf_exempt
 def criar_lancamento(request):
     """
@@ -307,14 +395,25 @@ def criar_lancamento(request):
         try:
             data = json.loads(request.body)
             # Obter IDs dos cadastros
-            cnpj_fornecedor = data['fornecedor']['cnpj'].replace('.', '').replace('/', '').replace('-', '')
-            cpf_faturado = data['faturado']['cpf'].replace('.', '').replace('-', '')
+            cnpj_fornecedor = normalizar_documento(data['fornecedor']['cnpj'])
+            cpf_faturado = normalizar_documento(data['faturado']['cpf'])
 
-            # Buscar fornecedor
-            fornecedor = Pessoas.objects.filter(
-                cnpj_cpf=cnpj_fornecedor,
-                tipo='FORNECEDOR'
-            ).first()
+            # Nota já lançada: devolve o movimento existente antes de qualquer outra consulta
+            nf = data.get('nota_fiscal', {})
+            identificacao_nf = identificar_nota(
+                nf.get('chave_acesso') or data.get('chave_acesso') or '',
+                cnpj_fornecedor,
+                str(nf.get('serie') or data.get('serie') or ''),
+                str(nf.get('numero') or data.get('numero_nota_fiscal') or ''),
+            )
+            movimento_id = movimento_existente(identificacao_nf)
+            if movimento_id:
+                return resposta_nota_duplicada(movimento_id)
+
+            # Fornecedor, faturado e classificações: uma consulta por tabela (ou nenhuma, com o cache)
+            cadastros = resolver_cadastros(cnpj_fornecedor, cpf_faturado, data.get('classificacao_despesa') or [])
+            fornecedor = cadastros['fornecedor']
+            faturado = cadastros['faturado']
 
             if not fornecedor:
                 return JsonResponse({
@@ -322,12 +421,6 @@ def criar_lancamento(request):
                     'erro': 'Fornecedor não encontrado. Por favor, valide os cadastros novamente.'
                 })
 
-            # Buscar faturado
-            faturado = Pessoas.objects.filter(
-                cnpj_cpf=cpf_faturado,
-                tipo='FATURADO'
-            ).first()
-
             if not faturado:
                 return JsonResponse({
                     'sucesso': False,
@@ -338,7 +431,6 @@ def criar_lancamento(request):
             with transaction.atomic():
                 # Criar movimento de contas (removendo argumentos inválidos)
                 # Extrair dados da nota fiscal
-                nf = data.get('nota_fiscal', {})
                 nf_numero = (nf.get('numero') or data.get('numero_nota_fiscal') or '').strip()
                 nf_valor_raw = nf.get('valor') or data.get('valor_total') or 0
                 nf_data_raw = nf.get('data_emissao') or data.get('data_emissao') or ''
@@ -376,6 +468,8 @@ def criar_lancamento(request):
                     valor_total=valor_total,
                     descricao=f"NF {nf_numero} - {fornecedor.razao_social} - Faturado: {faturado.razao_social}",
                     quantidade_parcelas=quantidade_parcelas,
+                    descricao_produtos="\n".join(data.get('produtos') or data.get('descricao_produtos') or []),
+                    identificacao_nf=identificacao_nf,
                     ativo=True
                 )
 
@@ -408,22 +502,18 @@ def criar_lancamento(request):
                         identificacao_unica=identificacao
                     )
 
-                # Criar classificações corretamente
-                classificacoes_despesa = data.get('classificacao_despesa', [])
+                # Criar classificações com um único INSERT (já resolvidas em resolver_cadastros)
+                classificacoes_despesa = cadastros['classificacoes']
                 total = valor_total
                 valor_por_classificacao = total / len(classificacoes_despesa) if classificacoes_despesa else total
-                for classificacao_desc in classificacoes_despesa:
-                    classificacao = Classificacao.objects.filter(
-                        descricao__iexact=classificacao_desc,
-                        tipo='DESPESA'
-                    ).first()
-
-                    if classificacao:
-                        MovimentoClassificacao.objects.create(
-                            movimento=movimento,
-                            classificacao=classificacao,
-                            valor_classificado=valor_por_classificacao
-                        )
+                MovimentoClassificacao.objects.bulk_create([
+                    MovimentoClassificacao(
+                        movimento=movimento,
+                        classificacao=classificacao,
+                        valor_classificado=valor_por_classificacao
+                    )
+                    for _, classificacao in classificacoes_despesa if classificacao
+                ])
 
                 return JsonResponse({
                     'sucesso': True,
@@ -431,6 +521,12 @@ def criar_lancamento(request):
                     'mensagem': f'Lançamento criado com sucesso! ID: {movimento.id}'
                 })
 
+        except IntegrityError as e:
+            # Outra requisição lançou a mesma nota ao mesmo tempo
+            movimento_id = movimento_existente(identificacao_nf)
+            if movimento_id:
+                return resposta_nota_duplicada(movimento_id)
+            return JsonResponse({'sucesso': False, 'erro': str(e)})
         except Exception as e:
             return JsonResponse({
                 'sucesso': False,
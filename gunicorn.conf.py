@@ -0,0 +1,16 @@
+import os
+import shutil
+
+# Diretório compartilhado pelas métricas dos workers (lido por prometheus_client)
+diretorio_metricas = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/sistema_pdf_metricas')
+
+
+def on_starting(server):
+    # Arquivos de uma execução anterior inflariam os contadores
+    shutil.rmtree(diretorio_metricas, ignore_errors=True)
+    os.makedirs(diretorio_metricas, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -21,6 +21,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -29,6 +30,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.ServerTimingMiddleware',
 ]
 
 ROOT_URLCONF = 'sistema_pdf.urls'
@@ -75,4 +77,107 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 GEMINI_API_KEY = config('GEMINI_API_KEY', default=None)
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+# Backend de extração: Gemini em produção ou 'core.agents.agente_falso.AgenteFalso' para testes offline
+LLM_BACKEND = config('LLM_BACKEND', default='core.agents.agent_1.AgenteGemini')
+
+# Modelo do Gemini e cache de contexto do prefixo fixo do prompt
+GEMINI_MODEL = config('GEMINI_MODEL', default='gemini-2.0-flash')
+GEMINI_CONTEXT_CACHE = config('GEMINI_CONTEXT_CACHE', default=False, cast=bool)
+GEMINI_CONTEXT_CACHE_TTL = config('GEMINI_CONTEXT_CACHE_TTL', default=3600, cast=int)
+
+# Consultas ao LLM (ClienteLLM): prazo, concorrência por processo, novas tentativas e disjuntor
+GEMINI_TIMEOUT = config('GEMINI_TIMEOUT', default=30.0, cast=float)
+GEMINI_MAX_CONCURRENCY = config('GEMINI_MAX_CONCURRENCY', default=4, cast=int)
+GEMINI_RETRIES = config('GEMINI_RETRIES', default=3, cast=int)
+GEMINI_BACKOFF_BASE = config('GEMINI_BACKOFF_BASE', default=0.5, cast=float)
+GEMINI_BACKOFF_MAX = config('GEMINI_BACKOFF_MAX', default=8.0, cast=float)
+GEMINI_CIRCUIT_FAILURES = config('GEMINI_CIRCUIT_FAILURES', default=5, cast=int)
+GEMINI_CIRCUIT_RESET = config('GEMINI_CIRCUIT_RESET', default=30.0, cast=float)
+# Orçamento de caracteres do texto da nota no prompt, após a compactação
+GEMINI_PROMPT_MAX_CHARS = config('GEMINI_PROMPT_MAX_CHARS', default=12000, cast=int)
+
+# Backend falso (AgenteFalso): latência simulada, taxa de falhas e resposta fixa
+LLM_FAKE_LATENCY_MS = config('LLM_FAKE_LATENCY_MS', default=800, cast=float)
+LLM_FAKE_JITTER_MS = config('LLM_FAKE_JITTER_MS', default=200, cast=float)
+LLM_FAKE_ERROR_RATE = config('LLM_FAKE_ERROR_RATE', default=0.0, cast=float)
+LLM_FAKE_RESPONSE_FILE = config('LLM_FAKE_RESPONSE_FILE', default='')
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Logs da aplicação (inclui a linha de tempos por requisição do logger core.timing)
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core': {'handlers': ['console'], 'level': config('LOG_LEVEL', default='INFO')},
+    },
+}
+
+# Extração de texto em paralelo (páginas divididas entre processos). Na leitura completa vale a
+# partir de PDF_PARALLEL_MIN_PAGES páginas; com PDF_EARLY_EXIT, só quando PDF_EARLY_EXIT_MAX_PAGES
+# >= PDF_PARALLEL_MIN_PAGES (blocos de uma página por processo). Com os padrões (3 < 8) a leitura
+# antecipada é sequencial e o pool não é usado
+PDF_PARALLEL_WORKERS = config('PDF_PARALLEL_WORKERS', default=2, cast=int)
+PDF_PARALLEL_MIN_PAGES = config('PDF_PARALLEL_MIN_PAGES', default=8, cast=int)
+
+# Leitura antecipada: para ao encontrar cabeçalho e totais da DANFE (ou no limite de páginas)
+PDF_EARLY_EXIT = config('PDF_EARLY_EXIT', default=True, cast=bool)
+PDF_EARLY_EXIT_MAX_PAGES = config('PDF_EARLY_EXIT_MAX_PAGES', default=3, cast=int)
+
+# Limites por documento (0 desativa) e leitura com pouca memória para PDFs muito grandes
+PDF_MAX_PAGES = config('PDF_MAX_PAGES', default=500, cast=int)
+PDF_MAX_BYTES = config('PDF_MAX_BYTES', default=50 * 1024 * 1024, cast=int)
+PDF_MAX_RSS_MB = config('PDF_MAX_RSS_MB', default=1024, cast=int)
+PDF_LOW_MEMORY = config('PDF_LOW_MEMORY', default=False, cast=bool)
+PDF_LOW_MEMORY_MAX_CHARS = config('PDF_LOW_MEMORY_MAX_CHARS', default=200000, cast=int)
+
+# Uploads: o primeiro handler calcula o SHA-256 do PDF enquanto ele é recebido
+FILE_UPLOAD_HANDLERS = [
+    'core.uploadhandlers.HashUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Cache de resultados de extração (validade em segundos e número máximo de entradas)
+PDF_CACHE_TTL = config('PDF_CACHE_TTL', default=7 * 24 * 3600, cast=int)
+PDF_CACHE_MAX_ENTRIES = config('PDF_CACHE_MAX_ENTRIES', default=1000, cast=int)
+
+# Extração assíncrona: o upload vira um job processado por `manage.py processar_jobs`
+PDF_ASYNC_JOBS = config('PDF_ASYNC_JOBS', default=False, cast=bool)
+PDF_ASYNC_POLL_SECONDS = config('PDF_ASYNC_POLL_SECONDS', default=2, cast=float)
+# Um job em PROCESSANDO há mais que JOB_LEASE_SECONDS (worker morto) volta a ser reservável; após
+# JOB_MAX_ATTEMPTS reservas sem conclusão ele vira ERRO
+JOB_LEASE_SECONDS = config('JOB_LEASE_SECONDS', default=600, cast=int)
+JOB_MAX_ATTEMPTS = config('JOB_MAX_ATTEMPTS', default=3, cast=int)
+
+# Extração em lote: threads por requisição e limites separados para leitura de PDF e consultas ao LLM
+PDF_BATCH_WORKERS = config('PDF_BATCH_WORKERS', default=4, cast=int)
+PDF_BATCH_PARSE_CONCURRENCY = config('PDF_BATCH_PARSE_CONCURRENCY', default=2, cast=int)
+PDF_BATCH_LLM_CONCURRENCY = config('PDF_BATCH_LLM_CONCURRENCY', default=4, cast=int)
+# Entradas de ZIP acima de PDF_MAX_BYTES descompactadas ou com taxa de compressão maior que esta são recusadas
+PDF_BATCH_ZIP_MAX_RATIO = config('PDF_BATCH_ZIP_MAX_RATIO', default=100, cast=int)
+
+# XML da NF-e: o LLM só é consultado para a classificação da despesa
+NFE_XML_LLM_CLASSIFICATION = config('NFE_XML_LLM_CLASSIFICATION', default=True, cast=bool)
+
+# Classificador local de despesas (treinado com `python manage.py treinar_classificador`)
+CLASSIFICADOR_MODELO_PATH = config('CLASSIFICADOR_MODELO_PATH', default=os.path.join(BASE_DIR, 'modelos', 'classificador_despesa.npz'))
+CLASSIFICADOR_CONFIANCA_MIN = config('CLASSIFICADOR_CONFIANCA_MIN', default=0.35, cast=float)
+CLASSIFICADOR_MIN_DOCUMENTOS = config('CLASSIFICADOR_MIN_DOCUMENTOS', default=20, cast=int)
+
+# Cache em memória das consultas de Pessoas e Classificacao (por worker, invalidado pelos sinais de gravação)
+CADASTROS_CACHE_ENABLED = config('CADASTROS_CACHE_ENABLED', default=True, cast=bool)
+CADASTROS_CACHE_MAX_ITENS = config('CADASTROS_CACHE_MAX_ITENS', default=5000, cast=int)
+CADASTROS_CACHE_TTL = config('CADASTROS_CACHE_TTL', default=300, cast=float)
+# Diretório do carimbo de versão compartilhado entre os workers (default: temporário do sistema)
+CADASTROS_CACHE_DIR = config('CADASTROS_CACHE_DIR', default='')
+
+# Sugestões de classificações parecidas (índice de trigramas) quando a descrição não existe
+CLASSIFICACAO_SUGESTOES_MAX = config('CLASSIFICACAO_SUGESTOES_MAX', default=3, cast=int)
+CLASSIFICACAO_SIMILARIDADE_MIN = config('CLASSIFICACAO_SIMILARIDADE_MIN', default=0.5, cast=float)
+
+# Importação em lote de cadastros: linhas gravadas por transação
+IMPORTACAO_LOTE = config('IMPORTACAO_LOTE', default=1000, cast=int)